@@ -1,37 +1,66 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash, session
+from flask import Flask, Response, render_template, request, jsonify, send_file, redirect, url_for, flash, session, g
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from openai import AzureOpenAI
 import os
 from pathlib import Path
 import uuid
-import time
-import requests
-import subprocess
+import httpx
 import re
 import html
 import json
 import logging
+import threading
+import time
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
 from functools import wraps
-from typing import Optional, Dict, List, Any, Union
+from typing import TYPE_CHECKING, Optional, Dict, Iterator, List, Any, Tuple, Union
 from auth import get_user, get_user_by_username, create_user, create_azure_ad_user, User
-import msal
+from password_hashing import HashingBusy
+from synthesis_cache import SynthesisCache, normalize_text, synthesis_key
+from audio_janitor import AudioIndex, AudioJanitor
+from singleflight import SingleFlight, SingleFlightTimeout
+from text_chunker import sentence_segments, split_text
+from mp3 import join_segments
+from dialogue import Call, Line, plan_calls, stitch
+from jobs import JobStore, JobRunner
+from history import HistoryStore, decode_cursor
+from warmup import elected, read_catalog, warm
+from audio_formats import OUTPUT_FORMATS, SOURCE_PREFERENCE, EXTENSION_PATTERN, format_for_extension, provider_format
+from transcoder import Transcoder, TranscodeError, TranscoderBusy
+from http_client import PooledHttpClient, ProcessLocal
+from ttl_cache import TTLCache
+from quota import Bucket, CharacterQuota
+from voice_catalog import VoiceCatalog, azure_voices
+import metrics
+from provider_router import Backend, ProviderError, ProviderRouter, is_retryable_status, retry_after_from_headers
 from urllib.parse import urlparse, urljoin # Added for security check
 
+if TYPE_CHECKING:
+    # Imported on first use: the openai SDK alone takes most of this module's import time
+    import msal
+    import openai
+
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Read by Flask-Limiter when it is initialized below
+app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
 
 # Initialize Limiter
 limiter = Limiter(
     get_remote_address,
     app=app,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
+    # Per-worker request counts by default; character budgets below are shared across workers
+    storage_uri=os.getenv('RATELIMIT_STORAGE_URI', 'memory://'),
+    on_breach=lambda limit: metrics.RATE_LIMIT_REJECTIONS.labels('requests').inc(),
 )
 
 # --- Configuration Loading ---
@@ -46,6 +75,8 @@ app.config['AZURE_AD_CLIENT_ID'] = os.getenv('AZURE_AD_CLIENT_ID')
 app.config['AZURE_AD_CLIENT_SECRET'] = os.getenv('AZURE_AD_CLIENT_SECRET')
 app.config['AZURE_AD_TENANT_ID'] = os.getenv('AZURE_AD_TENANT_ID')
 app.config['AZURE_AD_REDIRECT_PATH'] = '/login/azure/callback'
+app.config['AZURE_AD_TIMEOUT_SECONDS'] = float(os.getenv('AZURE_AD_TIMEOUT_SECONDS', 10))
+app.config['GRAPH_PROFILE_CACHE_SECONDS'] = float(os.getenv('GRAPH_PROFILE_CACHE_SECONDS', 300))
 
 # Model and limits configuration
 app.config['AZURE_OPENAI_MODEL'] = os.getenv('AZURE_OPENAI_MODEL', 'tts-hd')
@@ -53,6 +84,61 @@ app.config['AZURE_OPENAI_TIMEOUT'] = int(os.getenv('AZURE_OPENAI_TIMEOUT', 30))
 app.config['MAX_TEXT_LENGTH'] = int(os.getenv('MAX_TEXT_LENGTH', 10000))
 app.config['MAX_FILE_AGE_SECONDS'] = int(os.getenv('MAX_FILE_AGE_SECONDS', 3600))
 app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+app.config['SYNTHESIS_CACHE_ENABLED'] = os.getenv('SYNTHESIS_CACHE_ENABLED', 'true').lower() == 'true'
+app.config['AUDIO_MAX_BYTES'] = int(os.getenv('AUDIO_MAX_BYTES', 1024 * 1024 * 1024))
+app.config['AUDIO_JANITOR_INTERVAL_SECONDS'] = float(os.getenv('AUDIO_JANITOR_INTERVAL_SECONDS', 60))
+app.config['SINGLE_FLIGHT_TIMEOUT_SECONDS'] = float(os.getenv('SINGLE_FLIGHT_TIMEOUT_SECONDS', 90))
+app.config['LONG_TEXT_CHUNK_CHARS'] = int(os.getenv('LONG_TEXT_CHUNK_CHARS', 1000))
+# Synthesize sentence by sentence, reusing cached sentences, unless a request sets "incremental"
+app.config['INCREMENTAL_SYNTHESIS'] = os.getenv('INCREMENTAL_SYNTHESIS', 'false').lower() == 'true'
+app.config['OPENAI_MAX_PARALLEL_REQUESTS'] = int(os.getenv('OPENAI_MAX_PARALLEL_REQUESTS', 4))
+app.config['SPEECH_MAX_PARALLEL_REQUESTS'] = int(os.getenv('SPEECH_MAX_PARALLEL_REQUESTS', 4))
+app.config['HTTP_POOL_MAX_CONNECTIONS'] = int(os.getenv('HTTP_POOL_MAX_CONNECTIONS', 20))
+app.config['HTTP_POOL_MAX_KEEPALIVE'] = int(os.getenv('HTTP_POOL_MAX_KEEPALIVE', 10))
+app.config['HTTP_KEEPALIVE_EXPIRY_SECONDS'] = float(os.getenv('HTTP_KEEPALIVE_EXPIRY_SECONDS', 30))
+app.config['HTTP_CONNECT_TIMEOUT'] = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+app.config['HTTP_READ_TIMEOUT'] = float(os.getenv('HTTP_READ_TIMEOUT', 30))
+app.config['HTTP2_ENABLED'] = os.getenv('HTTP2_ENABLED', 'false').lower() == 'true'
+app.config['DIALOGUE_MAX_SEGMENTS'] = int(os.getenv('DIALOGUE_MAX_SEGMENTS', 100))
+app.config['DIALOGUE_MAX_PAUSE_SECONDS'] = float(os.getenv('DIALOGUE_MAX_PAUSE_SECONDS', 10))
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))
+app.config['JOB_MAX_ITEMS'] = int(os.getenv('JOB_MAX_ITEMS', 500))
+app.config['JOB_RETENTION_SECONDS'] = int(os.getenv('JOB_RETENTION_SECONDS', 86400))
+app.config['HISTORY_ENABLED'] = os.getenv('HISTORY_ENABLED', 'true').lower() == 'true'
+app.config['HISTORY_FLUSH_SECONDS'] = float(os.getenv('HISTORY_FLUSH_SECONDS', 1.0))
+app.config['HISTORY_PAGE_SIZE'] = int(os.getenv('HISTORY_PAGE_SIZE', 20))
+# Phrases marked startup=true in this catalog are pre-rendered and pinned after each deployment starts
+app.config['WARMUP_CATALOG'] = os.getenv('WARMUP_CATALOG', '')
+app.config['WARMUP_CONCURRENCY'] = int(os.getenv('WARMUP_CONCURRENCY', 2))
+app.config['ASYNC_MAX_PROVIDER_REQUESTS'] = int(os.getenv('ASYNC_MAX_PROVIDER_REQUESTS', 100))
+app.config['ASGI_WSGI_THREADS'] = int(os.getenv('ASGI_WSGI_THREADS', 16))
+app.config['VOICE_CATALOG_REFRESH_SECONDS'] = float(os.getenv('VOICE_CATALOG_REFRESH_SECONDS', 21600))
+app.config['VOICE_CATALOG_RETRY_SECONDS'] = float(os.getenv('VOICE_CATALOG_RETRY_SECONDS', 300))
+app.config['VOICE_CATALOG_CACHE_SECONDS'] = int(os.getenv('VOICE_CATALOG_CACHE_SECONDS', 3600))
+app.config['SPEECH_VOICE_LOCALES'] = [locale.strip() for locale in os.getenv('SPEECH_VOICE_LOCALES', '').split(',') if locale.strip()]
+app.config['QUOTA_ENABLED'] = os.getenv('QUOTA_ENABLED', 'true').lower() == 'true'
+app.config['USER_QUOTA_CHARACTERS'] = int(os.getenv('USER_QUOTA_CHARACTERS', 20000))
+app.config['USER_QUOTA_CHARACTERS_PER_HOUR'] = int(os.getenv('USER_QUOTA_CHARACTERS_PER_HOUR', 50000))
+app.config['IP_QUOTA_CHARACTERS'] = int(os.getenv('IP_QUOTA_CHARACTERS', 50000))
+app.config['IP_QUOTA_CHARACTERS_PER_HOUR'] = int(os.getenv('IP_QUOTA_CHARACTERS_PER_HOUR', 200000))
+# 'local' derives other speeds from the 1.0x rendering by time-stretching; 'provider' synthesizes each speed
+app.config['SPEED_VARIANT_MODE'] = os.getenv('SPEED_VARIANT_MODE', 'local').lower()
+app.config['TRANSCODE_MAX_CONCURRENT'] = int(os.getenv('TRANSCODE_MAX_CONCURRENT', 2))
+app.config['TRANSCODE_QUEUE_TIMEOUT_SECONDS'] = float(os.getenv('TRANSCODE_QUEUE_TIMEOUT_SECONDS', 30))
+app.config['AUDIO_CACHE_MAX_AGE_SECONDS'] = int(os.getenv('AUDIO_CACHE_MAX_AGE_SECONDS', 31536000))
+app.config['AUDIO_ACCEL_REDIRECT_ENABLED'] = os.getenv('AUDIO_ACCEL_REDIRECT_ENABLED', 'false').lower() == 'true'
+app.config['AUDIO_ACCEL_REDIRECT_PREFIX'] = os.getenv('AUDIO_ACCEL_REDIRECT_PREFIX', '/_protected_audio/')
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+app.config['PROVIDER_WINDOW_SECONDS'] = float(os.getenv('PROVIDER_WINDOW_SECONDS', 300))
+app.config['PROVIDER_FAILURE_RATE'] = float(os.getenv('PROVIDER_FAILURE_RATE', 0.5))
+app.config['PROVIDER_MIN_CALLS'] = int(os.getenv('PROVIDER_MIN_CALLS', 10))
+app.config['PROVIDER_MAX_CONSECUTIVE_FAILURES'] = int(os.getenv('PROVIDER_MAX_CONSECUTIVE_FAILURES', 5))
+app.config['PROVIDER_CIRCUIT_OPEN_SECONDS'] = float(os.getenv('PROVIDER_CIRCUIT_OPEN_SECONDS', 30))
+app.config['PROVIDER_MAX_ATTEMPTS'] = int(os.getenv('PROVIDER_MAX_ATTEMPTS', 3))
+app.config['PROVIDER_BACKOFF_BASE_SECONDS'] = float(os.getenv('PROVIDER_BACKOFF_BASE_SECONDS', 0.5))
+app.config['PROVIDER_BACKOFF_MAX_SECONDS'] = float(os.getenv('PROVIDER_BACKOFF_MAX_SECONDS', 8))
+app.config['PROVIDER_HEDGE_MAX_CHARS'] = int(os.getenv('PROVIDER_HEDGE_MAX_CHARS', 300))
+app.config['PROVIDER_HEDGE_MIN_SAMPLES'] = int(os.getenv('PROVIDER_HEDGE_MIN_SAMPLES', 20))
 app.config['JSON_SORT_KEYS'] = False
 
 # --- Default Voice Lists ---
@@ -109,17 +195,55 @@ def conditional_login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def get_msal_app() -> Optional[msal.ConfidentialClientApplication]:
-    """Create MSAL confidential client application"""
+# One MSAL client per worker; authority discovery and OpenID metadata responses
+# are kept in msal_http_cache so only the first SSO login pays for them
+msal_http_cache: Dict[str, Any] = {}
+_msal_client: Optional['msal.ConfidentialClientApplication'] = None
+_msal_pid: Optional[int] = None
+_msal_lock = threading.Lock()
+# Graph /me results keyed by Azure AD object ID
+graph_profile_cache = TTLCache(app.config['GRAPH_PROFILE_CACHE_SECONDS'], max_entries=1024)
+
+def get_msal_app() -> Optional['msal.ConfidentialClientApplication']:
+    """Return this worker's MSAL confidential client application"""
+    global _msal_client, _msal_pid
     if not app.config['AZURE_AD_CLIENT_ID']:
         return None
 
-    authority = f"https://login.microsoftonline.com/{app.config['AZURE_AD_TENANT_ID']}"
-    return msal.ConfidentialClientApplication(
-        app.config['AZURE_AD_CLIENT_ID'],
-        authority=authority,
-        client_credential=app.config['AZURE_AD_CLIENT_SECRET']
+    if _msal_client is not None and _msal_pid == os.getpid():
+        return _msal_client
+    with _msal_lock:
+        if _msal_client is None or _msal_pid != os.getpid():
+            import msal
+            authority = f"https://login.microsoftonline.com/{app.config['AZURE_AD_TENANT_ID']}"
+            _msal_client = msal.ConfidentialClientApplication(
+                app.config['AZURE_AD_CLIENT_ID'],
+                authority=authority,
+                client_credential=app.config['AZURE_AD_CLIENT_SECRET'],
+                token_cache=msal.TokenCache(),
+                http_cache=msal_http_cache,
+                timeout=app.config['AZURE_AD_TIMEOUT_SECONDS'],
+            )
+            _msal_pid = os.getpid()
+        return _msal_client
+
+def get_graph_profile(access_token: str, object_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Fetch the signed-in user's Graph profile, reusing a recent result for the same object ID"""
+    if object_id:
+        profile = graph_profile_cache.get(object_id)
+        if profile:
+            return profile
+    graph_response = http_pool.get().get(
+        'https://graph.microsoft.com/v1.0/me',
+        headers={'Authorization': f'Bearer {access_token}'},
+        timeout=app.config['AZURE_AD_TIMEOUT_SECONDS'],
     )
+    if graph_response.status_code != 200:
+        return None
+    profile = graph_response.json()
+    if object_id:
+        graph_profile_cache.put(object_id, profile)
+    return profile
 
 # Security helper function
 def is_safe_url(target):
@@ -140,19 +264,37 @@ def add_security_headers(response):
     response.headers['Permissions-Policy'] = 'geolocation=(), microphone=(), camera=()'
     return response
 
+# Keep-alive connection pool shared by Azure Speech and Microsoft Graph calls in this worker
+http_pool = PooledHttpClient(
+    max_connections=app.config['HTTP_POOL_MAX_CONNECTIONS'],
+    max_keepalive=app.config['HTTP_POOL_MAX_KEEPALIVE'],
+    keepalive_expiry=app.config['HTTP_KEEPALIVE_EXPIRY_SECONDS'],
+    connect_timeout=app.config['HTTP_CONNECT_TIMEOUT'],
+    read_timeout=app.config['HTTP_READ_TIMEOUT'],
+    http2=app.config['HTTP2_ENABLED'],
+)
+
 # Configure Azure OpenAI (optional for demo)
 AZURE_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
 AZURE_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
 
-client: Optional[AzureOpenAI] = None
-if AZURE_API_KEY and AZURE_ENDPOINT:
-    client = AzureOpenAI(
-        api_key=AZURE_API_KEY,
+def build_openai_client(api_key: str, endpoint: str) -> 'openai.AzureOpenAI':
+    from openai import AzureOpenAI
+    return AzureOpenAI(
+        api_key=api_key,
         api_version=AZURE_API_VERSION,
-        azure_endpoint=AZURE_ENDPOINT,
+        azure_endpoint=endpoint,
         timeout=app.config['AZURE_OPENAI_TIMEOUT'],
+        http_client=http_pool.new_client(),
+        # Retries are made by provider_router, which can move them to another deployment
+        max_retries=0,
     )
+
+# Built by the first OpenAI synthesis in each worker
+openai_client: Optional[ProcessLocal] = None
+if AZURE_API_KEY and AZURE_ENDPOINT:
+    openai_client = ProcessLocal(lambda: build_openai_client(AZURE_API_KEY, AZURE_ENDPOINT))
     logger.info("✅ Azure OpenAI client configured successfully")
 else:
     logger.warning("⚠️  Running in DEMO mode - Azure OpenAI credentials not configured")
@@ -161,6 +303,8 @@ else:
 # Configure Azure Speech Service
 AZURE_SPEECH_KEY = os.getenv("AZURE_SPEECH_KEY")
 AZURE_SPEECH_REGION = os.getenv("AZURE_SPEECH_REGION")
+# Optional base URL replacing https://<region>.tts.speech.microsoft.com (custom domains, local stubs)
+AZURE_SPEECH_ENDPOINT = os.getenv("AZURE_SPEECH_ENDPOINT")
 
 if AZURE_SPEECH_KEY and AZURE_SPEECH_REGION:
     logger.info(f"✅ Azure Speech Service configured with region: {AZURE_SPEECH_REGION}")
@@ -168,8 +312,60 @@ else:
     logger.warning("⚠️  Azure Speech Service not configured")
     logger.warning("   Set AZURE_SPEECH_KEY and AZURE_SPEECH_REGION to enable Speech Service")
 
+def build_provider_backends() -> Dict[str, List[Backend]]:
+    """Return the primary backend of each provider followed by any extra regions or deployments"""
+    # The primary backends read the module globals at call time; extras carry their own settings
+    backends = {
+        'speech': [Backend('speech', AZURE_SPEECH_REGION or 'primary')],
+        'openai': [Backend('openai', 'primary')],
+    }
+    # AZURE_SPEECH_EXTRA_REGIONS=northeurope:<key>,westeurope:<key>
+    for entry in filter(None, os.getenv('AZURE_SPEECH_EXTRA_REGIONS', '').split(',')):
+        region, _, key = entry.strip().partition(':')
+        backends['speech'].append(Backend('speech', region, {'region': region, 'key': key}))
+    # AZURE_OPENAI_EXTRA_DEPLOYMENTS=<endpoint>,<key>,<deployment>[,<model>];...
+    # <model> names the model the deployment runs when it differs from the deployment name
+    for entry in filter(None, os.getenv('AZURE_OPENAI_EXTRA_DEPLOYMENTS', '').split(';')):
+        parts = [part.strip() for part in entry.split(',')]
+        if len(parts) not in (3, 4):
+            raise ValueError(f"AZURE_OPENAI_EXTRA_DEPLOYMENTS: expected <endpoint>,<key>,<deployment>[,<model>], "
+                             f"got {len(parts)} fields")
+        endpoint, key, deployment = parts[:3]
+        model = parts[3] if len(parts) == 4 else deployment
+        # Cached audio is keyed by AZURE_OPENAI_MODEL, so audio from any deployment must be interchangeable
+        if model != app.config['AZURE_OPENAI_MODEL']:
+            raise ValueError(f"AZURE_OPENAI_EXTRA_DEPLOYMENTS: {deployment} runs {model}, but the primary deployment "
+                             f"runs AZURE_OPENAI_MODEL={app.config['AZURE_OPENAI_MODEL']}")
+        extra_client = ProcessLocal(lambda key=key, endpoint=endpoint: build_openai_client(key, endpoint))
+        backends['openai'].append(Backend('openai', f"{urlparse(endpoint).hostname}/{deployment}", {
+            'client': extra_client, 'endpoint': endpoint, 'key': key, 'model': deployment,
+        }))
+    for service, pool in backends.items():
+        if len(pool) > 1:
+            logger.info(f"🔀 Routing {service} across {len(pool)} backends: {', '.join(b.name for b in pool)}")
+    return backends
+
+def build_provider_router() -> ProviderRouter:
+    return ProviderRouter(
+        build_provider_backends(),
+        window_seconds=app.config['PROVIDER_WINDOW_SECONDS'],
+        failure_rate=app.config['PROVIDER_FAILURE_RATE'],
+        min_calls=app.config['PROVIDER_MIN_CALLS'],
+        max_consecutive_failures=app.config['PROVIDER_MAX_CONSECUTIVE_FAILURES'],
+        open_seconds=app.config['PROVIDER_CIRCUIT_OPEN_SECONDS'],
+        max_attempts=app.config['PROVIDER_MAX_ATTEMPTS'],
+        backoff_base=app.config['PROVIDER_BACKOFF_BASE_SECONDS'],
+        backoff_max=app.config['PROVIDER_BACKOFF_MAX_SECONDS'],
+        hedge_max_chars=app.config['PROVIDER_HEDGE_MAX_CHARS'],
+        hedge_min_samples=app.config['PROVIDER_HEDGE_MIN_SAMPLES'],
+    )
+
+# Per-backend latency and error tracking, circuit breakers, retries and hedging
+provider_router = build_provider_router()
+
 # Create directory for audio files inside data directory
-DATA_DIR = Path("data")
+# Absolute, because send_file resolves relative paths against the app package rather than the working directory
+DATA_DIR = Path("data").resolve()
 AUDIO_DIR = DATA_DIR / "audio"
 # Create directories with exist_ok to handle volume mount permissions
 try:
@@ -187,32 +383,701 @@ except (PermissionError, FileExistsError):
         logger.warning(f"   Audio files will not be saved. Check directory permissions.")
     pass
 
-def cleanup_old_audio_files() -> int:
-    """Remove audio files older than MAX_FILE_AGE_SECONDS"""
+STREAM_CHUNK_SIZE = 16 * 1024
+AUDIO_FILENAME_PATTERN = re.compile(rf'^[a-f0-9\-]+\.({EXTENSION_PATTERN})$')
+
+# Long texts are split into chunks no larger than the provider accepts in one call
+PROVIDER_MAX_INPUT_CHARS = {'openai': 4096, 'speech': 5000}
+# Bound concurrent chunk syntheses per provider in this worker
+provider_pools = {
+    'openai': ThreadPoolExecutor(max_workers=app.config['OPENAI_MAX_PARALLEL_REQUESTS'], thread_name_prefix='tts-openai'),
+    'speech': ThreadPoolExecutor(max_workers=app.config['SPEECH_MAX_PARALLEL_REQUESTS'], thread_name_prefix='tts-speech'),
+}
+# Synthesized audio is cached by a hash of its inputs and served straight from AUDIO_DIR.
+# Every file in AUDIO_DIR is tracked in an expiry index; one janitor across all workers prunes it
+audio_index = AudioIndex(DATA_DIR / "audio_index.db")
+audio_janitor = AudioJanitor(
+    AUDIO_DIR,
+    audio_index,
+    DATA_DIR / "locks" / "janitor.lock",
+    max_age_seconds=app.config['MAX_FILE_AGE_SECONDS'],
+    max_bytes=app.config['AUDIO_MAX_BYTES'],
+    interval=app.config['AUDIO_JANITOR_INTERVAL_SECONDS'],
+)
+synthesis_cache = SynthesisCache(AUDIO_DIR, audio_index)
+# Identical in-flight syntheses are coalesced across threads and gunicorn workers
+single_flight = SingleFlight(DATA_DIR / "locks", timeout=app.config['SINGLE_FLIGHT_TIMEOUT_SECONDS'])
+# ffmpeg conversions are capped across all workers
+transcoder = Transcoder(
+    DATA_DIR / "locks",
+    max_concurrent=app.config['TRANSCODE_MAX_CONCURRENT'],
+    queue_timeout=app.config['TRANSCODE_QUEUE_TIMEOUT_SECONDS'],
+)
+
+# Character budgets per user and per IP, shared by all workers
+character_quota = CharacterQuota(DATA_DIR / "quota.db")
+
+def quota_buckets() -> List[Bucket]:
+    """Return the token buckets the current request is charged against"""
+    buckets = [Bucket(f"ip:{get_remote_address()}", app.config['IP_QUOTA_CHARACTERS'],
+                      app.config['IP_QUOTA_CHARACTERS_PER_HOUR'] / 3600)]
+    owner = current_owner_id()
+    if owner:
+        buckets.insert(0, Bucket(f"user:{owner}", app.config['USER_QUOTA_CHARACTERS'],
+                                 app.config['USER_QUOTA_CHARACTERS_PER_HOUR'] / 3600))
+    return buckets
+
+def charge_quota(characters: int) -> Optional[Tuple[Response, int]]:
+    """Charge characters to the caller's budget; returns an error response if it is exhausted"""
+    if not app.config['QUOTA_ENABLED']:
+        return None
+    buckets = quota_buckets()
+    result = character_quota.consume(buckets, characters)
+    g.quota = result
+    if result.allowed:
+        g.quota_charge = (buckets, characters)
+        return None
+    if result.retry_after < 0:
+        return jsonify({'error': f'Text exceeds your character budget of {result.limit} characters.'}), 413
+    logger.warning(f"🚦 Character quota exhausted for {buckets[0].key} ({characters} requested)")
+    metrics.RATE_LIMIT_REJECTIONS.labels('characters').inc()
+    response = jsonify({'error': 'Character quota exceeded. Please try again later.',
+                        'retry_after': result.retry_after})
+    response.headers['Retry-After'] = str(result.retry_after)
+    return response, 429
+
+def refund_quota(charge: Optional[Tuple[List[Bucket], int]] = None, characters: Optional[int] = None) -> None:
+    """Return characters (by default all) charged to this request, e.g. when the provider call failed
+
+    Code running after the request context is gone, like a streamed body, passes the charge it kept.
+    """
+    in_request = charge is None
+    if in_request:
+        charge = g.pop('quota_charge', None)
+    if not charge:
+        return
+    buckets, cost = charge
+    refunded = cost if characters is None else min(characters, cost)
     try:
-        current_time = time.time()
-        deleted_count = 0
-
-        # Remove both mp3 and wav files older than the configured age
-        for pattern in ("*.mp3", "*.wav"):
-            for audio_file in AUDIO_DIR.glob(pattern):
-                file_age = current_time - audio_file.stat().st_mtime
-                if file_age > app.config['MAX_FILE_AGE_SECONDS']:
-                    try:
-                        audio_file.unlink()
-                        deleted_count += 1
-                    except Exception:
-                        pass
-
-        if deleted_count > 0:
-            logger.info(f"🧹 Cleaned up {deleted_count} old audio file(s)")
-        return deleted_count
+        balance = character_quota.refund(buckets, refunded)
     except Exception as e:
-        logger.error(f"⚠️  Error during audio cleanup: {e}")
-        return 0
+        logger.error(f"⚠️  Failed to refund character quota: {e}")
+        return
+    if in_request:
+        # The quota headers report the balance after the refund
+        g.quota = balance
+        if refunded < cost:
+            g.quota_charge = (buckets, cost - refunded)
+
+# Characters sent to the provider in this context, while a route settles its quota charge
+provider_characters: ContextVar[Optional[Dict[str, int]]] = ContextVar('provider_characters', default=None)
+
+@contextmanager
+def meter_provider_characters() -> Iterator[Dict[str, int]]:
+    """Count the characters the synthesis run in this block sends to the provider"""
+    meter = {'characters': 0}
+    token = provider_characters.set(meter)
+    try:
+        yield meter
+    finally:
+        provider_characters.reset(token)
+
+def count_provider_characters(characters: int) -> None:
+    """Add characters about to be sent to the provider to the active meter, if any"""
+    meter = provider_characters.get()
+    if meter is not None:
+        meter['characters'] += characters
+
+def settle_quota(meter: Dict[str, int]) -> None:
+    """Refund the part of this request's charge no provider synthesized, e.g. cached audio or a local stretch"""
+    charge = g.get('quota_charge')
+    if charge and meter['characters'] < charge[1]:
+        refund_quota(characters=charge[1] - meter['characters'])
+
+@app.after_request
+def add_quota_headers(response):
+    quota = g.get('quota')
+    if quota:
+        response.headers['X-Quota-Limit'] = str(quota.limit)
+        response.headers['X-Quota-Remaining'] = str(quota.remaining)
+    return response
+
+def register_audio_file(path: Path) -> None:
+    """Record a file written outside the synthesis cache so the janitor expires it"""
+    audio_index.record(path.name, path.stat().st_size)
+
+metrics.register_snapshot('tts_audio_dir_bytes', 'Size of the generated audio in AUDIO_DIR',
+                          lambda: audio_index.summary()['bytes'])
+metrics.register_snapshot('tts_audio_dir_files', 'Number of generated audio files in AUDIO_DIR',
+                          lambda: audio_index.summary()['files'])
+
+class SynthesisError(Exception):
+    """Raised when a TTS provider fails to produce audio"""
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+def speech_ssml(lines: List[Line]) -> str:
+    """Return an SSML document speaking each line with its own voice and rate, pausing between them"""
+    voices = []
+    for i, line in enumerate(lines):
+        rate_percent = max(-50, min(100, int((line.speed - 1.0) * 100)))
+        rate_str = f"+{rate_percent}%" if rate_percent > 0 else f"{rate_percent}%"
+        pause = f"<break time='{int(line.pause * 1000)}ms'/>" if line.pause > 0 and i < len(lines) - 1 else ''
+        voices.append(f"<voice xml:lang='en-US' name='{html.escape(line.voice)}'>"
+                      f"<prosody rate='{rate_str}'>{html.escape(line.text)}</prosody>{pause}</voice>")
+    return f"""<speak version='1.0' xml:lang='en-US'>
+        {''.join(voices)}
+    </speak>"""
+
+def speech_request(voice: str, speed: float, text: str, fmt: str = 'mp3', backend: Optional[Backend] = None,
+                   lines: Optional[List[Line]] = None) -> Tuple[str, Dict[str, str], bytes]:
+    """Return the URL, headers and SSML body of an Azure Speech synthesis call.
+
+    lines, if given, replaces voice, speed and text with a multi-voice script.
+    """
+    config = backend.config if backend else {}
+    if 'region' not in config and AZURE_SPEECH_ENDPOINT:
+        speech_url = f"{AZURE_SPEECH_ENDPOINT.rstrip('/')}/cognitiveservices/v1"
+    else:
+        speech_url = f"https://{config.get('region', AZURE_SPEECH_REGION)}.tts.speech.microsoft.com/cognitiveservices/v1"
+    headers = {
+        'Ocp-Apim-Subscription-Key': config.get('key', AZURE_SPEECH_KEY),
+        'Content-Type': 'application/ssml+xml',
+        'X-Microsoft-OutputFormat': provider_format('speech', fmt),
+        'User-Agent': 'TTSApp'
+    }
+    ssml = speech_ssml(lines or [Line(voice, speed, text, 0.0)])
+    return speech_url, headers, ssml.encode('utf-8')
+
+def speech_status_error(status_code: int, text: str, headers: Any) -> ProviderError:
+    return ProviderError(f"Azure Speech Service error: {status_code} - {text}", status_code,
+                         retry_after_from_headers(headers), is_retryable_status(status_code))
+
+def openai_status_error(e: 'openai.APIStatusError') -> ProviderError:
+    return ProviderError(f"Azure OpenAI error: {e.status_code} - {e.message}", e.status_code,
+                         retry_after_from_headers(e.response.headers), is_retryable_status(e.status_code))
+
+def provider_failure(e: ProviderError) -> SynthesisError:
+    """Map a provider error to the status returned to our own clients"""
+    return SynthesisError(str(e), 503 if e.status_code in (429, 503) else 502)
+
+def connection_error(provider: str, e: Exception) -> ProviderError:
+    """Map a failure to reach a provider to a ProviderError"""
+    if isinstance(e, httpx.PoolTimeout) or isinstance(e.__cause__, httpx.PoolTimeout):
+        # Every pooled connection was busy: a limit of this worker, not a sign the backend is unhealthy
+        return ProviderError(f"Too many requests to {provider} in progress. Please try again shortly.", 503,
+                             retryable=False)
+    return ProviderError(f"Failed to connect to {provider}: {str(e)}")
+
+def stream_backend(backend: Backend, voice: str, speed: float, text: str, fmt: str,
+                   lines: Optional[List[Line]] = None) -> Iterator[bytes]:
+    """Yield audio from one backend, raising ProviderError on failure"""
+    if backend.service == 'speech':
+        speech_url, headers, body = speech_request(voice, speed, text, fmt, backend, lines)
+        try:
+            with http_pool.get().stream('POST', speech_url, headers=headers, content=body) as response:
+                if response.status_code != 200:
+                    response.read()
+                    raise speech_status_error(response.status_code, response.text, response.headers)
+                for chunk in response.iter_bytes(STREAM_CHUNK_SIZE):
+                    yield chunk
+        except httpx.HTTPError as e:
+            raise connection_error('Azure Speech Service', e)
+    else:
+        import openai
+        try:
+            with (backend.config.get('client') or openai_client).get().audio.speech.with_streaming_response.create(
+                model=backend.config.get('model', app.config['AZURE_OPENAI_MODEL']),
+                voice=voice,
+                input=text,
+                speed=speed,
+                response_format=provider_format('openai', fmt)
+            ) as response:
+                for chunk in response.iter_bytes(STREAM_CHUNK_SIZE):
+                    yield chunk
+        except openai.APIStatusError as e:
+            raise openai_status_error(e)
+        except (openai.APIConnectionError, httpx.HTTPError) as e:
+            raise connection_error('Azure OpenAI', e)
+
+def stream_provider(service: str, voice: str, speed: float, text: str, fmt: str = 'mp3',
+                    lines: Optional[List[Line]] = None) -> Iterator[bytes]:
+    """Yield audio in a provider-native format from the selected provider as it arrives"""
+    def attempt(backend: Backend) -> Tuple[Backend, bytes, Iterator[bytes]]:
+        # Wait for the first chunk so the router measures (and hedges on) time to first byte
+        chunks = stream_backend(backend, voice, speed, text, fmt, lines)
+        try:
+            return backend, next(chunks, b''), chunks
+        except BaseException:
+            chunks.close()
+            raise
+
+    with metrics.observe_provider_call(service, voice, len(text)) as observed:
+        try:
+            backend, first, chunks = provider_router.call(service, len(text), attempt,
+                                                          discard=lambda result: result[2].close())
+        except ProviderError as e:
+            raise provider_failure(e)
+        observed['first_byte'] = time.perf_counter()
+        try:
+            yield first
+            observed['bytes'] += len(first)
+            for chunk in chunks:
+                yield chunk
+                observed['bytes'] += len(chunk)
+        except ProviderError as e:
+            provider_router.record_failure(backend)
+            raise provider_failure(e)
+        finally:
+            chunks.close()
+    if service == 'speech':
+        logger.info(f"✅ Speech synthesized with Azure Speech Service (voice: {voice}, backend: {backend.name})")
+    else:
+        logger.info(f"✅ Speech synthesized with OpenAI TTS (voice: {voice}, backend: {backend.name})")
+
+def synthesize_segment(service: str, voice: str, speed: float, text: str) -> bytes:
+    """Synthesize one chunk of text and return the complete MP3"""
+    return b''.join(stream_provider(service, voice, speed, text))
+
+def chunk_size_for(service: str) -> int:
+    """Return the largest text sent to a provider in one call"""
+    return min(app.config['LONG_TEXT_CHUNK_CHARS'], PROVIDER_MAX_INPUT_CHARS[service])
+
+def stream_synthesis(service: str, voice: str, speed: float, text: str, fmt: str = 'mp3') -> Iterator[bytes]:
+    """Yield audio for text, synthesizing long texts as parallel MP3 chunks"""
+    count_provider_characters(len(text))
+    max_chars = chunk_size_for(service)
+    if len(text) <= max_chars:
+        yield from stream_provider(service, voice, speed, text, fmt)
+        return
+
+    # Only MP3 frames can be joined without re-encoding
+    if fmt != 'mp3':
+        raise ValueError(f"Long texts can only be synthesized as MP3, not {fmt}")
+    chunks = split_text(text, max_chars)
+    logger.info(f"✂️  Synthesizing {len(chunks)} chunks in parallel ({service})")
+    pool = provider_pools[service]
+    futures = [pool.submit(synthesize_segment, service, voice, speed, chunk) for chunk in chunks]
+    try:
+        # Segments are emitted in order as soon as each one and its predecessors are done
+        for future in futures:
+            yield from join_segments([future.result()])
+    finally:
+        for future in futures:
+            future.cancel()
+
+# Sentence counts of the incremental synthesis running in this context, while a route is reporting them
+incremental_counts: ContextVar[Optional[Dict[str, int]]] = ContextVar('incremental_counts', default=None)
+
+@contextmanager
+def count_incremental(params: Dict[str, Any]) -> Iterator[Optional[Dict[str, int]]]:
+    """Collect how many sentences an incremental synthesis of params sends to the provider"""
+    if not params.get('incremental') or params.get('segments'):
+        yield None
+        return
+    counts = {'sentences': len(sentence_segments(params['text'], chunk_size_for(params['service']))),
+              'synthesized': 0}
+    token = incremental_counts.set(counts)
+    try:
+        yield counts
+    finally:
+        incremental_counts.reset(token)
+
+def incremental_summary(counts: Dict[str, int]) -> Dict[str, int]:
+    """Report sentences not sent to the provider (cached sentences or a cached whole text) as reused"""
+    return {'sentences': counts['sentences'], 'reused': counts['sentences'] - counts['synthesized'],
+            'synthesized': counts['synthesized']}
+
+def synthesize_sentence(service: str, voice: str, speed: float, text: str, cache_key: str) -> bytes:
+    """Synthesize one sentence and keep it in the synthesis cache for later edits of the text"""
+    audio = synthesize_segment(service, voice, speed, text)
+    if app.config['SYNTHESIS_CACHE_ENABLED']:
+        filepath = synthesis_cache.temp_path(cache_key)
+        try:
+            filepath.write_bytes(audio)
+            synthesis_cache.put(cache_key, filepath, 'mp3')
+        finally:
+            if filepath.exists():
+                filepath.unlink()
+    return audio
+
+def stream_incremental(service: str, voice: str, speed: float, text: str) -> Iterator[bytes]:
+    """Yield one MP3 for text from cached sentences, synthesizing only the sentences not cached yet"""
+    sentences = sentence_segments(text, chunk_size_for(service))
+    # A sentence is cached exactly like a request for that sentence alone, so the two share audio
+    keys = [get_cache_key({'service': service, 'voice': voice, 'speed': speed, 'text': sentence})
+            for sentence in sentences]
+    cached: Dict[str, bytes] = {}
+    if app.config['SYNTHESIS_CACHE_ENABLED']:
+        for key in dict.fromkeys(keys):
+            path = synthesis_cache.get(key, 'mp3', count_miss=False)
+            try:
+                if path:
+                    cached[key] = path.read_bytes()
+            except OSError:
+                pass  # Expired between the lookup and the read
+    pool = provider_pools[service]
+    futures = {key: pool.submit(synthesize_sentence, service, voice, speed, sentence, key)
+               for key, sentence in zip(keys, sentences) if key not in cached}
+    # Reused sentences cost no provider characters
+    count_provider_characters(len(text) - sum(len(sentence) for key, sentence in zip(keys, sentences) if key in cached))
+    counts = incremental_counts.get()
+    if counts is not None:
+        counts['synthesized'] += len(futures)
+    logger.info(f"🧩 Reusing {len(sentences) - len(futures)} of {len(sentences)} sentences, "
+                f"synthesizing {len(futures)} ({service})")
+    try:
+        for key in keys:
+            yield from join_segments([cached[key] if key in cached else futures[key].result()])
+    finally:
+        for future in futures.values():
+            future.cancel()
+
+def synthesize_call(call: Call) -> bytes:
+    """Synthesize one planned dialogue call (several lines for Azure Speech) and return the MP3"""
+    first = call.lines[0]
+    text = ' '.join(line.text for line in call.lines)
+    lines = call.lines if call.service == 'speech' else None
+    return b''.join(stream_provider(call.service, first.voice, first.speed, text, 'mp3', lines))
+
+def stream_dialogue(segments: List[Dict[str, Any]]) -> Iterator[bytes]:
+    """Yield one MP3 for a dialogue script, synthesizing its calls in parallel per provider"""
+    count_provider_characters(len('\n'.join(segment['text'] for segment in segments)))
+    calls = plan_calls(segments, chunk_size_for)
+    logger.info(f"🎭 Synthesizing {len(segments)} dialogue segments in {len(calls)} provider calls")
+    futures = [provider_pools[call.service].submit(synthesize_call, call) for call in calls]
+    try:
+        yield from stitch(calls, (future.result() for future in futures))
+    finally:
+        for future in futures:
+            future.cancel()
+
+def write_audio(chunks: Iterator[bytes], filepath: Path) -> None:
+    """Write synthesized audio to filepath"""
+    # Pull the first chunk before creating the file so provider errors leave nothing behind
+    first = next(chunks, b'')
+    with open(filepath, 'wb') as audio_file:
+        audio_file.write(first)
+        for chunk in chunks:
+            audio_file.write(chunk)
+
+def synthesize_to_file(service: str, voice: str, speed: float, text: str, filepath: Path, fmt: str = 'mp3') -> None:
+    """Synthesize text with the selected provider and write the audio to filepath"""
+    write_audio(stream_synthesis(service, voice, speed, text, fmt), filepath)
+
+def validate_dialogue_request(data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[str, int]]]:
+    """Parse a dialogue script ({'segments': [...], 'format': ...}) like validate_speech_request"""
+    segments = data.get('segments')
+    fmt = str(data.get('format', 'mp3')).lower()
+    if not isinstance(segments, list) or not segments:
+        return None, ('No segments provided', 400)
+    max_segments = app.config['DIALOGUE_MAX_SEGMENTS']
+    if len(segments) > max_segments:
+        return None, (f'Too many segments. Maximum {max_segments} segments per script.', 400)
+    if fmt not in OUTPUT_FORMATS:
+        return None, (f"Unsupported format. Choose one of: {', '.join(OUTPUT_FORMATS)}", 400)
+
+    validated = []
+    max_pause = app.config['DIALOGUE_MAX_PAUSE_SECONDS']
+    for position, segment in enumerate(segments):
+        params, error = validate_speech_request(segment if isinstance(segment, dict) else None, allow_segments=False)
+        if error:
+            return None, (f'Segment {position + 1}: {error[0]}', error[1])
+        pause = segment.get('pause', 0)
+        if not isinstance(pause, (int, float)) or not (0 <= pause <= max_pause):
+            return None, (f'Segment {position + 1}: Invalid pause. Must be between 0 and {max_pause:g} seconds', 400)
+        validated.append({'text': params['text'], 'voice': params['voice'], 'service': params['service'],
+                          'speed': params['speed'], 'pause': float(pause)})
+
+    text = '\n'.join(segment['text'] for segment in validated)
+    max_len = app.config['MAX_TEXT_LENGTH']
+    if len(text) > max_len:
+        return None, (f'Text too long. Maximum {max_len} characters allowed.', 400)
+    voices = ', '.join(dict.fromkeys(segment['voice'] for segment in validated))
+    return {'segments': validated, 'text': text, 'voice': voices, 'service': 'dialogue', 'speed': 1.0,
+            'format': fmt}, None
+
+def validate_speech_request(data: Optional[Dict[str, Any]],
+                            allow_segments: bool = True) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[str, int]]]:
+    """Parse a synthesis request body, returning (params, None) or (None, (error, status))"""
+    data = data or {}
+    if 'segments' in data:
+        if not allow_segments:
+            return None, ('Dialogue scripts are only accepted by /generate-speech', 400)
+        return validate_dialogue_request(data)
+    text = data.get('text', '')
+    voice = data.get('voice', 'alloy')
+    service = data.get('service', 'openai')
+    speed = data.get('speed', 1.0)
+    fmt = str(data.get('format', 'mp3')).lower()
+
+    # Input validation
+    if not text:
+        return None, ('No text provided', 400)
+
+    max_len = app.config['MAX_TEXT_LENGTH']
+    if len(text) > max_len:
+        return None, (f'Text too long. Maximum {max_len} characters allowed.', 400)
+
+    if service not in ['openai', 'speech']:
+        return None, ('Invalid service selection', 400)
+
+    if not (0.25 <= speed <= 4.0):
+        return None, ('Invalid speed value. Must be between 0.25 and 4.0', 400)
+
+    if fmt not in OUTPUT_FORMATS:
+        return None, (f"Unsupported format. Choose one of: {', '.join(OUTPUT_FORMATS)}", 400)
+
+    if service == 'speech' and (not AZURE_SPEECH_KEY or not AZURE_SPEECH_REGION):
+        return None, ('Azure Speech Service is not configured.', 503)
+    if service == 'openai' and not openai_client:
+        return None, ('Azure OpenAI is not configured.', 503)
+
+    speed_mode = data.get('speed_mode') or app.config['SPEED_VARIANT_MODE']
+    if speed_mode not in ('local', 'provider'):
+        return None, ("Invalid speed_mode. Choose 'local' or 'provider'", 400)
+
+    incremental = data.get('incremental', app.config['INCREMENTAL_SYNTHESIS'])
+    if not isinstance(incremental, bool):
+        return None, ('Invalid incremental value. Must be true or false', 400)
+
+    return {'text': text, 'voice': voice, 'service': service, 'speed': speed, 'format': fmt,
+            'speed_mode': speed_mode, 'incremental': incremental}, None
+
+def validate_stream_request(
+        data: Optional[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[str, int]]]:
+    """Parse a streaming request body; streams are single-voice MP3"""
+    params, error = validate_speech_request(data, allow_segments=False)
+    if params and params['format'] != 'mp3':
+        return None, ('Streaming is only available as MP3. Use /generate-speech for other formats.', 400)
+    return params, error
+
+def stretches_locally(params: Dict[str, Any]) -> bool:
+    """True if params' speed is derived from the 1.0x rendering rather than synthesized"""
+    return params.get('speed_mode') == 'local' and float(params['speed']) != 1.0 and not params.get('segments')
+
+def get_cache_key(params: Dict[str, Any]) -> str:
+    """Return the synthesis ID for validated request params; format variants share it"""
+    if params.get('segments'):
+        script = json.dumps([[segment['service'], segment['voice'], f"{float(segment['speed']):.2f}",
+                              normalize_text(segment['text']), segment['pause']] for segment in params['segments']])
+        return synthesis_key('dialogue', '', 1.0, f"neural/{app.config['AZURE_OPENAI_MODEL']}", script)
+    if stretches_locally(params):
+        # Stored next to the 1.0x rendering, e.g. <id>-125.mp3 for 1.25x
+        return f"{get_cache_key({**params, 'speed': 1.0})}-{round(float(params['speed']) * 100)}"
+    model = 'neural' if params['service'] == 'speech' else app.config['AZURE_OPENAI_MODEL']
+    return synthesis_key(params['service'], params['voice'], params['speed'], model, params['text'])
+
+def transcode_file(source: Path, target: Path, fmt: str) -> None:
+    """Convert an audio file to fmt with ffmpeg"""
+    try:
+        transcoder.transcode(source, target, fmt)
+    except TranscoderBusy:
+        raise SynthesisError('The server is busy converting audio. Please try again shortly.', 503)
+    except TranscodeError as e:
+        raise SynthesisError(str(e))
+
+def is_native_output(params: Dict[str, Any]) -> bool:
+    """True if one provider stream can produce params['format'] for this text without transcoding"""
+    if params.get('segments') or params.get('incremental') or stretches_locally(params):
+        return False
+    service, fmt = params['service'], params['format']
+    return bool(provider_format(service, fmt)) and (fmt == 'mp3' or len(params['text']) <= chunk_size_for(service))
+
+def produce_audio(params: Dict[str, Any], filepath: Path) -> None:
+    """Write audio in params['format'] to filepath, natively if the provider supports it"""
+    service, voice, speed, text, fmt = params['service'], params['voice'], params['speed'], params['text'], params['format']
+    dialogue = bool(params.get('segments'))
+    incremental = bool(params.get('incremental')) and not dialogue
+    if stretches_locally(params):
+        stretch_audio(params, filepath)
+        return
+    if dialogue and fmt == 'mp3':
+        write_audio(stream_dialogue(params['segments']), filepath)
+        return
+    if incremental and fmt == 'mp3':
+        write_audio(stream_incremental(service, voice, speed, text), filepath)
+        return
+    if is_native_output(params):
+        synthesize_to_file(service, voice, speed, text, filepath, fmt)
+        return
+
+    # Fall back to transcoding from a format the provider does produce; joined audio is always MP3
+    long_text = dialogue or incremental or len(text) > chunk_size_for(service)
+    source_fmt = 'wav' if OUTPUT_FORMATS[fmt].lossless and not long_text else 'mp3'
+    logger.info(f"🔄 {service} can't produce {fmt} directly, transcoding from {source_fmt}")
+    if app.config['SYNTHESIS_CACHE_ENABLED']:
+        source, _ = synthesize_cached({**params, 'format': source_fmt})
+        transcode_file(source, filepath, fmt)
+        return
+    source = AUDIO_DIR / f".{uuid.uuid4()}.{source_fmt}.part"
+    try:
+        if dialogue:
+            write_audio(stream_dialogue(params['segments']), source)
+        elif incremental:
+            write_audio(stream_incremental(service, voice, speed, text), source)
+        else:
+            synthesize_to_file(service, voice, speed, text, source, source_fmt)
+        transcode_file(source, filepath, fmt)
+    finally:
+        if source.exists():
+            source.unlink()
+
+def stretch_audio(params: Dict[str, Any], filepath: Path) -> None:
+    """Write params' speed variant by time-stretching the 1.0x rendering, synthesizing that first if needed"""
+    # Imported on first use: NumPy would add to every worker's startup
+    from time_stretch import stretch_pcm
+    speed = float(params['speed'])
+    source_params = {**params, 'speed': 1.0}
+    source = None
+    if app.config['SYNTHESIS_CACHE_ENABLED']:
+        source_key = get_cache_key(source_params)
+        for source_fmt in SOURCE_PREFERENCE:
+            source = synthesis_cache.get(source_key, OUTPUT_FORMATS[source_fmt].extension, count_miss=False)
+            if source:
+                break
+    if source is None:
+        source, _ = synthesize_cached({**source_params, 'format': 'mp3'})
+    logger.info(f"⏩ Time-stretching {source.name} to {speed:g}x")
+    try:
+        transcoder.filter_pcm(source, filepath, params['format'], lambda pcm: stretch_pcm(pcm, speed))
+    except TranscoderBusy:
+        raise SynthesisError('The server is busy converting audio. Please try again shortly.', 503)
+    except TranscodeError as e:
+        raise SynthesisError(str(e))
+
+def synthesize_cached(params: Dict[str, Any]) -> Tuple[Path, bool]:
+    """Return (path, cached) for validated params, synthesizing on a cache miss"""
+    extension = OUTPUT_FORMATS[params['format']].extension
+    if not app.config['SYNTHESIS_CACHE_ENABLED']:
+        filepath = AUDIO_DIR / f"{uuid.uuid4()}.{extension}"
+        produce_audio(params, filepath)
+        register_audio_file(filepath)
+        return filepath, False
+
+    cache_key = get_cache_key(params)
+    cached_path = synthesis_cache.get(cache_key, extension)
+    if cached_path:
+        return cached_path, True
+
+    # Concurrent duplicates wait here for the leader and then hit the cache
+    with single_flight.lock(f"{cache_key}.{extension}") as waited:
+        cached_path = synthesis_cache.get(cache_key, extension, count_miss=False)
+        if cached_path:
+            if waited:
+                logger.info(f"🔗 Coalesced with in-flight synthesis {cache_key[:12]}")
+            return cached_path, True
+        filepath = synthesis_cache.temp_path(cache_key)
+        try:
+            produce_audio(params, filepath)
+            return synthesis_cache.put(cache_key, filepath, extension), False
+        finally:
+            if filepath.exists():
+                filepath.unlink()
+
+def refund_job_item(buckets: List[List[Any]], characters: int) -> None:
+    """Return the characters of a job item no provider synthesized to the buckets the job was charged against"""
+    refund_quota(([Bucket(*bucket) for bucket in buckets], characters))
+
+# Bulk jobs are persisted next to users.db and drained by a background pool in every worker
+job_store = JobStore(DATA_DIR / "jobs.db")
+job_runner = JobRunner(
+    job_store,
+    DATA_DIR / "jobs",
+    lambda params: synthesize_cached(params)[0],
+    workers=app.config['JOB_WORKERS'],
+    retention_seconds=app.config['JOB_RETENTION_SECONDS'],
+    meter=meter_provider_characters,
+    refund=refund_job_item,
+)
 
-# Run cleanup on startup
-cleanup_old_audio_files()
+# Each user's syntheses are recorded next to users.db; entries are queued and written in batches
+history = HistoryStore(DATA_DIR / "history.db", flush_interval=app.config['HISTORY_FLUSH_SECONDS'])
+
+def record_history(owner_id: Optional[str], params: Dict[str, Any], path: Path) -> None:
+    """Queue a finished synthesis for the owner's history"""
+    if app.config['HISTORY_ENABLED']:
+        history.record(owner_id, params, path)
+
+def warm_phrase(entry: Dict[str, Any], pin: bool = True) -> str:
+    """Render a catalog phrase into the synthesis cache and pin it; returns 'skipped' if it was cached already"""
+    params, error = validate_speech_request(entry, allow_segments=False)
+    if error:
+        raise ValueError(error[0])
+    path = synthesis_cache.get(get_cache_key(params), OUTPUT_FORMATS[params['format']].extension, count_miss=False)
+    outcome = 'skipped'
+    if not path:
+        path, cached = synthesize_cached(params)
+        outcome = 'skipped' if cached else 'synthesized'
+    if pin:
+        audio_index.pin([path.name])
+    return outcome
+
+def warm_startup_phrases() -> None:
+    """Pre-render the startup phrases of WARMUP_CATALOG in the one worker that wins the election"""
+    catalog = Path(app.config['WARMUP_CATALOG'])
+    try:
+        entries = [entry for entry in read_catalog(catalog) if entry['startup']]
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ Could not read warm-up catalog {catalog}: {e}")
+        return
+    with elected(DATA_DIR / "locks" / "warmup.lock") as leader:
+        if not leader:
+            return
+        logger.info(f"🔥 Warming {len(entries)} startup phrases from {catalog}")
+        counts = warm(entries, warm_phrase, app.config['WARMUP_CONCURRENCY'])
+        logger.info(f"🔥 Warm-up finished: {counts['synthesized']} synthesized, {counts['skipped']} already cached, "
+                    f"{counts['failed']} failed")
+
+def fetch_speech_voices() -> Optional[List[Dict[str, str]]]:
+    """Return every Azure Speech voice (limited to SPEECH_VOICE_LOCALES if set), or None if not configured"""
+    if not AZURE_SPEECH_KEY or not AZURE_SPEECH_REGION:
+        return None
+    base_url = AZURE_SPEECH_ENDPOINT or f"https://{AZURE_SPEECH_REGION}.tts.speech.microsoft.com"
+    response = http_pool.get().get(f"{base_url.rstrip('/')}/cognitiveservices/voices/list",
+                                   headers={'Ocp-Apim-Subscription-Key': AZURE_SPEECH_KEY})
+    response.raise_for_status()
+    return azure_voices(response.json(), app.config['SPEECH_VOICE_LOCALES'])
+
+# Voices are fetched once per worker and refreshed in the background; the configured lists are the fallback
+voice_catalog = VoiceCatalog(
+    {'speech': app.config['SPEECH_SERVICE_VOICES'], 'openai': app.config['OPENAI_VOICES']},
+    {'speech': fetch_speech_voices},
+    refresh_interval=app.config['VOICE_CATALOG_REFRESH_SECONDS'],
+    retry_interval=app.config['VOICE_CATALOG_RETRY_SECONDS'],
+)
+
+_background_pid: Optional[int] = None
+_background_lock = threading.Lock()
+
+def start_background_services() -> None:
+    """Start this worker's audio janitor, job runner, history writer, voice catalog and warm-up threads.
+
+    Called after the fork (gunicorn's post_worker_init hook, the ASGI lifespan or
+    the first request), never at import: a --preload master then holds no
+    threads, locks or connections its workers would inherit, and the janitor's
+    first pass over AUDIO_DIR never delays startup.
+    """
+    global _background_pid
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        audio_janitor.start()
+        job_runner.start()
+        history.start()
+        voice_catalog.start()
+        if app.config['WARMUP_CATALOG'] and app.config['SYNTHESIS_CACHE_ENABLED']:
+            threading.Thread(target=warm_startup_phrases, name='warmup', daemon=True).start()
+        if openai_client:
+            # Import the SDK and build the client without holding up the first request
+            threading.Thread(target=openai_client.get, name='openai-client', daemon=True).start()
+        _background_pid = os.getpid()
+
+@app.before_request
+def ensure_background_services():
+    if _background_pid != os.getpid():
+        start_background_services()
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -234,7 +1099,15 @@ def login():
                                  azure_ad_enabled=bool(app.config['AZURE_AD_CLIENT_ID']))
 
         user = get_user_by_username(username)
-        if user and user.check_password(password):
+        try:
+            authenticated = bool(user and user.check_password(password))
+        except HashingBusy:
+            # Shed login storms instead of letting them starve synthesis requests
+            flash('Der er travlt lige nu. Prøv venligst igen om et øjeblik.', 'error')
+            return render_template('login.html',
+                                 allow_registration=app.config['ALLOW_REGISTRATION'],
+                                 azure_ad_enabled=bool(app.config['AZURE_AD_CLIENT_ID'])), 503
+        if authenticated:
             login_user(user)
             next_page = request.args.get('next')
             if not next_page or not is_safe_url(next_page):
@@ -302,17 +1175,13 @@ def login_azure_callback():
             return redirect(url_for('login'))
 
         # Get user info from Microsoft Graph
-        access_token = result['access_token']
-        graph_response = requests.get(
-            'https://graph.microsoft.com/v1.0/me',
-            headers={'Authorization': f'Bearer {access_token}'}
-        )
+        object_id = result.get('id_token_claims', {}).get('oid')
+        user_info = get_graph_profile(result['access_token'], object_id)
 
-        if graph_response.status_code != 200:
+        if user_info is None:
             flash('Kunne ikke hente brugeroplysninger fra Azure AD', 'error')
             return redirect(url_for('login'))
 
-        user_info = graph_response.json()
         email = user_info.get('mail') or user_info.get('userPrincipalName')
         display_name = user_info.get('displayName', email.split('@')[0])
 
@@ -391,14 +1260,15 @@ def index():
 @app.route('/get-voices', methods=['GET'])
 @conditional_login_required
 def get_voices():
-    """Get available voices for the selected service"""
+    """Get available voices for the selected service, optionally for one language (?language=da or da-DK)"""
     try:
-        service = request.args.get('service', 'openai')
-        if service == 'speech':
-            voices = app.config['SPEECH_SERVICE_VOICES']
-        else:
-            voices = app.config['OPENAI_VOICES']
-        return jsonify({'voices': voices})
+        service = 'speech' if request.args.get('service', 'openai') == 'speech' else 'openai'
+        entry = voice_catalog.get(service, request.args.get('language'))
+        response = Response(entry.body, mimetype='application/json')
+        response.set_etag(entry.etag)
+        response.cache_control.private = True
+        response.cache_control.max_age = app.config['VOICE_CATALOG_CACHE_SECONDS']
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -407,96 +1277,341 @@ def get_voices():
 @limiter.limit("5 per minute")  # Rate limit: 5 requests per minute per user/IP
 def generate_speech():
     try:
-        data = request.json
-        text = data.get('text', '')
-        voice = data.get('voice', 'alloy')
-        service = data.get('service', 'openai')
-        speed = data.get('speed', 1.0)
-
-        logger.info(f"📝 Request received - Service: {service}, Voice: {voice}, Speed: {speed}x, Text length: {len(text)}")
-
-        # Input validation
-        if not text:
-            return jsonify({'error': 'No text provided'}), 400
+        data = request.json or {}
+        logger.info(f"📝 Request received - Service: {data.get('service')}, Voice: {data.get('voice')}, "
+                    f"Speed: {data.get('speed')}x, Text length: {len(data.get('text') or '')}")
+        params, error = validate_speech_request(data)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+        quota_error = charge_quota(len(params['text']))
+        if quota_error:
+            return quota_error
+        voice = params['voice']
+
+        with count_incremental(params) as counts, meter_provider_characters() as meter:
+            filepath, cached = synthesize_cached(params)
+        settle_quota(meter)
+        record_history(current_owner_id(), params, filepath)
+        result = {'success': True, 'audio_url': f'/audio/{filepath.name}', 'filename': filepath.name}
+        if counts is not None:
+            result['incremental'] = incremental_summary(counts)
+        if cached:
+            logger.info(f"♻️  Serving cached synthesis {filepath.stem[:12]} (voice: {voice})")
+            result['cached'] = True
+
+        return jsonify(result)
+    except SynthesisError as e:
+        refund_quota()
+        logger.error(f"❌ {e}")
+        return jsonify({'error': str(e)}), e.status_code
+    except SingleFlightTimeout:
+        refund_quota()
+        logger.warning("⏳ Gave up waiting for an identical in-flight synthesis")
+        return jsonify({'error': 'An identical request is still being processed. Please try again shortly.'}), 503
+    except Exception as e:
+        refund_quota()
+        logger.error(f"Error in generate_speech: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
 
-        max_len = app.config['MAX_TEXT_LENGTH']
-        if len(text) > max_len:
-            return jsonify({'error': f'Text too long. Maximum {max_len} characters allowed.'}), 400
+@app.route('/generate-speech/stream', methods=['POST'])
+@conditional_login_required
+@limiter.limit("5 per minute")  # Shares the budget of /generate-speech
+def generate_speech_stream():
+    """Stream provider audio to the client while writing it to AUDIO_DIR"""
+    release = ExitStack()
+    try:
+        data = request.json or {}
+        logger.info(f"📝 Request received - Service: {data.get('service')}, Voice: {data.get('voice')}, "
+                    f"Speed: {data.get('speed')}x, Text length: {len(data.get('text') or '')}")
+        params, error = validate_stream_request(data)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+        quota_error = charge_quota(len(params['text']))
+        if quota_error:
+            return quota_error
+        owner_id = current_owner_id()
+
+        if stretches_locally(params):
+            # A speed variant is stretched from the 1.0x rendering and served whole
+            with meter_provider_characters() as meter:
+                filepath, _ = synthesize_cached(params)
+            settle_quota(meter)
+            record_history(owner_id, params, filepath)
+            response = send_audio(filepath, 'audio/mpeg')
+            response.headers['X-Audio-Filename'] = filepath.name
+            return response
+        # Other streams come straight from the provider at the requested speed
+        params['speed_mode'] = 'provider'
+
+        if app.config['SYNTHESIS_CACHE_ENABLED']:
+            cache_key = get_cache_key(params)
+            cached_path = synthesis_cache.get(cache_key, 'mp3')
+            if not cached_path:
+                release.enter_context(single_flight.lock(f"{cache_key}.mp3"))
+                cached_path = synthesis_cache.get(cache_key, 'mp3', count_miss=False)
+            if cached_path:
+                release.close()
+                refund_quota()
+                record_history(owner_id, params, cached_path)
+                response = send_audio(cached_path, 'audio/mpeg')
+                response.headers['X-Audio-Filename'] = cached_path.name
+                return response
+            filename = synthesis_cache.path_for(cache_key, 'mp3').name
+            tmp_path = synthesis_cache.temp_path(cache_key)
+        else:
+            cache_key = None
+            filename = f"{uuid.uuid4()}.mp3"
+            tmp_path = AUDIO_DIR / f".{filename}.part"
 
-        if service not in ['openai', 'speech']:
-            return jsonify({'error': 'Invalid service selection'}), 400
+        if params['incremental']:
+            chunks = stream_incremental(params['service'], params['voice'], params['speed'], params['text'])
+        else:
+            chunks = stream_synthesis(params['service'], params['voice'], params['speed'], params['text'])
+        # Fail with a JSON error if the provider rejects the request before any audio is sent
+        with count_incremental(params) as counts, meter_provider_characters() as meter:
+            first = next(chunks, b'')
+        settle_quota(meter)
+        # The body is streamed after the request context is gone
+        quota_charge = g.get('quota_charge')
+
+        def generate() -> Iterator[bytes]:
+            completed = False
+            try:
+                with open(tmp_path, 'wb') as audio_file:
+                    audio_file.write(first)
+                    yield first
+                    for chunk in chunks:
+                        audio_file.write(chunk)
+                        yield chunk
+                if cache_key:
+                    synthesis_cache.put(cache_key, tmp_path, 'mp3')
+                else:
+                    os.replace(tmp_path, AUDIO_DIR / filename)
+                    register_audio_file(AUDIO_DIR / filename)
+                completed = True
+                record_history(owner_id, params, AUDIO_DIR / filename)
+            except Exception as e:
+                logger.error(f"❌ Streaming synthesis aborted: {e}")
+                if quota_charge:
+                    refund_quota(quota_charge)
+            finally:
+                chunks.close()
+                if not completed and tmp_path.exists():
+                    tmp_path.unlink()
+                release.close()
+
+        response = Response(generate(), mimetype='audio/mpeg')
+        response.headers['X-Audio-Filename'] = filename
+        response.headers['Cache-Control'] = 'no-store'
+        if counts is not None:
+            summary = incremental_summary(counts)
+            response.headers['X-Sentences-Reused'] = str(summary['reused'])
+            response.headers['X-Sentences-Synthesized'] = str(summary['synthesized'])
+        # Release the provider stream and lock even if the body is never iterated
+        response.call_on_close(chunks.close)
+        response.call_on_close(release.close)
+        return response
+    except SynthesisError as e:
+        release.close()
+        refund_quota()
+        logger.error(f"❌ {e}")
+        return jsonify({'error': str(e)}), e.status_code
+    except SingleFlightTimeout:
+        refund_quota()
+        logger.warning("⏳ Gave up waiting for an identical in-flight synthesis")
+        return jsonify({'error': 'An identical request is still being processed. Please try again shortly.'}), 503
+    except Exception as e:
+        release.close()
+        refund_quota()
+        logger.error(f"Error in generate_speech_stream: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
 
-        if not (0.25 <= speed <= 4.0):
-            return jsonify({'error': 'Invalid speed value. Must be between 0.25 and 4.0'}), 400
+def current_owner_id() -> Optional[str]:
+    """Return the id of the logged-in user, or None when authentication is disabled"""
+    if app.config['REQUIRE_AUTHENTICATION'] and current_user.is_authenticated:
+        return str(current_user.id)
+    return None
 
-        filename = f"{uuid.uuid4()}.mp3"
-        filepath = AUDIO_DIR / filename
+@app.route('/jobs', methods=['POST'])
+@conditional_login_required
+@limiter.limit("10 per hour")
+def create_job():
+    """Queue a list of synthesis items for background processing"""
+    try:
+        items = (request.json or {}).get('items')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'No items provided'}), 400
+
+        max_items = app.config['JOB_MAX_ITEMS']
+        if len(items) > max_items:
+            return jsonify({'error': f'Too many items. Maximum {max_items} items per job.'}), 400
+
+        validated = []
+        for position, item in enumerate(items):
+            # Dialogue scripts can't be named or archived per item
+            params, error = validate_speech_request(item if isinstance(item, dict) else None, allow_segments=False)
+            if error:
+                return jsonify({'error': f'Item {position + 1}: {error[0]}'}), error[1]
+            validated.append(params)
+
+        quota_error = charge_quota(sum(len(params['text']) for params in validated))
+        if quota_error:
+            return quota_error
+
+        charge = g.get('quota_charge')
+        job_id = job_store.create_job(current_owner_id(), validated, quota_buckets=charge[0] if charge else None)
+        # From here on the runner settles the charge item by item
+        g.pop('quota_charge', None)
+        job_runner.notify()
+        logger.info(f"📋 Job {job_id} queued with {len(validated)} item(s)")
+        return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'}), 202
+    except Exception as e:
+        refund_quota()
+        logger.error(f"Error in create_job: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
 
-        if service == 'speech':
-            if not AZURE_SPEECH_KEY or not AZURE_SPEECH_REGION:
-                return jsonify({'error': 'Azure Speech Service is not configured.'}), 503
-
-            speech_url = f"https://{AZURE_SPEECH_REGION}.tts.speech.microsoft.com/cognitiveservices/v1"
-            headers = {
-                'Ocp-Apim-Subscription-Key': AZURE_SPEECH_KEY,
-                'Content-Type': 'application/ssml+xml',
-                'X-Microsoft-OutputFormat': 'audio-24khz-96kbitrate-mono-mp3',
-                'User-Agent': 'TTSApp'
-            }
-            rate_percent = max(-50, min(100, int((speed - 1.0) * 100)))
-            rate_str = f"+{rate_percent}%" if rate_percent > 0 else f"{rate_percent}%"
-            safe_text = html.escape(text)
-            ssml = f"""<speak version='1.0' xml:lang='en-US'>
-                <voice xml:lang='en-US' name='{voice}'><prosody rate='{rate_str}'>{safe_text}</prosody></voice>
-            </speak>"""
+def get_owned_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Return a job if it exists and belongs to the current user"""
+    if not re.match(r'^[a-f0-9]{32}$', job_id):
+        return None
+    job = job_store.get_job(job_id)
+    if not job or job['owner_id'] != current_owner_id():
+        return None
+    return job
 
-            try:
-                response = requests.post(speech_url, headers=headers, data=ssml.encode('utf-8'), timeout=30)
-                if response.status_code == 200:
-                    with open(filepath, 'wb') as audio_file:
-                        audio_file.write(response.content)
-                    logger.info(f"✅ Speech synthesized with Azure Speech Service (voice: {voice})")
-                else:
-                    error_msg = f"Azure Speech Service error: {response.status_code} - {response.text}"
-                    logger.error(f"❌ {error_msg}")
-                    return jsonify({'error': error_msg}), 500
-            except Exception as e:
-                error_msg = f"Failed to connect to Azure Speech Service: {str(e)}"
-                logger.error(f"❌ {error_msg}")
-                return jsonify({'error': error_msg}), 500
-        else:
-            if not client:
-                return jsonify({'error': 'Azure OpenAI is not configured.'}), 503
+@app.route('/jobs/<job_id>', methods=['GET'])
+@conditional_login_required
+def get_job_status(job_id):
+    """Report the progress of a bulk synthesis job"""
+    try:
+        job = get_owned_job(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        del job['owner_id']
+        if job['status'] in ('completed', 'completed_with_errors'):
+            job['download_url'] = f'/jobs/{job_id}/download'
+        return jsonify(job)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-            response = client.audio.speech.create(
-                model=app.config['AZURE_OPENAI_MODEL'],
-                voice=voice,
-                input=text,
-                speed=speed
-            )
-            response.stream_to_file(str(filepath))
-            logger.info(f"✅ Speech synthesized with OpenAI TTS (voice: {voice})")
+@app.route('/jobs/<job_id>/download', methods=['GET'])
+@conditional_login_required
+def download_job(job_id):
+    """Download the audio of a finished job as a ZIP archive"""
+    try:
+        job = get_owned_job(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        archive = job_runner.archive_path(job_id)
+        if job['status'] == 'failed':
+            return jsonify({'error': 'The archive of this job could not be built'}), 410
+        if job['status'] not in ('completed', 'completed_with_errors') or not archive.exists():
+            return jsonify({'error': 'Job is not finished yet'}), 409
+        return send_file(archive, mimetype='application/zip', as_attachment=True, download_name=f'tts-job-{job_id}.zip')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        cleanup_old_audio_files()
+def history_item(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a history entry as sent to its owner, with an audio URL while the file still exists"""
+    available = (AUDIO_DIR / entry['filename']).exists()
+    item = {key: entry[key] for key in ('id', 'created_at', 'text_preview', 'text_hash', 'voice', 'service',
+                                        'speed', 'format', 'size', 'duration')}
+    item['available'] = available
+    if available:
+        item['audio_url'] = f"/audio/{entry['filename']}"
+        item['filename'] = entry['filename']
+    return item
+
+@app.route('/history', methods=['GET'])
+@conditional_login_required
+def get_history():
+    """List the current user's syntheses, newest first; pass ?cursor=<next_cursor> for the next page"""
+    try:
+        try:
+            limit = min(max(int(request.args.get('limit', app.config['HISTORY_PAGE_SIZE'])), 1), 100)
+        except ValueError:
+            return jsonify({'error': 'Invalid limit'}), 400
+        before = None
+        if request.args.get('cursor'):
+            before = decode_cursor(request.args['cursor'])
+            if not before:
+                return jsonify({'error': 'Invalid cursor'}), 400
+        entries, next_cursor = history.list(current_owner_id(), limit, before)
+        return jsonify({'items': [history_item(entry) for entry in entries], 'next_cursor': next_cursor})
+    except Exception as e:
+        logger.error(f"Error in get_history: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
 
-        return jsonify({'success': True, 'audio_url': f'/audio/{filename}', 'filename': filename})
+@app.route('/history/<entry_id>/replay', methods=['POST'])
+@conditional_login_required
+def replay_history(entry_id):
+    """Play a history entry again from its stored audio, without calling a provider"""
+    try:
+        entry = history.get(current_owner_id(), entry_id) if re.match(r'^[a-f0-9]{32}$', entry_id) else None
+        if not entry:
+            return jsonify({'error': 'History entry not found'}), 404
+        filepath = AUDIO_DIR / entry['filename']
+        if not filepath.exists():
+            return jsonify({'error': 'The audio for this entry has expired. Please generate it again.'}), 410
+        # Count the replay as a use, so the janitor keeps the file as long as fresh audio
+        register_audio_file(filepath)
+        logger.info(f"🔁 Replaying history entry {entry_id[:12]} from {filepath.name}")
+        return jsonify({'success': True, 'audio_url': f'/audio/{filepath.name}', 'filename': filepath.name,
+                        'cached': True})
     except Exception as e:
-        logger.error(f"Error in generate_speech: {e}", exc_info=True)
+        logger.error(f"Error in replay_history: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def prometheus_metrics():
+    """Expose Prometheus metrics aggregated across all workers"""
+    token = app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route('/cache-stats', methods=['GET'])
+@conditional_login_required
+def cache_stats():
+    """Report synthesis cache hit/miss counters for this worker"""
+    return jsonify({**synthesis_cache.stats(), 'coalescing': single_flight.stats(),
+                    'transcoding': transcoder.stats(), 'providers': provider_router.stats(),
+                    'voices': voice_catalog.stats()})
+
+def send_audio(path: Path, mimetype: str, as_attachment: bool = False) -> Response:
+    """Send a finished audio file with Range/ETag support and immutable caching headers"""
+    if app.config['AUDIO_ACCEL_REDIRECT_ENABLED']:
+        # nginx serves the file (including Range and conditional requests) from its internal location
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f"{app.config['AUDIO_ACCEL_REDIRECT_PREFIX'].rstrip('/')}/{path.name}"
+        if as_attachment:
+            response.headers['Content-Disposition'] = f'attachment; filename="{path.name}"'
+    else:
+        response = send_file(path, mimetype=mimetype, as_attachment=as_attachment, conditional=True, etag=True)
+        # Werkzeug only advertises ranges on 206s; players need it up front to allow seeking
+        response.headers.setdefault('Accept-Ranges', 'bytes')
+        metrics.AUDIO_BYTES_SERVED.labels('download' if as_attachment else 'audio').inc(response.content_length or 0)
+    # Audio files never change once written, so browsers may reuse them without revalidating
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config['AUDIO_CACHE_MAX_AGE_SECONDS']
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/audio/<filename>')
 @conditional_login_required
 def serve_audio(filename):
     """Serve audio files from data directory"""
     try:
-        if not re.match(r'^[a-f0-9\-]+\.mp3$', filename):
+        if not AUDIO_FILENAME_PATTERN.match(filename):
             return jsonify({'error': 'Invalid filename'}), 400
 
         filepath = AUDIO_DIR / filename
         if not filepath.exists():
             return jsonify({'error': 'File not found'}), 404
 
-        return send_file(filepath, mimetype='audio/mpeg')
+        return send_audio(filepath, format_for_extension(filepath.suffix).mimetype)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -504,30 +1619,69 @@ def serve_audio(filename):
 @conditional_login_required
 def download_file(filename):
     try:
-        if not re.match(r'^[a-f0-9\-]+\.mp3$', filename):
+        if not AUDIO_FILENAME_PATTERN.match(filename):
             return jsonify({'error': 'Invalid filename'}), 400
 
         filepath = AUDIO_DIR / filename
         if not filepath.exists():
             return jsonify({'error': 'File not found'}), 404
 
-        fmt = request.args.get('format', 'mp3').lower()
-        if fmt == 'mp3':
-            return send_file(filepath, as_attachment=True)
-        elif fmt == 'wav':
-            stem = filepath.stem
-            wav_path = AUDIO_DIR / f"{stem}.wav"
-            if not wav_path.exists():
-                try:
-                    subprocess.run(
-                        ['ffmpeg', '-y', '-i', str(filepath), '-ar', '24000', '-ac', '1', str(wav_path)],
-                        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-                    )
-                except subprocess.CalledProcessError:
-                    return jsonify({'error': 'Failed to convert to WAV'}), 500
-            return send_file(wav_path, as_attachment=True)
-        else:
+        fmt = request.args.get('format', format_for_extension(filepath.suffix).name).lower()
+        if fmt == 'ogg':
+            fmt = 'opus'
+        if fmt not in OUTPUT_FORMATS:
             return jsonify({'error': 'Unsupported format'}), 400
+
+        # Variants of one synthesis share its ID and differ only by extension
+        target = AUDIO_DIR / f"{filepath.stem}.{OUTPUT_FORMATS[fmt].extension}"
+        mimetype = OUTPUT_FORMATS[fmt].mimetype
+        if target.exists():
+            return send_audio(target, mimetype, as_attachment=True)
+
+        # Concurrent downloads of the same variant share one conversion
+        release = ExitStack()
+        try:
+            release.enter_context(single_flight.lock(target.name))
+            if target.exists():
+                release.close()
+                return send_audio(target, mimetype, as_attachment=True)
+            variants = [AUDIO_DIR / f"{filepath.stem}.{OUTPUT_FORMATS[name].extension}" for name in SOURCE_PREFERENCE]
+            source = next((path for path in variants if path.exists()), filepath)
+            chunks = transcoder.stream(source, target, fmt)
+            # Wait for a transcoding slot and the first bytes before committing to a 200
+            first = next(chunks, b'')
+        except SingleFlightTimeout:
+            return jsonify({'error': 'This file is still being converted. Please try again shortly.'}), 503
+        except TranscoderBusy:
+            release.close()
+            return jsonify({'error': 'The server is busy converting audio. Please try again shortly.'}), 503
+        except TranscodeError as e:
+            release.close()
+            return jsonify({'error': str(e)}), 500
+        except BaseException:
+            release.close()
+            raise
+
+        def generate() -> Iterator[bytes]:
+            try:
+                yield first
+                metrics.AUDIO_BYTES_SERVED.labels('download').inc(len(first))
+                for chunk in chunks:
+                    yield chunk
+                    metrics.AUDIO_BYTES_SERVED.labels('download').inc(len(chunk))
+                register_audio_file(target)
+            except TranscodeError as e:
+                logger.error(f"❌ {e}")
+            finally:
+                chunks.close()
+                release.close()
+
+        response = Response(generate(), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="{target.name}"'
+        # Release the ffmpeg process and lock even if the body is never iterated
+        response.call_on_close(chunks.close)
+        response.call_on_close(release.close)
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
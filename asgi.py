@@ -0,0 +1,588 @@
+"""
+ASGI entry point for the asyncio serving mode.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 2
+
+POST /generate-speech and /generate-speech/stream are served by async handlers
+that await Azure Speech and Azure OpenAI through httpx.AsyncClient and
+AsyncAzureOpenAI, so a slow synthesis holds a coroutine instead of a worker and
+hundreds of them can be in flight in one process. Login, validation, rate
+limits and quotas still run through the Flask app, briefly, on a thread. Every
+other route is the unchanged Flask app behind a2wsgi's thread pool, and
+wsgi:app remains the entry point for gunicorn deployments.
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import AsyncExitStack, asynccontextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from flask import g, jsonify, request
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+from werkzeug.wrappers import Response
+
+import app as tts
+import metrics
+from app import app, SynthesisError
+from audio_formats import OUTPUT_FORMATS, provider_format
+from mp3 import join_segments
+from provider_router import Backend, ProviderError
+from text_chunker import split_text
+
+if TYPE_CHECKING:
+    from openai import AsyncAzureOpenAI
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class AsyncProviders:
+    """Async provider clients for the serving event loop, built on first use"""
+
+    def __init__(self):
+        self._http: Optional[httpx.AsyncClient] = None
+        self._openai: Dict[str, 'AsyncAzureOpenAI'] = {}
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = tts.http_pool.new_async_client(app.config['ASYNC_MAX_PROVIDER_REQUESTS'])
+        return self._http
+
+    def openai(self, backend: Backend) -> 'AsyncAzureOpenAI':
+        """Return the async client for one Azure OpenAI deployment"""
+        if backend.name not in self._openai:
+            from openai import AsyncAzureOpenAI
+            self._openai[backend.name] = AsyncAzureOpenAI(
+                api_key=backend.config.get('key', tts.AZURE_API_KEY),
+                api_version=tts.AZURE_API_VERSION,
+                azure_endpoint=backend.config.get('endpoint', tts.AZURE_ENDPOINT),
+                timeout=app.config['AZURE_OPENAI_TIMEOUT'],
+                http_client=tts.http_pool.new_async_client(app.config['ASYNC_MAX_PROVIDER_REQUESTS']),
+                max_retries=0,
+            )
+        return self._openai[backend.name]
+
+    def limit(self, service: str) -> asyncio.Semaphore:
+        """Bound concurrent provider calls per service in this process"""
+        if service not in self._limits:
+            self._limits[service] = asyncio.Semaphore(app.config['ASYNC_MAX_PROVIDER_REQUESTS'])
+        return self._limits[service]
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+        for openai_client in self._openai.values():
+            await openai_client.close()
+        self._http = None
+        self._openai = {}
+        self._limits = {}
+
+
+providers = AsyncProviders()
+# Identical syntheses in flight in this process, keyed by output filename
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+async def astream_backend(backend: Backend, voice: str, speed: float, text: str, fmt: str) -> AsyncIterator[bytes]:
+    """Yield audio from one backend, raising ProviderError on failure"""
+    async with providers.limit(backend.service):
+        if backend.service == 'speech':
+            speech_url, headers, body = tts.speech_request(voice, speed, text, fmt, backend)
+            try:
+                async with providers.http().stream('POST', speech_url, headers=headers, content=body) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise tts.speech_status_error(response.status_code, response.text, response.headers)
+                    async for chunk in response.aiter_bytes(tts.STREAM_CHUNK_SIZE):
+                        yield chunk
+            except httpx.HTTPError as e:
+                raise tts.connection_error('Azure Speech Service', e)
+        else:
+            import openai
+            try:
+                async with providers.openai(backend).audio.speech.with_streaming_response.create(
+                    model=backend.config.get('model', app.config['AZURE_OPENAI_MODEL']),
+                    voice=voice,
+                    input=text,
+                    speed=speed,
+                    response_format=provider_format('openai', fmt)
+                ) as response:
+                    async for chunk in response.iter_bytes(tts.STREAM_CHUNK_SIZE):
+                        yield chunk
+            except openai.APIStatusError as e:
+                raise tts.openai_status_error(e)
+            except (openai.APIConnectionError, httpx.HTTPError) as e:
+                raise tts.connection_error('Azure OpenAI', e)
+
+
+async def astream_provider(service: str, voice: str, speed: float, text: str, fmt: str = 'mp3') -> AsyncIterator[bytes]:
+    """Yield audio in a provider-native format from the selected provider as it arrives"""
+    async def attempt(backend: Backend) -> Tuple[Backend, bytes, AsyncIterator[bytes]]:
+        chunks = astream_backend(backend, voice, speed, text, fmt)
+        try:
+            return backend, await chunks.__anext__(), chunks
+        except StopAsyncIteration:
+            return backend, b'', chunks
+        except BaseException:
+            # Also runs when the losing leg of a hedge is cancelled
+            await chunks.aclose()
+            raise
+
+    async def discard(result: Tuple[Backend, bytes, AsyncIterator[bytes]]) -> None:
+        await result[2].aclose()
+
+    with metrics.observe_provider_call(service, voice, len(text)) as observed:
+        try:
+            backend, first, chunks = await tts.provider_router.acall(service, len(text), attempt, discard)
+        except ProviderError as e:
+            raise tts.provider_failure(e)
+        observed['first_byte'] = time.perf_counter()
+        try:
+            yield first
+            observed['bytes'] += len(first)
+            async for chunk in chunks:
+                yield chunk
+                observed['bytes'] += len(chunk)
+        except ProviderError as e:
+            tts.provider_router.record_failure(backend)
+            raise tts.provider_failure(e)
+        finally:
+            await chunks.aclose()
+    if service == 'speech':
+        logger.info(f"✅ Speech synthesized with Azure Speech Service (voice: {voice}, backend: {backend.name})")
+    else:
+        logger.info(f"✅ Speech synthesized with OpenAI TTS (voice: {voice}, backend: {backend.name})")
+
+
+async def asynthesize_segment(service: str, voice: str, speed: float, text: str) -> bytes:
+    """Synthesize one chunk of text and return the complete MP3"""
+    return b''.join([chunk async for chunk in astream_provider(service, voice, speed, text)])
+
+
+async def astream_synthesis(service: str, voice: str, speed: float, text: str, fmt: str = 'mp3') -> AsyncIterator[bytes]:
+    """Yield audio for text, synthesizing long texts as concurrent MP3 chunks"""
+    tts.count_provider_characters(len(text))
+    max_chars = tts.chunk_size_for(service)
+    if len(text) <= max_chars:
+        async for chunk in astream_provider(service, voice, speed, text, fmt):
+            yield chunk
+        return
+
+    chunks = split_text(text, max_chars)
+    logger.info(f"✂️  Synthesizing {len(chunks)} chunks concurrently ({service})")
+    tasks = [asyncio.ensure_future(asynthesize_segment(service, voice, speed, chunk)) for chunk in chunks]
+    try:
+        # Segments are emitted in order as soon as each one and its predecessors are done
+        for task in tasks:
+            for frames in join_segments([await task]):
+                yield frames
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def aiterate(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """Iterate a blocking generator from worker threads"""
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        await asyncio.to_thread(chunks.close)
+
+
+async def asynthesize_to_file(params: Dict[str, Any], filepath: Path) -> None:
+    """Synthesize params natively and write the audio to filepath"""
+    chunks = astream_synthesis(params['service'], params['voice'], params['speed'], params['text'], params['format'])
+    try:
+        # Pull the first chunk before creating the file so provider errors leave nothing behind
+        first = await anext(chunks, b'')
+        with open(filepath, 'wb') as audio_file:
+            audio_file.write(first)
+            async for chunk in chunks:
+                audio_file.write(chunk)
+    finally:
+        await chunks.aclose()
+
+
+@asynccontextmanager
+async def single_flight(name: str) -> AsyncIterator[bool]:
+    """Hold the cross-process single-flight lock for name without blocking the event loop"""
+    lock = tts.single_flight.lock(name)
+    acquiring = asyncio.ensure_future(asyncio.to_thread(lock.__enter__))
+    try:
+        waited = await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        # The thread goes on waiting for the lock; release it as soon as it is taken
+        acquiring.add_done_callback(
+            lambda done: done.cancelled() or done.exception() or lock.__exit__(None, None, None))
+        raise
+    try:
+        yield waited
+    finally:
+        await asyncio.to_thread(lock.__exit__, None, None, None)
+
+
+async def asynthesize_cached(params: Dict[str, Any]) -> Tuple[Path, bool]:
+    """Return (path, cached) for validated params, synthesizing on a cache miss"""
+    if not tts.is_native_output(params):
+        # Transcoded formats and dialogue scripts go through the thread-based pipeline
+        return await asyncio.to_thread(tts.synthesize_cached, params)
+
+    extension = OUTPUT_FORMATS[params['format']].extension
+    if not app.config['SYNTHESIS_CACHE_ENABLED']:
+        filepath = tts.AUDIO_DIR / f"{uuid.uuid4()}.{extension}"
+        await asynthesize_to_file(params, filepath)
+        await asyncio.to_thread(tts.register_audio_file, filepath)
+        return filepath, False
+
+    cache_key = tts.get_cache_key(params)
+    cached_path = await asyncio.to_thread(tts.synthesis_cache.get, cache_key, extension)
+    if cached_path:
+        return cached_path, True
+
+    name = f"{cache_key}.{extension}"
+    pending = _inflight.get(name)
+    if pending is not None:
+        logger.info(f"🔗 Coalesced with in-flight synthesis {cache_key[:12]}")
+        return await asyncio.shield(pending), True
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[name] = future
+    try:
+        # Other worker processes synthesizing the same audio hold this lock
+        async with single_flight(name) as waited:
+            cached_path = await asyncio.to_thread(tts.synthesis_cache.get, cache_key, extension, count_miss=False)
+            if cached_path:
+                if waited:
+                    logger.info(f"🔗 Coalesced with in-flight synthesis {cache_key[:12]}")
+                future.set_result(cached_path)
+                return cached_path, True
+            filepath = tts.synthesis_cache.temp_path(cache_key)
+            try:
+                await asynthesize_to_file(params, filepath)
+                path = await asyncio.to_thread(tts.synthesis_cache.put, cache_key, filepath, extension)
+            finally:
+                if filepath.exists():
+                    filepath.unlink()
+        future.set_result(path)
+        return path, False
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # Waiters re-raise it; don't log it as unretrieved
+        raise
+    finally:
+        _inflight.pop(name, None)
+
+
+# --- Flask bridge ---
+
+def build_environ(scope: Dict[str, Any], body: bytes) -> Dict[str, Any]:
+    """Build a WSGI environ for an ASGI HTTP scope"""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'SERVER_NAME': scope['server'][0] if scope.get('server') else 'localhost',
+        'SERVER_PORT': str(scope['server'][1]) if scope.get('server') else '80',
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f"HTTP_{key}"
+        value = value.decode('latin1')
+        environ[key] = f"{environ[key]},{value}" if key in environ and key.startswith('HTTP_') else value
+    return environ
+
+
+def prepare_synthesis(environ: Dict[str, Any],
+                      stream: bool = False) -> Tuple[Optional[Response], Optional[Dict[str, Any]]]:
+    """Authorize, validate and charge a synthesis request in Flask.
+
+    Returns (response, None) if the request is answered here, else (None, state)
+    with the validated params and the quota charge to carry into finish_response.
+    """
+    with app.request_context(environ):
+        try:
+            rv = app.preprocess_request()
+            if rv is None and app.config['REQUIRE_AUTHENTICATION'] and not current_user.is_authenticated:
+                rv = app.login_manager.unauthorized()
+            if rv is None:
+                data = request.get_json(silent=True) or {}
+                logger.info(f"📝 Request received - Service: {data.get('service')}, Voice: {data.get('voice')}, "
+                            f"Speed: {data.get('speed')}x, Text length: {len(data.get('text') or '')}")
+                params, error = tts.validate_stream_request(data) if stream else tts.validate_speech_request(data)
+                if error:
+                    rv = jsonify({'error': error[0]}), error[1]
+                else:
+                    rv = tts.charge_quota(len(params['text']))
+                    if rv is None:
+                        return None, {'params': params, 'quota': g.get('quota'), 'quota_charge': g.get('quota_charge'),
+                                      'owner_id': tts.current_owner_id()}
+        except HTTPException as e:
+            rv = app.handle_user_exception(e)
+        except Exception as e:
+            logger.error(f"Error preparing synthesis: {e}", exc_info=True)
+            rv = jsonify({'error': str(e)}), 500
+        return app.process_response(app.make_response(rv)), None
+
+
+def finish_response(environ: Dict[str, Any], state: Dict[str, Any], build: Callable[[], Any]) -> Response:
+    """Build the final response in Flask so after_request hooks and quota headers apply"""
+    with app.request_context(environ):
+        g.quota = state['quota']
+        if state['quota_charge']:
+            g.quota_charge = state['quota_charge']
+        try:
+            rv = build()
+        except Exception as e:
+            logger.error(f"Error building response: {e}", exc_info=True)
+            rv = jsonify({'error': str(e)}), 500
+        # Later steps, like refunding an aborted stream, see what build() refunded
+        state['quota'], state['quota_charge'] = g.get('quota'), g.get('quota_charge')
+        return app.process_response(app.make_response(rv))
+
+
+def error_response(error: BaseException) -> Any:
+    """Translate a synthesis failure into the JSON error the sync routes return"""
+    tts.refund_quota()
+    if isinstance(error, SynthesisError):
+        logger.error(f"❌ {error}")
+        return jsonify({'error': str(error)}), error.status_code
+    if isinstance(error, tts.SingleFlightTimeout):
+        return jsonify({'error': 'An identical request is still being processed. Please try again shortly.'}), 503
+    logger.error(f"Error in async synthesis: {error}", exc_info=error)
+    return jsonify({'error': str(error)}), 500
+
+
+def _raw_headers(response: Response, skip: Tuple[str, ...] = ()) -> List[Tuple[bytes, bytes]]:
+    return [(name.lower().encode('latin1'), value.encode('latin1'))
+            for name, value in response.headers.items() if name.lower() not in skip]
+
+
+async def send_response(response: Response, send: Callable) -> None:
+    """Send a finished werkzeug response, reading streamed bodies off the event loop"""
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': _raw_headers(response)})
+    try:
+        if not response.is_streamed:
+            await send({'type': 'http.response.body', 'body': response.get_data()})
+            return
+        body = iter(response.iter_encoded())
+        while True:
+            chunk = await asyncio.to_thread(next, body, None)
+            if chunk is None:
+                break
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        response.close()
+
+
+async def read_body(receive: Callable) -> bytes:
+    body = bytearray()
+    while True:
+        message = await receive()
+        body.extend(message.get('body', b''))
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+# --- Async routes ---
+
+async def generate_speech(scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+    environ = build_environ(scope, await read_body(receive))
+    response, state = await asyncio.to_thread(prepare_synthesis, environ)
+    if response is None:
+        try:
+            with tts.count_incremental(state['params']) as counts, tts.meter_provider_characters() as meter:
+                filepath, cached = await asynthesize_cached(state['params'])
+            tts.record_history(state['owner_id'], state['params'], filepath)
+            if cached:
+                logger.info(f"♻️  Serving cached synthesis {filepath.stem[:12]} (voice: {state['params']['voice']})")
+
+            def build() -> Any:
+                tts.settle_quota(meter)
+                result = {'success': True, 'audio_url': f'/audio/{filepath.name}', 'filename': filepath.name}
+                if counts is not None:
+                    result['incremental'] = tts.incremental_summary(counts)
+                if cached:
+                    result['cached'] = True
+                return jsonify(result)
+        except Exception as e:
+            error = e
+
+            def build() -> Any:
+                return error_response(error)
+        response = await asyncio.to_thread(finish_response, environ, state, build)
+    await send_response(response, send)
+
+
+async def generate_speech_stream(scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+    environ = build_environ(scope, await read_body(receive))
+    response, state = await asyncio.to_thread(prepare_synthesis, environ, True)
+    if response is not None:
+        return await send_response(response, send)
+
+    params = state['params']
+    if tts.stretches_locally(params):
+        # A speed variant is stretched from the 1.0x rendering and served whole
+        try:
+            with tts.meter_provider_characters() as meter:
+                filepath, _ = await asynthesize_cached(params)
+            tts.record_history(state['owner_id'], params, filepath)
+
+            def build() -> Any:
+                tts.settle_quota(meter)
+                variant_response = tts.send_audio(filepath, 'audio/mpeg')
+                variant_response.headers['X-Audio-Filename'] = filepath.name
+                return variant_response
+        except Exception as e:
+            error = e
+
+            def build() -> Any:
+                return error_response(error)
+        return await send_response(await asyncio.to_thread(finish_response, environ, state, build), send)
+    # Other streams come straight from the provider at the requested speed
+    params['speed_mode'] = 'provider'
+    cache_key = None
+    release = AsyncExitStack()
+    if app.config['SYNTHESIS_CACHE_ENABLED']:
+        cache_key = tts.get_cache_key(params)
+        pending = _inflight.get(f"{cache_key}.mp3")
+        if pending is not None:
+            await asyncio.wait([pending])
+        cached_path = await asyncio.to_thread(tts.synthesis_cache.get, cache_key, 'mp3')
+        if not cached_path:
+            try:
+                await release.enter_async_context(single_flight(f"{cache_key}.mp3"))
+            except tts.SingleFlightTimeout as e:
+                error = e
+                return await send_response(
+                    await asyncio.to_thread(finish_response, environ, state, lambda: error_response(error)), send)
+            cached_path = await asyncio.to_thread(tts.synthesis_cache.get, cache_key, 'mp3', count_miss=False)
+        if cached_path:
+            await release.aclose()
+            tts.record_history(state['owner_id'], params, cached_path)
+
+            def build() -> Any:
+                tts.refund_quota()
+                cached_response = tts.send_audio(cached_path, 'audio/mpeg')
+                cached_response.headers['X-Audio-Filename'] = cached_path.name
+                return cached_response
+            return await send_response(await asyncio.to_thread(finish_response, environ, state, build), send)
+        filename = tts.synthesis_cache.path_for(cache_key, 'mp3').name
+        tmp_path = tts.synthesis_cache.temp_path(cache_key)
+    else:
+        filename = f"{uuid.uuid4()}.mp3"
+        tmp_path = tts.AUDIO_DIR / f".{filename}.part"
+
+    if params['incremental']:
+        # Cached sentences are read and the rest synthesized on the thread-based pipeline
+        chunks = aiterate(tts.stream_incremental(params['service'], params['voice'], params['speed'], params['text']))
+    else:
+        chunks = astream_synthesis(params['service'], params['voice'], params['speed'], params['text'])
+    completed = False
+    try:
+        # Fail with a JSON error if the provider rejects the request before any audio is sent
+        try:
+            with tts.count_incremental(params) as counts, tts.meter_provider_characters() as meter:
+                first = await anext(chunks, b'')
+        except Exception as e:
+            error = e
+            return await send_response(
+                await asyncio.to_thread(finish_response, environ, state, lambda: error_response(error)), send)
+
+        def build() -> Any:
+            tts.settle_quota(meter)
+            headers = Response(mimetype='audio/mpeg')
+            headers.headers['X-Audio-Filename'] = filename
+            headers.headers['Cache-Control'] = 'no-store'
+            if counts is not None:
+                summary = tts.incremental_summary(counts)
+                headers.headers['X-Sentences-Reused'] = str(summary['reused'])
+                headers.headers['X-Sentences-Synthesized'] = str(summary['synthesized'])
+            return headers
+        head = await asyncio.to_thread(finish_response, environ, state, build)
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': _raw_headers(head, skip=('content-length',))})
+
+        with open(tmp_path, 'wb') as audio_file:
+            audio_file.write(first)
+            await send({'type': 'http.response.body', 'body': first, 'more_body': True})
+            async for chunk in chunks:
+                audio_file.write(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+        if cache_key:
+            await asyncio.to_thread(tts.synthesis_cache.put, cache_key, tmp_path, 'mp3')
+        else:
+            os.replace(tmp_path, tts.AUDIO_DIR / filename)
+            await asyncio.to_thread(tts.register_audio_file, tts.AUDIO_DIR / filename)
+        completed = True
+        tts.record_history(state['owner_id'], params, tts.AUDIO_DIR / filename)
+    except Exception as e:
+        logger.error(f"❌ Streaming synthesis aborted: {e}")
+        if state['quota_charge']:
+            await asyncio.to_thread(tts.refund_quota, state['quota_charge'])
+    finally:
+        await chunks.aclose()
+        if not completed and tmp_path.exists():
+            tmp_path.unlink()
+        await release.aclose()
+
+
+ASYNC_ROUTES = {
+    ('POST', '/generate-speech'): generate_speech,
+    ('POST', '/generate-speech/stream'): generate_speech_stream,
+}
+
+# A pool of threads, so slow Flask routes don't queue behind each other
+flask_application = WSGIMiddleware(app, workers=app.config['ASGI_WSGI_THREADS'])
+
+
+async def lifespan(receive: Callable, send: Callable) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Each uvicorn worker process starts its own background threads
+            tts.start_background_services()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await providers.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+    """ASGI application: async synthesis routes, everything else through Flask"""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    handler = ASYNC_ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    if handler is None:
+        return await flask_application(scope, receive, send)
+    await handler(scope, receive, send)
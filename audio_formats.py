@@ -0,0 +1,65 @@
+"""
+Output formats the app can deliver and how each provider or ffmpeg produces them.
+"""
+from collections import namedtuple
+from pathlib import Path
+from typing import List, Optional
+
+AudioFormat = namedtuple('AudioFormat', 'name extension mimetype speech openai lossless ffmpeg_args')
+
+# speech: Azure Speech X-Microsoft-OutputFormat, openai: Azure OpenAI response_format.
+# None means the provider can't produce the format and it is transcoded instead.
+OUTPUT_FORMATS = {
+    'mp3': AudioFormat('mp3', 'mp3', 'audio/mpeg', 'audio-24khz-96kbitrate-mono-mp3', 'mp3', False,
+                       ['-c:a', 'libmp3lame', '-b:a', '96k']),
+    'opus': AudioFormat('opus', 'ogg', 'audio/ogg', 'ogg-24khz-16bit-mono-opus', 'opus', False,
+                        ['-c:a', 'libopus', '-b:a', '32k']),
+    'webm': AudioFormat('webm', 'webm', 'audio/webm', 'webm-24khz-16bit-mono-opus', None, False,
+                        ['-c:a', 'libopus', '-b:a', '32k']),
+    'wav': AudioFormat('wav', 'wav', 'audio/wav', 'riff-24khz-16bit-mono-pcm', 'wav', True,
+                       ['-c:a', 'pcm_s16le']),
+    'flac': AudioFormat('flac', 'flac', 'audio/flac', None, 'flac', True,
+                        ['-c:a', 'flac']),
+}
+
+# Lossless variants first, so transcoding starts from the best copy on disk
+SOURCE_PREFERENCE = ['wav', 'flac', 'mp3', 'opus', 'webm']
+
+EXTENSION_PATTERN = '|'.join(sorted({fmt.extension for fmt in OUTPUT_FORMATS.values()}))
+
+_BY_EXTENSION = {fmt.extension: fmt for fmt in OUTPUT_FORMATS.values()}
+
+
+def format_for_extension(extension: str) -> Optional[AudioFormat]:
+    """Return the format stored under a file extension"""
+    return _BY_EXTENSION.get(extension.lstrip('.').lower())
+
+
+def provider_format(service: str, fmt: str) -> Optional[str]:
+    """Return the provider's native identifier for a format, or None if it can't produce it"""
+    return getattr(OUTPUT_FORMATS[fmt], 'speech' if service == 'speech' else 'openai')
+
+
+# ffmpeg muxer names
+MUXERS = {'opus': 'ogg', 'wav': 'wav', 'mp3': 'mp3', 'flac': 'flac', 'webm': 'webm'}
+# Muxers that never seek back to fill in a header, so their output is complete when read from a pipe.
+# WAV (RIFF sizes), FLAC (STREAMINFO totals) and WebM (cues, duration) are only complete as files.
+PIPE_FORMATS = {'mp3', 'opus'}
+
+
+def ffmpeg_command(source: Path, target: str, fmt: str, sample_rate: int = 24000) -> List[str]:
+    """Build an ffmpeg command converting source to fmt; target may be a path or 'pipe:1'"""
+    return ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', str(source), '-ar', str(sample_rate),
+            '-ac', '1', *OUTPUT_FORMATS[fmt].ffmpeg_args, '-f', MUXERS[fmt], target]
+
+
+def ffmpeg_decode_command(source: Path, sample_rate: int = 24000) -> List[str]:
+    """Build an ffmpeg command writing source to stdout as 16-bit mono PCM"""
+    return ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', str(source), '-ar', str(sample_rate), '-ac', '1',
+            '-f', 's16le', 'pipe:1']
+
+
+def ffmpeg_encode_command(target: str, fmt: str, sample_rate: int = 24000) -> List[str]:
+    """Build an ffmpeg command encoding 16-bit mono PCM from stdin to fmt at target"""
+    return ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-f', 's16le', '-ar', str(sample_rate), '-ac', '1',
+            '-i', 'pipe:0', *OUTPUT_FORMATS[fmt].ffmpeg_args, '-f', MUXERS[fmt], target]
@@ -0,0 +1,273 @@
+"""
+Expiry index and background janitor for generated audio files.
+
+Every file written to the audio directory is recorded in a small SQLite index
+(filename, created_at, last_used, size, pinned). A single janitor thread, elected
+across gunicorn workers with a lock file, deletes expired files and enforces the
+disk budget in small batches, so requests never scan the directory. Pinned files
+(pre-rendered by warmup.py) are never evicted.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows development hosts: every process runs its own janitor
+    fcntl = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+AUDIO_SUFFIXES = ('.mp3', '.wav', '.ogg', '.webm', '.flac')
+
+# Applied in order; PRAGMA user_version records how many an index has seen
+MIGRATIONS = [
+    'ALTER TABLE audio_files ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0',
+]
+
+
+class AudioIndex:
+    """SQLite index of audio files ordered by last use"""
+
+    def __init__(self, db_file: Path):
+        self.db_file = db_file
+        self._local = threading.local()
+        self.init_db()
+
+    def get_db_connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, reopening it after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def init_db(self) -> None:
+        """Initialize the database schema"""
+        conn = self.get_db_connection()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS audio_files (
+                filename TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_audio_files_last_used ON audio_files (last_used);
+        ''')
+        self.migrate(conn)
+
+    @staticmethod
+    def migrate(conn: sqlite3.Connection) -> None:
+        """Apply schema migrations the index hasn't seen yet"""
+        # Workers start together; the write lock makes the others wait and then find nothing to do
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for i, statement in enumerate(MIGRATIONS[version:], start=version + 1):
+                conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {i}')
+                logger.info("Applied audio index migration %d", i)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def record(self, filename: str, size: int, now: Optional[float] = None) -> None:
+        """Add or refresh a file in the index"""
+        now = time.time() if now is None else now
+        self.get_db_connection().execute(
+            'INSERT INTO audio_files (filename, created_at, last_used, size) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(filename) DO UPDATE SET last_used = excluded.last_used, size = excluded.size',
+            (filename, now, now, size)
+        )
+
+    def pin(self, filenames: Iterable[str], pinned: bool = True) -> None:
+        """Exempt indexed files from expiry and the disk budget, or make them evictable again"""
+        self.get_db_connection().executemany(
+            'UPDATE audio_files SET pinned = ? WHERE filename = ?', [(int(pinned), name) for name in filenames]
+        )
+
+    def remove(self, filenames: Iterable[str]) -> None:
+        """Drop files from the index"""
+        self.get_db_connection().executemany(
+            'DELETE FROM audio_files WHERE filename = ?', [(name,) for name in filenames]
+        )
+
+    def expired(self, before: float, limit: int) -> List[str]:
+        """Return up to limit unpinned files not used since before"""
+        rows = self.get_db_connection().execute(
+            'SELECT filename FROM audio_files WHERE last_used < ? AND pinned = 0 ORDER BY last_used LIMIT ?',
+            (before, limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def least_recently_used(self, limit: int) -> List[Tuple[str, int]]:
+        """Return up to limit unpinned (filename, size) pairs, least recently used first"""
+        return self.get_db_connection().execute(
+            'SELECT filename, size FROM audio_files WHERE pinned = 0 ORDER BY last_used LIMIT ?', (limit,)
+        ).fetchall()
+
+    def known(self, filenames: List[str]) -> set:
+        """Return which of filenames are already indexed"""
+        conn = self.get_db_connection()
+        found = set()
+        for i in range(0, len(filenames), 500):
+            batch = filenames[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            found.update(row[0] for row in conn.execute(
+                f'SELECT filename FROM audio_files WHERE filename IN ({placeholders})', batch
+            ))
+        return found
+
+    def summary(self) -> Dict[str, int]:
+        """Return the number and total size of indexed files"""
+        count, total = self.get_db_connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM audio_files'
+        ).fetchone()
+        return {'files': count, 'bytes': total}
+
+
+class AudioJanitor:
+    """Deletes expired audio and enforces the disk budget from a single elected thread"""
+
+    def __init__(self, audio_dir: Path, index: AudioIndex, lock_file: Path, max_age_seconds: float,
+                 max_bytes: int, interval: float = 60.0, batch_size: int = 200,
+                 reconcile_interval: float = 3600.0):
+        self.audio_dir = audio_dir
+        self.index = index
+        self.lock_file = lock_file
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.batch_size = batch_size
+        self.reconcile_interval = reconcile_interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock_fd: Optional[int] = None
+        self._last_reconcile = 0.0
+
+    def start(self) -> None:
+        """Start the janitor thread for this process"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='audio-janitor', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Ask the janitor thread to exit after its current pass"""
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._is_leader():
+                    if time.time() - self._last_reconcile >= self.reconcile_interval:
+                        self.reconcile()
+                    self.run_once()
+            except Exception as e:
+                logger.error(f"⚠️  Error during audio cleanup: {e}")
+            self._stop.wait(self.interval)
+
+    def _is_leader(self) -> bool:
+        """Hold a lock file for the lifetime of the process so only one janitor runs"""
+        if fcntl is None or self._lock_fd is not None:
+            return True
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        logger.info(f"🧹 Audio janitor elected in process {os.getpid()}")
+        return True
+
+    def run_once(self) -> int:
+        """Delete expired files and then the least recently used files over budget"""
+        start = time.perf_counter()
+        deleted = 0
+        cutoff = time.time() - self.max_age_seconds
+        while True:
+            batch = self.index.expired(cutoff, self.batch_size)
+            if not batch:
+                break
+            deleted += self._delete(batch)
+        excess = self.index.summary()['bytes'] - self.max_bytes
+        while excess > 0:
+            batch = self.index.least_recently_used(self.batch_size)
+            if not batch:
+                break
+            victims = []
+            for name, size in batch:
+                if excess <= 0:
+                    break
+                victims.append(name)
+                excess -= size
+            deleted += self._delete(victims)
+        metrics.CLEANUP_SECONDS.observe(time.perf_counter() - start)
+        metrics.CLEANUP_FILES_DELETED.inc(deleted)
+        if deleted > 0:
+            logger.info(f"🧹 Cleaned up {deleted} old audio file(s)")
+        return deleted
+
+    def reconcile(self) -> int:
+        """Index files written outside the cache and drop stale scratch files"""
+        self._last_reconcile = time.time()
+        cutoff = time.time() - self.max_age_seconds
+        pending: List[os.DirEntry] = []
+        added = 0
+        with os.scandir(self.audio_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.part'):
+                    try:
+                        if entry.stat().st_mtime < cutoff:
+                            os.unlink(entry.path)
+                    except OSError:
+                        pass
+                elif entry.name.endswith(AUDIO_SUFFIXES) and entry.is_file():
+                    pending.append(entry)
+                    if len(pending) >= 500:
+                        added += self._index_missing(pending)
+                        pending = []
+        added += self._index_missing(pending)
+        if added:
+            logger.info(f"🗂️  Indexed {added} unindexed audio file(s)")
+        return added
+
+    def _index_missing(self, entries: List[os.DirEntry]) -> int:
+        known = self.index.known([entry.name for entry in entries])
+        added = 0
+        for entry in entries:
+            if entry.name in known:
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            self.index.record(entry.name, st.st_size, now=st.st_mtime)
+            added += 1
+        return added
+
+    def _delete(self, names: List[str]) -> int:
+        deleted = 0
+        for name in names:
+            try:
+                (self.audio_dir / name).unlink()
+                deleted += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"⚠️  Failed to delete {name}: {e}")
+        self.index.remove(names)
+        return deleted
@@ -1,13 +1,20 @@
 """
 User authentication module using SQLite for persistent storage.
+
+Each thread keeps one WAL-mode connection to the user database, and users
+loaded by id are kept in a small TTL cache because Flask-Login loads the
+current user on every authenticated request.
 """
 import sqlite3
 import logging
 import os
+import threading
 from pathlib import Path
 from typing import Optional, Tuple, Dict, Any
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from password_hashing import PasswordHasher, HashingBusy
+from ttl_cache import TTLCache
+from metrics import AUTH_DB_SECONDS
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -16,6 +23,23 @@ logger = logging.getLogger(__name__)
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 DB_FILE = DATA_DIR / "users.db"
+DB_BUSY_TIMEOUT_MS = int(os.getenv('AUTH_DB_BUSY_TIMEOUT_MS', 5000))
+USER_CACHE_TTL_SECONDS = float(os.getenv('USER_CACHE_TTL_SECONDS', 60))
+USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', 1024))
+
+# Changing the method or salt length rehashes each password at its next successful login
+password_hasher = PasswordHasher(
+    method=os.getenv('PASSWORD_HASH_METHOD', 'scrypt'),
+    salt_length=int(os.getenv('PASSWORD_SALT_LENGTH', 16)),
+    workers=int(os.getenv('PASSWORD_HASH_WORKERS', 2)),
+    max_pending=int(os.getenv('PASSWORD_HASH_MAX_PENDING', 8)),
+    timeout=float(os.getenv('PASSWORD_HASH_TIMEOUT_SECONDS', 10)),
+)
+
+# Schema migrations, applied in order; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    'CREATE INDEX IF NOT EXISTS idx_users_email ON users (email)',
+]
 
 class User(UserMixin):
     """User class for Flask-Login"""
@@ -28,57 +52,95 @@ class User(UserMixin):
         self.is_azure_ad = is_azure_ad
 
     def check_password(self, password: str) -> bool:
-        """Verify password against hash"""
+        """Verify password against hash, upgrading the hash if its parameters are outdated.
+
+        Raises HashingBusy when the hashing queue is full.
+        """
         if self.is_azure_ad:
             return False  # Azure AD users don't have local passwords
         if not self.password_hash:
             return False
-        return check_password_hash(self.password_hash, password)
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            try:
+                update_password_hash(self.id, password_hasher.hash(password))
+            except HashingBusy:
+                pass  # Try again at the next login
+        return True
+
+# Flask-Login loads the current user on every request; keep recently seen users in memory
+user_cache = TTLCache(USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES)
+
+_local = threading.local()
+# Database files whose schema this process has already created or migrated
+_initialized = set()
 
 def get_db_connection() -> sqlite3.Connection:
-    """Establish and return a database connection"""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    """Return this thread's database connection, reopening it after a fork"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.db_file != DB_FILE:
+        conn = sqlite3.connect(DB_FILE, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.db_file = DB_FILE
+        if DB_FILE not in _initialized:
+            init_db(conn)
     return conn
 
-def init_db():
-    """Initialize the database schema"""
+def migrate(conn: sqlite3.Connection) -> None:
+    """Apply schema migrations the database hasn't seen yet"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for i, statement in enumerate(MIGRATIONS[version:], start=version + 1):
+        with conn:
+            conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {i}')
+        logger.info("Applied user database migration %d", i)
+
+def init_db(conn: Optional[sqlite3.Connection] = None):
+    """Initialize the database schema; the first connection in each process does this"""
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT,
-                email TEXT,
-                is_azure_ad BOOLEAN DEFAULT 0
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        conn = conn or get_db_connection()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE NOT NULL,
+                    password_hash TEXT,
+                    email TEXT,
+                    is_azure_ad BOOLEAN DEFAULT 0
+                )
+            ''')
+        migrate(conn)
+        _initialized.add(DB_FILE)
         logger.info("Database initialized successfully at %s", DB_FILE)
     except Exception as e:
         logger.error("Failed to initialize database: %s", e)
 
-# Initialize DB on module load
-init_db()
-
 def get_user(user_id: str) -> Optional[User]:
     """Get user by ID"""
+    user = user_cache.get(str(user_id))
+    if user:
+        return user
     try:
         conn = get_db_connection()
-        user_data = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-        conn.close()
+        with AUTH_DB_SECONDS.labels('get_user').time():
+            user_data = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
 
         if user_data:
-            return User(
+            user = User(
                 str(user_data['id']),
                 user_data['username'],
                 user_data['password_hash'],
                 user_data['email'],
                 bool(user_data['is_azure_ad'])
             )
+            user_cache.put(user.id, user)
+            return user
     except Exception as e:
         logger.error("Error retrieving user by ID %s: %s", user_id, e)
     return None
@@ -87,8 +149,8 @@ def get_user_by_username(username: str) -> Optional[User]:
     """Get user by username"""
     try:
         conn = get_db_connection()
-        user_data = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        conn.close()
+        with AUTH_DB_SECONDS.labels('get_user_by_username').time():
+            user_data = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
 
         if user_data:
             return User(
@@ -108,37 +170,49 @@ def create_user(username: str, password: str) -> Tuple[Optional[User], Optional[
         conn = get_db_connection()
         
         # Check if username already exists
-        if conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone():
-            conn.close()
+        with AUTH_DB_SECONDS.labels('username_exists').time():
+            exists = conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone()
+        if exists:
             return None, "Username already exists"
 
-        password_hash = generate_password_hash(password)
+        password_hash = password_hasher.hash(password)
         
-        cur = conn.cursor()
-        cur.execute(
-            'INSERT INTO users (username, password_hash, is_azure_ad) VALUES (?, ?, ?)',
-            (username, password_hash, False)
-        )
+        with AUTH_DB_SECONDS.labels('create_user').time(), conn:
+            cur = conn.execute(
+                'INSERT INTO users (username, password_hash, is_azure_ad) VALUES (?, ?, ?)',
+                (username, password_hash, False)
+            )
         user_id = cur.lastrowid
-        conn.commit()
-        conn.close()
 
         return User(str(user_id), username, password_hash), None
 
+    except HashingBusy:
+        return None, "The server is busy. Please try again in a moment."
     except Exception as e:
         logger.error("Error creating user %s: %s", username, e)
         return None, "An error occurred during registration"
 
+def update_password_hash(user_id: str, password_hash: str) -> None:
+    """Store a new password hash for a user"""
+    try:
+        conn = get_db_connection()
+        with AUTH_DB_SECONDS.labels('update_password_hash').time(), conn:
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
+        user_cache.invalidate(str(user_id))
+        logger.info("Rehashed password for user %s", user_id)
+    except Exception as e:
+        logger.error("Error updating password hash for user %s: %s", user_id, e)
+
 def create_azure_ad_user(email: str, username: str) -> Tuple[Optional[User], Optional[str]]:
     """Create or update an Azure AD user"""
     try:
         conn = get_db_connection()
         
         # Check if user already exists by email
-        existing_user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
+        with AUTH_DB_SECONDS.labels('get_user_by_email').time():
+            existing_user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
         
         if existing_user:
-            conn.close()
             return User(
                 str(existing_user['id']),
                 existing_user['username'],
@@ -148,14 +222,12 @@ def create_azure_ad_user(email: str, username: str) -> Tuple[Optional[User], Opt
             ), None
 
         # Create new Azure AD user
-        cur = conn.cursor()
-        cur.execute(
-            'INSERT INTO users (username, email, is_azure_ad) VALUES (?, ?, ?)',
-            (username, email, True)
-        )
+        with AUTH_DB_SECONDS.labels('create_azure_ad_user').time(), conn:
+            cur = conn.execute(
+                'INSERT INTO users (username, email, is_azure_ad) VALUES (?, ?, ?)',
+                (username, email, True)
+            )
         user_id = cur.lastrowid
-        conn.commit()
-        conn.close()
 
         return User(str(user_id), username, None, email, True), None
 
@@ -0,0 +1,147 @@
+"""
+Concurrent load driver for the TTS app's HTTP endpoints.
+
+Each scenario sends a fixed number of requests from `concurrency` threads over
+one keep-alive pool and reports p50/p95/p99 latency, requests per second and
+errors. Results are plain dicts so they can be written to JSON and compared
+with a run from another commit.
+"""
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import httpx
+
+VOICES = {'speech': 'da-DK-ChristelNeural', 'openai': 'alloy'}
+SAMPLE_TEXT = ('Dette er en test af tale syntese. Vi måler hvor hurtigt serveren svarer, '
+               'når mange brugere beder om lyd på samme tid.')
+
+# A scenario turns a request number into (method, path, keyword arguments for httpx)
+Scenario = Callable[[int], Tuple[str, str, Dict[str, Any]]]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float, received: int,
+              statuses: Dict[int, int]) -> Dict[str, Any]:
+    """Summarize one scenario's latencies (seconds) as milliseconds and throughput"""
+    ordered = sorted(latencies)
+    total = len(ordered) + errors
+    return {
+        'requests': total,
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'requests_per_second': round(total / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 1),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 1) if ordered else 0.0,
+        'max_ms': round(ordered[-1] * 1000, 1) if ordered else 0.0,
+        'bytes_received': received,
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def run_scenario(client: httpx.Client, scenario: Scenario, requests: int, concurrency: int) -> Dict[str, Any]:
+    """Send requests built by scenario from concurrency threads and summarize them"""
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    errors = 0
+    received = 0
+
+    def worker() -> None:
+        nonlocal errors, received
+        while True:
+            n = next(counter)
+            if n >= requests:
+                return
+            method, path, kwargs = scenario(n)
+            start = time.perf_counter()
+            try:
+                response = client.request(method, path, **kwargs)
+                status, size = response.status_code, len(response.content)
+            except httpx.HTTPError:
+                status, size = 0, 0
+            latency = time.perf_counter() - start
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                received += size
+                if 200 <= status < 300:
+                    latencies.append(latency)
+                else:
+                    errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return summarize(latencies, errors, time.perf_counter() - start, received, statuses)
+
+
+def speech_payload(service: str, text: str, fmt: str = 'mp3') -> Dict[str, Any]:
+    return {'text': text, 'voice': VOICES[service], 'service': service, 'speed': 1.0, 'format': fmt}
+
+
+def generate_speech(service: str, unique: bool = True) -> Scenario:
+    """POST /generate-speech; unique texts miss the synthesis cache and reach the provider"""
+    run = uuid.uuid4().hex[:8]
+
+    def build(n: int) -> Tuple[str, str, Dict[str, Any]]:
+        text = f"{SAMPLE_TEXT} ({run}-{n})" if unique else SAMPLE_TEXT
+        return 'POST', '/generate-speech', {'json': speech_payload(service, text)}
+    return build
+
+
+def stream_speech(service: str) -> Scenario:
+    """POST /generate-speech/stream with unique texts"""
+    run = uuid.uuid4().hex[:8]
+
+    def build(n: int) -> Tuple[str, str, Dict[str, Any]]:
+        return 'POST', '/generate-speech/stream', {'json': speech_payload(service, f"{SAMPLE_TEXT} ({run}-{n})")}
+    return build
+
+
+def serve_audio(filenames: List[str]) -> Scenario:
+    """GET /audio/<filename> round-robin over already generated files"""
+    return lambda n: ('GET', f"/audio/{filenames[n % len(filenames)]}", {})
+
+
+def download(filenames: List[str], fmt: str) -> Scenario:
+    """GET /download/<filename>?format=fmt; the first request per file converts it"""
+    return lambda n: ('GET', f"/download/{filenames[n % len(filenames)]}", {'params': {'format': fmt}})
+
+
+def prime_files(client: httpx.Client, service: str, count: int) -> List[str]:
+    """Generate count distinct files for the serving scenarios and return their names"""
+    run = uuid.uuid4().hex[:8]
+    names = []
+    for n in range(count):
+        response = client.post('/generate-speech', json=speech_payload(service, f"{SAMPLE_TEXT} (prime {run}-{n})"))
+        response.raise_for_status()
+        names.append(response.json()['filename'])
+    return names
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> Iterator[Tuple[str, str, bool]]:
+    """Yield (endpoint, description, regressed) comparing p95 latency and throughput with a baseline run"""
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        p95_change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+        rps_change = ((result['requests_per_second'] - before['requests_per_second']) / before['requests_per_second']
+                      if before['requests_per_second'] else 0.0)
+        regressed = p95_change > tolerance or rps_change < -tolerance
+        yield name, f"p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms ({p95_change:+.0%}), " \
+                    f"{before['requests_per_second']:.1f} -> {result['requests_per_second']:.1f} req/s " \
+                    f"({rps_change:+.0%})", regressed
@@ -0,0 +1,181 @@
+"""
+Benchmark the TTS app against local stub providers and save the results as JSON.
+
+Starts the stub Azure Speech/OpenAI server, launches the app under gunicorn (or
+uvicorn with --server uvicorn) in a scratch data directory with authentication,
+quotas and rate limits switched off, then drives each endpoint:
+
+    python benchmarks/run.py --requests 300 --concurrency 16 --latency-ms 400
+    python benchmarks/run.py --baseline benchmarks/results/<commit>.json
+
+Pass --url to measure an app that is already running (configure its provider
+endpoints yourself, e.g. with the variables printed by stub_providers.py).
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+import load_driver
+from stub_providers import add_stub_arguments, start_stub_server, stub_config
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+SCENARIOS = ['generate-speech', 'generate-speech-cached', 'stream', 'audio', 'download-wav']
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def app_env(stub_url: str, workdir: Path) -> Dict[str, str]:
+    """Environment for an app pointed at the stubs with authentication, quotas and rate limits off"""
+    (workdir / 'metrics').mkdir(parents=True, exist_ok=True)
+    return {
+        **os.environ,
+        'AZURE_SPEECH_KEY': 'stub', 'AZURE_SPEECH_REGION': 'stub', 'AZURE_SPEECH_ENDPOINT': stub_url,
+        'AZURE_OPENAI_API_KEY': 'stub', 'AZURE_OPENAI_ENDPOINT': stub_url,
+        'REQUIRE_AUTHENTICATION': 'false', 'QUOTA_ENABLED': 'false', 'RATELIMIT_ENABLED': 'false',
+        'FLASK_ENV': 'production',
+        'PROMETHEUS_MULTIPROC_DIR': str(workdir / 'metrics'),
+    }
+
+
+def server_command(server: str, port: int, workers: int, threads: int, preload: bool = False) -> List[str]:
+    if server == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--app-dir', str(REPO_DIR),
+                '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers), '--no-access-log']
+    return [sys.executable, '-m', 'gunicorn', '-c', str(REPO_DIR / 'gunicorn.conf.py'),
+            '--pythonpath', str(REPO_DIR), '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+            '--threads', str(threads), '--timeout', '120', *(['--preload'] if preload else []), 'wsgi:app']
+
+
+def start_app(args: argparse.Namespace, stub_url: str, workdir: Path) -> Tuple[subprocess.Popen, str]:
+    """Launch the app in workdir (its data/ directory lives there) against the stubs"""
+    port = free_port()
+    command = server_command(args.server, port, args.workers, args.threads)
+    log = open(workdir / 'server.log', 'wb')
+    process = subprocess.Popen(command, cwd=workdir, env=app_env(stub_url, workdir), stdout=log,
+                               stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"App exited during startup, see {workdir / 'server.log'}")
+        try:
+            httpx.get(f'{url}/login', timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"App did not start within 60s, see {workdir / 'server.log'}")
+
+
+def run_benchmarks(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    with httpx.Client(base_url=base_url, limits=limits, timeout=120) as client:
+        files: List[str] = []
+        if {'audio', 'download-wav'} & set(args.scenarios):
+            files = load_driver.prime_files(client, args.service, args.files)
+        scenarios = {
+            'generate-speech': load_driver.generate_speech(args.service),
+            'generate-speech-cached': load_driver.generate_speech(args.service, unique=False),
+            'stream': load_driver.stream_speech(args.service),
+            'audio': files and load_driver.serve_audio(files),
+            'download-wav': files and load_driver.download(files, 'wav'),
+        }
+        for name in args.scenarios:
+            print(f"▶ {name}: {args.requests} requests, concurrency {args.concurrency}", flush=True)
+            result = load_driver.run_scenario(client, scenarios[name], args.requests, args.concurrency)
+            results[name] = result
+            print(f"  {result['requests_per_second']:.1f} req/s, p50 {result['p50_ms']:.1f} ms, "
+                  f"p95 {result['p95_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+                  f"{result['errors']} errors {result['status_codes']}", flush=True)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Load-test the TTS app against local stub providers')
+    parser.add_argument('--url', help='benchmark an already running app instead of starting one')
+    parser.add_argument('--server', choices=['gunicorn', 'uvicorn'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--service', choices=['speech', 'openai'], default='speech')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        type=lambda value: [name for name in value.split(',') if name],
+                        help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--files', type=int, default=20, help='files generated for the audio and download scenarios')
+    parser.add_argument('--output', type=Path, help='defaults to benchmarks/results/<commit>-<timestamp>.json')
+    parser.add_argument('--baseline', type=Path, help='earlier result file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='exit with status 1 if p95 grows or throughput drops by more than this fraction')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    stubs = start_stub_server(stub_config(args))
+    process = None
+    with tempfile.TemporaryDirectory(prefix='tts-bench-') as workdir:
+        try:
+            if args.url:
+                base_url = args.url
+            else:
+                process, base_url = start_app(args, stubs.url, Path(workdir))
+            results = run_benchmarks(args, base_url)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+            stubs.shutdown()
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'config': {key: (str(value) if isinstance(value, Path) else value) for key, value in vars(args).items()
+                   if key not in ('output', 'baseline', 'tolerance')},
+        'stub_requests': stubs.counts,
+        'results': results,
+    }
+    output = args.output or RESULTS_DIR / f"{commit or 'unknown'}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"💾 Results saved to {output}")
+
+    if args.baseline:
+        regressed = False
+        for name, description, worse in load_driver.compare(report, json.loads(args.baseline.read_text()),
+                                                             args.tolerance):
+            regressed |= worse
+            print(f"{'❌' if worse else '✅'} {name}: {description}")
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Measure how long the TTS app takes to import and to answer its first request.
+
+    python benchmarks/startup.py --repeat 5 --audio-files 20000
+
+Import time is taken in fresh interpreters, which also report whether the
+provider SDKs were loaded. Time to first request runs from launching each
+server (gunicorn, gunicorn --preload, uvicorn) until GET /login answers, with
+--audio-files expired files in data/audio so a blocking cleanup scan would
+show up. The first OpenAI synthesis is timed too, since it now builds the SDK
+client. Results are saved next to run.py's as startup-<commit>-<timestamp>.json.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict
+
+import httpx
+
+import load_driver
+from run import RESULTS_DIR, REPO_DIR, app_env, free_port, git_commit, server_command
+from stub_providers import StubConfig, silent_mp3, start_stub_server
+
+IMPORT_PROBE = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import app\n"
+    "elapsed = time.perf_counter() - start\n"
+    "print(json.dumps({'seconds': elapsed, 'loaded': [m for m in ('openai', 'msal', 'requests') if m in sys.modules]}))\n"
+)
+
+MODES = {
+    'gunicorn': ('gunicorn', False),
+    'gunicorn-preload': ('gunicorn', True),
+    'uvicorn': ('uvicorn', False),
+}
+
+
+def populate_audio(audio_dir: Path, count: int) -> None:
+    """Write count small audio files old enough for the janitor to expire"""
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    audio = silent_mp3(0.1)
+    old = time.time() - 7 * 86400
+    for _ in range(count):
+        path = audio_dir / f"{uuid.uuid4()}.mp3"
+        path.write_bytes(audio)
+        os.utime(path, (old, old))
+
+
+def measure_import(env: Dict[str, str], workdir: Path, repeat: int) -> Dict[str, Any]:
+    """Import app.py in repeat fresh interpreters and summarize the wall time"""
+    samples, loaded = [], []
+    for _ in range(repeat):
+        probe = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=workdir, capture_output=True, text=True,
+                               env={**env, 'PYTHONPATH': str(REPO_DIR)}, check=True)
+        result = json.loads(probe.stdout.strip().splitlines()[-1])
+        samples.append(result['seconds'] * 1000)
+        loaded = result['loaded']
+    return {
+        'median_ms': round(statistics.median(samples), 1),
+        'min_ms': round(min(samples), 1),
+        'max_ms': round(max(samples), 1),
+        'sdks_loaded_at_import': loaded,
+    }
+
+
+def measure_first_request(args: argparse.Namespace, mode: str, stub_url: str, workdir: Path) -> Dict[str, Any]:
+    """Launch the server and time its first answered request and first OpenAI synthesis"""
+    server, preload = MODES[mode]
+    populate_audio(workdir / 'data' / 'audio', args.audio_files)
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    log = open(workdir / 'server.log', 'wb')
+    start = time.perf_counter()
+    process = subprocess.Popen(server_command(server, port, args.workers, args.threads, preload), cwd=workdir,
+                               env=app_env(stub_url, workdir), stdout=log, stderr=subprocess.STDOUT)
+    try:
+        while True:
+            if process.poll() is not None:
+                raise SystemExit(f"{mode} exited during startup, see {workdir / 'server.log'}")
+            if time.perf_counter() - start > 60:
+                raise SystemExit(f"{mode} did not answer within 60s, see {workdir / 'server.log'}")
+            try:
+                httpx.get(f'{url}/login', timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.01)
+        ready = time.perf_counter() - start
+
+        synthesis_start = time.perf_counter()
+        response = httpx.post(f'{url}/generate-speech', timeout=60,
+                              json=load_driver.speech_payload('openai', f"{load_driver.SAMPLE_TEXT} {uuid.uuid4()}"))
+        return {
+            'first_request_ms': round(ready * 1000, 1),
+            'first_openai_synthesis_ms': round((time.perf_counter() - synthesis_start) * 1000, 1),
+            'first_openai_synthesis_status': response.status_code,
+        }
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        log.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Measure import time and time to first request of the TTS app')
+    parser.add_argument('--repeat', type=int, default=5, help='import measurements and server launches per mode')
+    parser.add_argument('--modes', default=','.join(MODES),
+                        type=lambda value: [name for name in value.split(',') if name],
+                        help=f"comma-separated subset of {', '.join(MODES)}")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--audio-files', type=int, default=5000, help='expired files placed in data/audio')
+    parser.add_argument('--output', type=Path, help='defaults to benchmarks/results/startup-<commit>-<timestamp>.json')
+    args = parser.parse_args()
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    stubs = start_stub_server(StubConfig(latency_ms=50, jitter_ms=0, ms_per_char=0))
+    try:
+        with tempfile.TemporaryDirectory(prefix='tts-startup-') as workdir:
+            print("▶ import app", flush=True)
+            imports = measure_import(app_env(stubs.url, Path(workdir)), Path(workdir), args.repeat)
+            print(f"  median {imports['median_ms']:.1f} ms, SDKs loaded: {imports['sdks_loaded_at_import'] or 'none'}")
+
+        first_requests = {}
+        for mode in args.modes:
+            print(f"▶ {mode}: {args.repeat} launches with {args.audio_files} expired audio files", flush=True)
+            runs = []
+            for _ in range(args.repeat):
+                with tempfile.TemporaryDirectory(prefix='tts-startup-') as workdir:
+                    runs.append(measure_first_request(args, mode, stubs.url, Path(workdir)))
+            first_requests[mode] = {
+                'first_request_ms': round(statistics.median(run['first_request_ms'] for run in runs), 1),
+                'first_openai_synthesis_ms': round(statistics.median(run['first_openai_synthesis_ms'] for run in runs), 1),
+                'first_openai_synthesis_status': runs[-1]['first_openai_synthesis_status'],
+            }
+            print(f"  first request {first_requests[mode]['first_request_ms']:.1f} ms, first OpenAI synthesis "
+                  f"{first_requests[mode]['first_openai_synthesis_ms']:.1f} ms", flush=True)
+    finally:
+        stubs.shutdown()
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'config': {key: (str(value) if isinstance(value, Path) else value) for key, value in vars(args).items()
+                   if key != 'output'},
+        'import': imports,
+        'first_request': first_requests,
+    }
+    output = args.output or RESULTS_DIR / f"startup-{commit or 'unknown'}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"💾 Results saved to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
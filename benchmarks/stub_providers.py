@@ -0,0 +1,185 @@
+"""
+Local stand-ins for the Azure Speech REST endpoint and the Azure OpenAI audio.speech API.
+
+Both answer with silent but well-formed audio whose length follows the text
+(MP3 at 24 kHz/96 kbit/s like the app requests, or 16-bit PCM WAV), after a
+configurable delay, and can be told to fail or throttle a share of requests.
+Point the app at them with AZURE_SPEECH_ENDPOINT and AZURE_OPENAI_ENDPOINT:
+
+    python benchmarks/stub_providers.py --port 8900 --latency-ms 400 --throttle-rate 0.02
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# MPEG-2 Layer III, 96 kbit/s, 24 kHz, mono: 288-byte frames of 576 samples (24 ms)
+MP3_FRAME_HEADER = b'\xff\xf3\xa4\xc4'
+MP3_FRAME_SIZE = 288
+MP3_FRAME_SECONDS = 576 / 24000
+WAV_SAMPLE_RATE = 24000
+# Roughly how long a voice takes to read one character aloud
+SECONDS_PER_CHARACTER = 0.06
+STREAM_CHUNK_SIZE = 8 * 1024
+
+OPENAI_PATH = re.compile(r'^/openai/deployments/[^/]+/audio/speech$')
+
+
+def silent_mp3(seconds: float) -> bytes:
+    """Return silent MP3 frames lasting at least seconds"""
+    frames = max(1, int(seconds / MP3_FRAME_SECONDS + 0.999))
+    return (MP3_FRAME_HEADER + bytes(MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))) * frames
+
+
+def silent_wav(seconds: float) -> bytes:
+    """Return a 16-bit mono PCM WAV file of silence"""
+    data_size = int(seconds * WAV_SAMPLE_RATE) * 2
+    header = b'RIFF' + struct.pack('<I', 36 + data_size) + b'WAVE'
+    header += b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, WAV_SAMPLE_RATE, WAV_SAMPLE_RATE * 2, 2, 16)
+    header += b'data' + struct.pack('<I', data_size)
+    return header + bytes(data_size)
+
+
+def synthesize(text: str, fmt: str) -> Optional[Tuple[bytes, str]]:
+    """Return (audio, content type) for text, or None for formats the stub can't produce"""
+    seconds = max(0.5, len(text) * SECONDS_PER_CHARACTER)
+    if fmt == 'mp3':
+        return silent_mp3(seconds), 'audio/mpeg'
+    if fmt == 'wav':
+        return silent_wav(seconds), 'audio/wav'
+    return None
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 300.0
+    jitter_ms: float = 100.0
+    ms_per_char: float = 1.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: int = 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: 'StubServer'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        path = self.path.split('?', 1)[0]
+        if path == '/cognitiveservices/v1':
+            text = re.sub(r'<[^>]+>', '', body.decode('utf-8', 'replace')).strip()
+            output_format = self.headers.get('X-Microsoft-OutputFormat', '')
+            fmt = 'mp3' if 'mp3' in output_format else 'wav' if output_format.startswith('riff') else output_format
+        elif OPENAI_PATH.match(path):
+            payload = json.loads(body or b'{}')
+            text, fmt = payload.get('input', ''), payload.get('response_format', 'mp3')
+        else:
+            return self.reply(404, b'{"error": "not found"}', 'application/json')
+        self.server.respond(self, text, fmt)
+
+    def reply(self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubServer(ThreadingHTTPServer):
+    """Serves both provider APIs from one port"""
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], config: StubConfig):
+        super().__init__(address, StubHandler)
+        self.config = config
+        self.counts = {'requests': 0, 'errors': 0, 'throttled': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def respond(self, handler: StubHandler, text: str, fmt: str) -> None:
+        config = self.config
+        self._count('requests')
+        roll = random.random()
+        if roll < config.throttle_rate:
+            self._count('throttled')
+            return handler.reply(429, b'{"error": "Too many requests"}', 'application/json',
+                                 {'Retry-After': str(config.retry_after)})
+        if roll < config.throttle_rate + config.error_rate:
+            self._count('errors')
+            return handler.reply(500, b'{"error": "Injected failure"}', 'application/json')
+        audio = synthesize(text, fmt)
+        if audio is None:
+            return handler.reply(400, f'{{"error": "stub cannot produce {fmt}"}}'.encode(), 'application/json')
+
+        delay = config.latency_ms + random.gauss(0, config.jitter_ms) + len(text) * config.ms_per_char
+        time.sleep(max(0.0, delay) / 1000)
+        data, content_type = audio
+        handler.send_response(200)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        for i in range(0, len(data), STREAM_CHUNK_SIZE):
+            handler.wfile.write(data[i:i + STREAM_CHUNK_SIZE])
+
+
+def start_stub_server(config: StubConfig, host: str = '127.0.0.1', port: int = 0) -> StubServer:
+    """Start the stub server on a background thread; port 0 picks a free port"""
+    server = StubServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name='stub-providers', daemon=True).start()
+    return server
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--latency-ms', type=float, default=300.0, help='mean delay before the first byte')
+    parser.add_argument('--jitter-ms', type=float, default=100.0, help='standard deviation of the delay')
+    parser.add_argument('--ms-per-char', type=float, default=1.0, help='extra delay per input character')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of requests answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429s')
+
+
+def stub_config(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(args.latency_ms, args.jitter_ms, args.ms_per_char, args.error_rate,
+                      args.throttle_rate, args.retry_after)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve stand-ins for the Azure Speech and Azure OpenAI TTS APIs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = StubServer((args.host, args.port), stub_config(args))
+    print(f"Stub providers listening on {server.url}")
+    print(f"  AZURE_SPEECH_ENDPOINT={server.url} AZURE_SPEECH_KEY=stub AZURE_SPEECH_REGION=stub")
+    print(f"  AZURE_OPENAI_ENDPOINT={server.url} AZURE_OPENAI_API_KEY=stub")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"Served {server.counts}")
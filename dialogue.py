@@ -0,0 +1,55 @@
+"""
+Multi-voice dialogue scripts: planning provider calls and stitching their audio.
+
+A script is a list of segments, each with its own voice, service, speed and a
+pause after it. Long segments are split like any long text. Consecutive Azure
+Speech lines are packed into one multi-<voice> SSML request, with the pauses
+between them as <break> elements, so a dialogue takes fewer round trips than it
+has lines; OpenAI lines are one call each. The calls' MP3 frames are then joined
+in script order with generated silence for the remaining pauses.
+"""
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+from mp3 import audio_frames, parse_frame_header, silence
+from text_chunker import split_text
+
+# pause is the silence after the line, in seconds
+Line = namedtuple('Line', 'voice speed text pause')
+# One provider request; pauses between its lines are rendered by the provider
+Call = namedtuple('Call', 'service lines')
+
+# Azure Speech accepts at most 50 <voice> elements per request and breaks of up to 5 seconds
+SSML_MAX_VOICES = 50
+SSML_MAX_BREAK_SECONDS = 5.0
+
+
+def plan_calls(segments: List[Dict[str, Any]], max_chars: Callable[[str], int]) -> List[Call]:
+    """Group validated segments into provider calls, in script order"""
+    calls: List[Call] = []
+    for segment in segments:
+        service = segment['service']
+        pieces = split_text(segment['text'], max_chars(service))
+        for i, piece in enumerate(pieces):
+            line = Line(segment['voice'], segment['speed'], piece, segment['pause'] if i == len(pieces) - 1 else 0.0)
+            previous = calls[-1] if calls else None
+            if (service == 'speech' and previous and previous.service == 'speech'
+                    and len(previous.lines) < SSML_MAX_VOICES
+                    and previous.lines[-1].pause <= SSML_MAX_BREAK_SECONDS
+                    and sum(len(l.text) for l in previous.lines) + len(piece) <= max_chars(service)):
+                previous.lines.append(line)
+            else:
+                calls.append(Call(service, [line]))
+    return calls
+
+
+def stitch(calls: List[Call], results: Iterable[bytes]) -> Iterator[bytes]:
+    """Yield each call's MP3 frames in order, followed by the silence after its last line"""
+    for call, audio in zip(calls, results):
+        frames = audio_frames(audio)
+        if frames:
+            yield frames
+        pause = call.lines[-1].pause
+        if pause > 0:
+            # Match the neighbouring audio's sample rate and channels
+            yield silence(pause, parse_frame_header(frames) if frames else None)
@@ -0,0 +1,33 @@
+"""
+Gunicorn settings loaded automatically from the working directory.
+
+Command-line flags (see the Dockerfile) still configure binding and workers;
+this file prepares the shared directory Prometheus metrics are written to so
+/metrics reports every worker, and starts the app's background threads in each
+worker after it has forked, which keeps --preload safe.
+"""
+import os
+import shutil
+
+# Workers inherit this from the master and write their samples there
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join('data', 'metrics'))
+
+# Start each run with an empty metrics directory. This runs when the config is
+# loaded, before --preload imports the app (whose metrics open files there), and
+# only once per master: a HUP re-reads this file while workers still use the files.
+if os.environ.get('TTS_METRICS_DIR_OWNER') != str(os.getpid()):
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+    os.environ['TTS_METRICS_DIR_OWNER'] = str(os.getpid())
+
+
+def child_exit(server, worker):
+    """Remove a dead worker's live gauge files; its counters and histograms are kept"""
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    """Start the app's background threads (janitor, jobs, history, voices, warm-up) in this worker"""
+    from app import start_background_services
+    start_background_services()
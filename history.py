@@ -0,0 +1,199 @@
+"""
+Per-user synthesis history persisted in SQLite and written in batches.
+
+Routes call HistoryStore.record(), which only appends the entry to an in-memory
+queue, so recording adds no database work to a synthesis request. A background
+thread writes queued entries in one transaction every `flush_interval` seconds,
+or as soon as `batch_size` are waiting, and reads each file's size and duration
+as it goes. Pages are fetched by keyset over the (owner_id, created_at, id)
+index, so a deep page costs the same as the first one.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import wave
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import mp3
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PREVIEW_CHARS = 120
+CURSOR_PATTERN = re.compile(r'^(\d+(?:\.\d+)?(?:e[+-]?\d+)?):([a-f0-9]{32})$')
+
+
+def audio_duration(path: Path) -> Optional[float]:
+    """Return the playing time of an MP3 or WAV file in seconds, or None for other formats"""
+    try:
+        if path.suffix == '.mp3':
+            return round(mp3.duration(path.read_bytes()), 3)
+        if path.suffix == '.wav':
+            with wave.open(str(path), 'rb') as wav:
+                return round(wav.getnframes() / wav.getframerate(), 3)
+    except (OSError, EOFError, wave.Error):
+        pass
+    return None
+
+
+def encode_cursor(created_at: float, entry_id: str) -> str:
+    # repr() round-trips the float exactly, so no entry is skipped or repeated between pages
+    return f"{created_at!r}:{entry_id}"
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[float, str]]:
+    match = CURSOR_PATTERN.match(cursor)
+    return (float(match.group(1)), match.group(2)) if match else None
+
+
+class HistoryStore:
+    """SQLite history of each user's syntheses, fed through a batching writer thread"""
+
+    def __init__(self, db_file: Path, flush_interval: float = 1.0, batch_size: int = 100):
+        self.db_file = db_file
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_lock = threading.Lock()
+        # Serializes flushes, so a reader that flushes first sees everything queued before it
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._atexit_pid: Optional[int] = None
+        self.init_db()
+
+    def get_db_connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, reopening it after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def init_db(self) -> None:
+        """Initialize the database schema"""
+        self.get_db_connection().executescript('''
+            CREATE TABLE IF NOT EXISTS history (
+                id TEXT PRIMARY KEY,
+                owner_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                text_hash TEXT NOT NULL,
+                text_preview TEXT NOT NULL,
+                voice TEXT NOT NULL,
+                service TEXT NOT NULL,
+                speed REAL NOT NULL,
+                format TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                size INTEGER,
+                duration REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_owner_created ON history (owner_id, created_at, id);
+        ''')
+
+    def record(self, owner_id: Optional[str], params: Dict[str, Any], path: Path) -> str:
+        """Queue a finished synthesis for the next batch and return its history id"""
+        text = params['text']
+        entry = {
+            'id': uuid.uuid4().hex,
+            # Anonymous entries share one history while authentication is disabled
+            'owner_id': owner_id or '',
+            'created_at': time.time(),
+            'text_hash': hashlib.sha256(text.encode('utf-8')).hexdigest(),
+            'text_preview': text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS - 1].rstrip() + '…',
+            'voice': params['voice'],
+            'service': params['service'],
+            'speed': float(params['speed']),
+            'format': params['format'],
+            'path': path,
+        }
+        with self._pending_lock:
+            self._pending.append(entry)
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+        return entry['id']
+
+    def flush(self) -> int:
+        """Write every queued entry in one transaction; returns how many were written"""
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            rows = []
+            for entry in batch:
+                path = entry.pop('path')
+                try:
+                    size = path.stat().st_size
+                except OSError:
+                    size = None
+                rows.append({**entry, 'filename': path.name, 'size': size, 'duration': audio_duration(path)})
+            conn = self.get_db_connection()
+            try:
+                conn.execute('BEGIN')
+                conn.executemany(
+                    'INSERT OR IGNORE INTO history (id, owner_id, created_at, text_hash, text_preview, voice, service, '
+                    'speed, format, filename, size, duration) VALUES (:id, :owner_id, :created_at, :text_hash, '
+                    ':text_preview, :voice, :service, :speed, :format, :filename, :size, :duration)',
+                    rows
+                )
+                conn.execute('COMMIT')
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                logger.error(f"❌ Could not write {len(rows)} history entries: {e}")
+                return 0
+            return len(rows)
+
+    def list(self, owner_id: Optional[str], limit: int,
+             before: Optional[Tuple[float, str]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return up to limit entries, newest first, and the cursor of the next page (None on the last)"""
+        self.flush()
+        query = 'SELECT * FROM history WHERE owner_id = ?'
+        args: List[Any] = [owner_id or '']
+        if before:
+            query += ' AND (created_at, id) < (?, ?)'
+            args.extend(before)
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        rows = self.get_db_connection().execute(query, (*args, limit + 1)).fetchall()
+        entries = [dict(row) for row in rows[:limit]]
+        cursor = encode_cursor(entries[-1]['created_at'], entries[-1]['id']) if len(rows) > limit else None
+        return entries, cursor
+
+    def get(self, owner_id: Optional[str], entry_id: str) -> Optional[Dict[str, Any]]:
+        """Return one of the owner's entries, or None"""
+        self.flush()
+        row = self.get_db_connection().execute(
+            'SELECT * FROM history WHERE id = ? AND owner_id = ?', (entry_id, owner_id or '')
+        ).fetchone()
+        return dict(row) if row else None
+
+    def start(self) -> None:
+        """Start the writer thread for this process, flushing what is left on exit"""
+        if self._thread and self._thread.is_alive():
+            return
+        if self._atexit_pid != os.getpid():
+            atexit.register(self.flush)
+            self._atexit_pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ History writer error: {e}", exc_info=True)
@@ -0,0 +1,101 @@
+"""
+Shared, connection-pooled HTTP clients for outbound provider and Graph calls.
+
+Each worker process keeps its own keep-alive pool so TCP and TLS handshakes
+are paid once per host instead of once per request. Clients are recreated
+after a fork so a preloaded parent never shares sockets with its workers.
+"""
+import importlib.util
+import logging
+import os
+import threading
+from typing import Any, Callable, Optional
+
+import httpx
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class PooledHttpClient:
+    """Lazily built httpx.Client with explicit pool limits and timeouts, one per process"""
+
+    def __init__(self, max_connections: int = 20, max_keepalive: int = 10, keepalive_expiry: float = 30.0,
+                 connect_timeout: float = 5.0, read_timeout: float = 30.0, http2: bool = False):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.http2 = http2 and self._http2_available()
+        self._client: Optional[httpx.Client] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _http2_available() -> bool:
+        if importlib.util.find_spec('h2') is None:
+            logger.warning("⚠️  HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1")
+            return False
+        return True
+
+    def new_client(self, **kwargs) -> httpx.Client:
+        """Build a separate client with this pool's settings (e.g. for an SDK that owns its client)"""
+        return httpx.Client(limits=self.limits, timeout=self.timeout, http2=self.http2, **kwargs)
+
+    def new_async_client(self, max_connections: Optional[int] = None, **kwargs) -> httpx.AsyncClient:
+        """Build an async client with this pool's settings; it belongs to the event loop that uses it
+
+        max_connections overrides the pool size, so it can match how many calls the loop lets through.
+        """
+        limits = self.limits
+        if max_connections is not None:
+            limits = httpx.Limits(max_connections=max_connections,
+                                  max_keepalive_connections=limits.max_keepalive_connections,
+                                  keepalive_expiry=limits.keepalive_expiry)
+        return httpx.AsyncClient(limits=limits, timeout=self.timeout, http2=self.http2, **kwargs)
+
+    def get(self) -> httpx.Client:
+        """Return the shared client for the current process"""
+        client = self._client
+        if client is not None and self._pid == os.getpid():
+            return client
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                # Never close an inherited client: its sockets belong to the parent
+                self._client = self.new_client()
+                self._pid = os.getpid()
+            return self._client
+
+    def close(self) -> None:
+        """Close the pool owned by this process"""
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._pid = None
+
+
+class ProcessLocal:
+    """A value built by factory on first use in each process, e.g. an SDK client.
+
+    Nothing is built at import, so a --preload master never creates a client
+    (or opens its sockets) that its workers would inherit.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self.factory = factory
+        self._value: Any = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        value = self._value
+        if value is not None and self._pid == os.getpid():
+            return value
+        with self._lock:
+            if self._value is None or self._pid != os.getpid():
+                self._value = self.factory()
+                self._pid = os.getpid()
+            return self._value
@@ -0,0 +1,395 @@
+"""
+Bulk synthesis jobs persisted in SQLite and processed by a background worker pool.
+
+Items are claimed with a lease, so every gunicorn worker can run a pool against
+the same database and items held by a worker that died are picked up again once
+their lease expires. Building the archive of a finished job is leased the same way.
+"""
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Applied in order; PRAGMA user_version records how many a database has seen
+MIGRATIONS = [
+    # The validated request params, replayed verbatim (format, speed_mode, ...)
+    'ALTER TABLE job_items ADD COLUMN params TEXT',
+    # The quota buckets the job was charged against, so items that cost nothing can be refunded
+    'ALTER TABLE jobs ADD COLUMN quota_buckets TEXT',
+    # Lease on building the archive, taken over when the worker holding it died
+    'ALTER TABLE jobs ADD COLUMN lease_until REAL',
+]
+
+
+class JobStore:
+    """SQLite persistence for jobs and their items"""
+
+    def __init__(self, db_file: Path, lease_seconds: float = 300, max_attempts: int = 3):
+        self.db_file = db_file
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.init_db()
+
+    def get_db_connection(self) -> sqlite3.Connection:
+        """Establish and return a database connection"""
+        conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self) -> None:
+        """Initialize the database schema"""
+        conn = self.get_db_connection()
+        try:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    owner_id TEXT,
+                    status TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    finished_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS job_items (
+                    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    voice TEXT NOT NULL,
+                    service TEXT NOT NULL,
+                    speed REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    filename TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_until REAL,
+                    PRIMARY KEY (job_id, position)
+                );
+                CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (status, lease_until);
+            ''')
+            self.migrate(conn)
+            logger.info("Job database initialized successfully at %s", self.db_file)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def migrate(conn: sqlite3.Connection) -> None:
+        """Apply schema migrations the database hasn't seen yet"""
+        # Workers start together; the write lock makes the others wait and then find nothing to do
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for i, statement in enumerate(MIGRATIONS[version:], start=version + 1):
+                conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {i}')
+                logger.info("Applied job database migration %d", i)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def create_job(self, owner_id: Optional[str], items: List[Dict[str, Any]],
+                   quota_buckets: Optional[List[Any]] = None) -> str:
+        """Persist a new job and its items, returning the job id"""
+        job_id = uuid.uuid4().hex
+        conn = self.get_db_connection()
+        try:
+            conn.execute('BEGIN')
+            conn.execute(
+                'INSERT INTO jobs (id, owner_id, status, total, created_at, quota_buckets) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, owner_id, 'running', len(items), time.time(),
+                 json.dumps(quota_buckets) if quota_buckets is not None else None)
+            )
+            conn.executemany(
+                'INSERT INTO job_items (job_id, position, text, voice, service, speed, params) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(job_id, i, item['text'], item['voice'], item['service'], item['speed'], json.dumps(item))
+                 for i, item in enumerate(items)]
+            )
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job with per-status item counts, or None"""
+        conn = self.get_db_connection()
+        try:
+            job = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if not job:
+                return None
+            counts = dict(conn.execute(
+                'SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status', (job_id,)
+            ).fetchall())
+            errors = conn.execute(
+                "SELECT position, error FROM job_items WHERE job_id = ? AND status = 'failed' ORDER BY position",
+                (job_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return {
+            'id': job['id'],
+            'owner_id': job['owner_id'],
+            'status': job['status'],
+            'total': job['total'],
+            'completed': counts.get('completed', 0),
+            'failed': counts.get('failed', 0),
+            'pending': counts.get('pending', 0) + counts.get('running', 0),
+            'created_at': job['created_at'],
+            'finished_at': job['finished_at'],
+            'errors': [{'position': row['position'], 'error': row['error']} for row in errors],
+        }
+
+    def claim_item(self) -> Optional[sqlite3.Row]:
+        """Lease the next pending (or abandoned) item to this worker"""
+        now = time.time()
+        conn = self.get_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT job_items.*, jobs.quota_buckets FROM job_items JOIN jobs ON jobs.id = job_items.job_id "
+                "WHERE job_items.status = 'pending' OR (job_items.status = 'running' AND job_items.lease_until < ?) "
+                "ORDER BY job_items.rowid LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE job_items SET status = 'running', lease_until = ?, attempts = attempts + 1 "
+                    "WHERE job_id = ? AND position = ?",
+                    (now + self.lease_seconds, row['job_id'], row['position'])
+                )
+            conn.execute('COMMIT')
+            return row
+        finally:
+            conn.close()
+
+    def finish_item(self, job_id: str, position: int, filename: Optional[str] = None,
+                    error: Optional[str] = None, attempts: int = 0) -> bool:
+        """Record an item result; returns True if this call finished the whole job"""
+        if error and attempts < self.max_attempts:
+            status = 'pending'
+        else:
+            status = 'failed' if error else 'completed'
+        conn = self.get_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                'UPDATE job_items SET status = ?, filename = ?, error = ?, lease_until = NULL '
+                'WHERE job_id = ? AND position = ?',
+                (status, filename, error, job_id, position)
+            )
+            remaining = conn.execute(
+                "SELECT COUNT(*) FROM job_items WHERE job_id = ? AND status IN ('pending', 'running')", (job_id,)
+            ).fetchone()[0]
+            finished = False
+            if remaining == 0:
+                # Only one worker wins the transition and builds the archive
+                finished = conn.execute(
+                    "UPDATE jobs SET status = 'archiving', lease_until = ? WHERE id = ? AND status = 'running'",
+                    (time.time() + self.lease_seconds, job_id)
+                ).rowcount == 1
+            conn.execute('COMMIT')
+            return finished
+        finally:
+            conn.close()
+
+    def claim_archive(self) -> Optional[str]:
+        """Lease the archive of a job whose archiving worker died, returning the job id"""
+        now = time.time()
+        conn = self.get_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # Jobs that started archiving before the lease existed have none and are taken over too
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'archiving' AND (lease_until IS NULL OR lease_until < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row:
+                conn.execute('UPDATE jobs SET lease_until = ? WHERE id = ?', (now + self.lease_seconds, row['id']))
+            conn.execute('COMMIT')
+            return row['id'] if row else None
+        finally:
+            conn.close()
+
+    def mark_finished(self, job_id: str, status: str) -> None:
+        """Record the final status of a job"""
+        conn = self.get_db_connection()
+        try:
+            conn.execute('UPDATE jobs SET status = ?, finished_at = ?, lease_until = NULL WHERE id = ?',
+                         (status, time.time(), job_id))
+        finally:
+            conn.close()
+
+    def completed_items(self, job_id: str) -> List[sqlite3.Row]:
+        """Return the successfully synthesized items of a job in order"""
+        conn = self.get_db_connection()
+        try:
+            return conn.execute(
+                "SELECT position, text, filename FROM job_items WHERE job_id = ? AND status = 'completed' "
+                "ORDER BY position",
+                (job_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def purge_finished(self, older_than: float) -> List[str]:
+        """Delete finished jobs older than the given timestamp, returning their ids"""
+        conn = self.get_db_connection()
+        try:
+            conn.execute('PRAGMA foreign_keys = ON')
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (older_than,)
+            ).fetchall()]
+            conn.executemany('DELETE FROM jobs WHERE id = ?', [(job_id,) for job_id in ids])
+            return ids
+        finally:
+            conn.close()
+
+
+class JobRunner:
+    """Background worker pool that drains the job queue"""
+
+    def __init__(self, store: JobStore, jobs_dir: Path, synthesize: Callable[[Dict[str, Any]], Path],
+                 workers: int = 2, poll_interval: float = 2.0, retention_seconds: float = 86400,
+                 meter: Optional[Callable[[], ContextManager[Dict[str, int]]]] = None,
+                 refund: Optional[Callable[[List[Any], int], None]] = None):
+        self.store = store
+        self.jobs_dir = jobs_dir
+        self.synthesize = synthesize
+        # Counts the characters a synthesis sends to the provider
+        self.meter = meter
+        # Returns characters to the quota buckets a job was charged against
+        self.refund = refund
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._wakeup = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+
+    def start(self) -> None:
+        """Start the worker threads once per process"""
+        with self._lock:
+            # Threads don't survive a fork: a child whose parent started them starts its own
+            if any(thread.is_alive() for thread in self._threads):
+                return
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self) -> None:
+        """Wake idle workers after new items were queued"""
+        self._wakeup.set()
+
+    def archive_path(self, job_id: str) -> Path:
+        """Return where the ZIP of a finished job is stored"""
+        return self.jobs_dir / f"{job_id}.zip"
+
+    def _run(self) -> None:
+        while True:
+            try:
+                if not self.run_once():
+                    self._purge_expired()
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+            except Exception as e:
+                logger.error(f"❌ Job worker error: {e}", exc_info=True)
+                time.sleep(self.poll_interval)
+
+    def run_once(self) -> bool:
+        """Process a single item or abandoned archive; returns False when the queue is empty"""
+        item = self.store.claim_item()
+        if not item:
+            job_id = self.store.claim_archive()
+            if not job_id:
+                return False
+            logger.warning(f"⚠️  Job {job_id} was left archiving, building its archive again")
+            self._archive(job_id)
+            return True
+        job_id, position = item['job_id'], item['position']
+        if item['params']:
+            params = json.loads(item['params'])
+        else:
+            params = {'text': item['text'], 'voice': item['voice'], 'service': item['service'], 'speed': item['speed'],
+                      'format': 'mp3'}
+        quota_buckets = json.loads(item['quota_buckets']) if item['quota_buckets'] else None
+        try:
+            with self.meter() if self.meter else nullcontext() as meter:
+                path = self.synthesize(params)
+            if meter is not None:
+                # Cached audio and local stretches were charged with the job but never reached the provider
+                self._refund(quota_buckets, len(params['text']) - meter['characters'])
+            # Keep our own link to the audio so cache eviction can't remove it before archiving
+            item_dir = self.jobs_dir / job_id
+            item_dir.mkdir(exist_ok=True)
+            target = item_dir / f"{position:04d}{path.suffix}"
+            if target.exists():
+                target.unlink()
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copyfile(path, target)
+            finished = self.store.finish_item(job_id, position, filename=target.name)
+        except Exception as e:
+            logger.warning(f"⚠️  Job {job_id} item {position} failed (attempt {item['attempts'] + 1}): {e}")
+            if item['attempts'] + 1 >= self.store.max_attempts:
+                self._refund(quota_buckets, len(params['text']))
+            finished = self.store.finish_item(job_id, position, error=str(e), attempts=item['attempts'] + 1)
+        if finished:
+            self._archive(job_id)
+        return True
+
+    def _refund(self, quota_buckets: Optional[List[Any]], characters: int) -> None:
+        if self.refund and quota_buckets and characters > 0:
+            self.refund(quota_buckets, characters)
+
+    def _archive(self, job_id: str) -> None:
+        item_dir = self.jobs_dir / job_id
+        archive = self.archive_path(job_id)
+        tmp = archive.with_suffix('.zip.part')
+        try:
+            items = self.store.completed_items(job_id)
+            # Audio is already compressed, so store entries without deflating them again
+            with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_STORED) as zf:
+                for row in items:
+                    slug = ''.join(c if c.isalnum() else '-' for c in row['text'][:40]).strip('-').lower()
+                    zf.write(item_dir / row['filename'], f"{row['position'] + 1:04d}-{slug or 'audio'}{Path(row['filename']).suffix}")
+            os.replace(tmp, archive)
+        except Exception as e:
+            # A finished_at lets purge_finished clean the job up like any other
+            logger.error(f"❌ Job {job_id} archive could not be built: {e}", exc_info=True)
+            tmp.unlink(missing_ok=True)
+            shutil.rmtree(item_dir, ignore_errors=True)
+            self.store.mark_finished(job_id, 'failed')
+            return
+        job = self.store.get_job(job_id)
+        self.store.mark_finished(job_id, 'completed' if job['failed'] == 0 else 'completed_with_errors')
+        # Removed only once the job is finished, so a worker taking over the archive still finds the audio
+        shutil.rmtree(item_dir, ignore_errors=True)
+        logger.info(f"📦 Job {job_id} finished: {job['completed']}/{job['total']} item(s) archived")
+
+    def _purge_expired(self) -> None:
+        now = time.time()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        for job_id in self.store.purge_finished(now - self.retention_seconds):
+            try:
+                self.archive_path(job_id).unlink()
+            except FileNotFoundError:
+                pass
+            shutil.rmtree(self.jobs_dir / job_id, ignore_errors=True)
@@ -0,0 +1,95 @@
+"""
+Prometheus metrics for the TTS app, aggregated across gunicorn workers.
+
+When PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets and empties it when
+the master starts), every worker writes its samples to memory-mapped files in
+that directory and /metrics, served by whichever worker receives the scrape,
+adds them all up. Without it the metrics cover the current process only, which
+is what the Flask development server and the tests use.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+# Provider calls take from a few hundred milliseconds to tens of seconds for long texts
+PROVIDER_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+
+PROVIDER_LATENCY = Histogram('tts_provider_request_seconds', 'Duration of provider synthesis calls',
+                             ['service', 'voice'], buckets=PROVIDER_BUCKETS)
+PROVIDER_FIRST_BYTE = Histogram('tts_provider_first_byte_seconds', 'Time until the provider returned the first audio bytes',
+                                ['service', 'voice'], buckets=PROVIDER_BUCKETS)
+PROVIDER_FAILURES = Counter('tts_provider_failures', 'Provider synthesis calls that failed', ['service'])
+CHARACTERS_SYNTHESIZED = Counter('tts_characters_synthesized', 'Characters sent to providers', ['service'])
+BYTES_SYNTHESIZED = Counter('tts_audio_bytes_synthesized', 'Audio bytes received from providers', ['service'])
+CLEANUP_SECONDS = Histogram('tts_audio_cleanup_seconds', 'Duration of audio cleanup passes',
+                            buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60))
+CLEANUP_FILES_DELETED = Counter('tts_audio_cleanup_files_deleted', 'Audio files deleted by cleanup')
+TRANSCODE_SECONDS = Histogram('tts_transcode_seconds', 'Duration of ffmpeg conversions', ['format'],
+                              buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120))
+AUDIO_BYTES_SERVED = Counter('tts_audio_bytes_served', 'Audio bytes sent to clients', ['route'])
+AUTH_DB_SECONDS = Histogram('tts_auth_db_query_seconds', 'Latency of user database queries', ['query'],
+                            buckets=DB_BUCKETS)
+RATE_LIMIT_REJECTIONS = Counter('tts_rate_limit_rejections', 'Requests rejected by a rate limit or quota', ['limit'])
+
+
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+class SnapshotCollector:
+    """Reports gauges read at scrape time, e.g. the size of the audio directory"""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def collect(self):
+        yield GaugeMetricFamily(self.name, self.documentation, value=self.read())
+
+
+# Gauges computed on demand by the scraping worker rather than written by every worker
+_snapshots = CollectorRegistry(auto_describe=False)
+
+
+def register_snapshot(name: str, documentation: str, read: Callable[[], float]) -> None:
+    _snapshots.register(SnapshotCollector(name, documentation, read))
+
+
+def render() -> Tuple[bytes, str]:
+    """Return the exposition text for all workers and its content type"""
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(_snapshots), CONTENT_TYPE_LATEST
+
+
+@contextmanager
+def observe_provider_call(service: str, voice: str, characters: int) -> Iterator[Dict[str, float]]:
+    """Time one provider call; the caller adds to result['bytes'] and sets result['first_byte']"""
+    result = {'bytes': 0}
+    start = time.perf_counter()
+    try:
+        yield result
+    except Exception:
+        PROVIDER_FAILURES.labels(service).inc()
+        raise
+    PROVIDER_LATENCY.labels(service, voice).observe(time.perf_counter() - start)
+    if 'first_byte' in result:
+        PROVIDER_FIRST_BYTE.labels(service, voice).observe(result['first_byte'] - start)
+    CHARACTERS_SYNTHESIZED.labels(service).inc(characters)
+    BYTES_SYNTHESIZED.labels(service).inc(result['bytes'])
+
+
+def mark_process_dead(pid: int) -> None:
+    """Drop a dead worker's live gauges; called from gunicorn's child_exit hook"""
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(pid)
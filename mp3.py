@@ -0,0 +1,127 @@
+"""
+Minimal MPEG audio Layer III frame handling for joining segments without re-encoding.
+"""
+import math
+from collections import namedtuple
+from typing import Iterable, Iterator, Optional
+
+FrameHeader = namedtuple('FrameHeader', 'version sample_rate bitrate channels length samples')
+
+# Layer III bitrates in kbit/s, indexed by the 4-bit bitrate index
+BITRATES_MPEG1 = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+BITRATES_MPEG2 = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+
+# Sample rates indexed by the 2-bit version id (0 = MPEG 2.5, 2 = MPEG 2, 3 = MPEG 1)
+SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+VBR_TAGS = (b'Xing', b'Info', b'VBRI')
+
+# Silence defaults to what Azure Speech produces: MPEG-2, 24 kHz, mono
+DEFAULT_SILENCE_FORMAT = FrameHeader(2, 24000, 32000, 1, 96, 576)
+
+
+def parse_frame_header(data: bytes, offset: int = 0) -> Optional[FrameHeader]:
+    """Parse a Layer III frame header at offset, or return None if there isn't one"""
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    bitrate_index = (b2 >> 4) & 0x0F
+    rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    padding = (b2 >> 1) & 0x01
+    channels = 1 if (b3 >> 6) == 3 else 2
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    if version == 3:
+        bitrate = BITRATES_MPEG1[bitrate_index] * 1000
+        length = 144 * bitrate // sample_rate + padding
+        samples = 1152
+    else:
+        bitrate = BITRATES_MPEG2[bitrate_index] * 1000
+        length = 72 * bitrate // sample_rate + padding
+        samples = 576
+    return FrameHeader(version, sample_rate, bitrate, channels, length, samples)
+
+
+def id3v2_length(data: bytes) -> int:
+    """Return the size of a leading ID3v2 tag, or 0"""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _is_vbr_info_frame(data: bytes, offset: int, header: FrameHeader) -> bool:
+    if header.version == 3:
+        side_info = 17 if header.channels == 1 else 32
+    else:
+        side_info = 9 if header.channels == 1 else 17
+    xing_at = offset + 4 + side_info
+    return data[xing_at:xing_at + 4] in VBR_TAGS or data[offset + 36:offset + 40] == b'VBRI'
+
+
+def audio_frames(data: bytes) -> bytes:
+    """Strip ID3 tags and any Xing/Info/VBRI header frame, leaving only audio frames"""
+    start = id3v2_length(data)
+    end = len(data)
+    if end - start >= 128 and data[end - 128:end - 125] == b'TAG':
+        end -= 128
+    # Skip any junk before the first valid frame
+    while start < end - 4:
+        header = parse_frame_header(data, start)
+        if header:
+            if _is_vbr_info_frame(data, start, header):
+                start += header.length
+            return data[start:end]
+        start += 1
+    return b''
+
+
+def duration(data: bytes) -> float:
+    """Return the playing time of MP3 data in seconds, summed over its audio frames"""
+    frames = audio_frames(data)
+    seconds, offset = 0.0, 0
+    while True:
+        header = parse_frame_header(frames, offset)
+        if not header:
+            return seconds
+        seconds += header.samples / header.sample_rate
+        offset += header.length
+
+
+def join_segments(segments: Iterable[bytes]) -> Iterator[bytes]:
+    """Yield the audio frames of each MP3 segment in order, forming one continuous stream"""
+    for segment in segments:
+        frames = audio_frames(segment)
+        if frames:
+            yield frames
+
+
+def silence(seconds: float, like: Optional[FrameHeader] = None) -> bytes:
+    """Return 32 kbit/s frames of digital silence lasting at least seconds.
+
+    Pass the header of the neighbouring audio so the sample rate, MPEG version
+    and channel mode match and the joined stream stays decodable.
+    """
+    like = like or DEFAULT_SILENCE_FORMAT
+    rate_index = SAMPLE_RATES[like.version].index(like.sample_rate)
+    bitrate_index = 1 if like.version == 3 else 4  # 32 kbit/s in both tables
+    header = bytes([
+        0xFF,
+        0xE0 | (like.version << 3) | 0x02 | 0x01,  # Layer III, no CRC
+        (bitrate_index << 4) | (rate_index << 2),
+        0xC0 if like.channels == 1 else 0x00,
+    ])
+    length = parse_frame_header(header).length
+    # All-zero side information and main data decode as silence
+    frame = header + bytes(length - len(header))
+    return frame * math.ceil(seconds * like.sample_rate / like.samples)
@@ -0,0 +1,143 @@
+"""
+Password hashing on a small dedicated thread pool with admission control.
+
+Memory-hard hashes take tens of milliseconds of CPU each. Running them on a
+bounded executor caps how many run at once in a worker, and refusing work once
+the queue is full keeps a burst of logins from starving synthesis requests.
+
+Run ``python password_hashing.py`` to measure hashes per second per core for the
+configured parameters.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional, TypeVar
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full or a hash doesn't finish in time"""
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded executor"""
+
+    def __init__(self, method: str = 'scrypt', salt_length: int = 16, workers: int = 2,
+                 max_pending: int = 8, timeout: float = 10.0):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.timeout = timeout
+        self.rejected = 0
+        self.completed = 0
+        self._admission = threading.BoundedSemaphore(workers + max_pending)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._method_prefix: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def hash(self, password: str) -> str:
+        """Return a new hash of password with the configured parameters"""
+        return self._run(generate_password_hash, password, method=self.method, salt_length=self.salt_length)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        """Check password against a stored hash"""
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """True if pwhash was made with different parameters than the configured ones"""
+        method, _, rest = pwhash.partition('$')
+        salt = rest.partition('$')[0]
+        return method != self.method_prefix() or len(salt) != self.salt_length
+
+    def method_prefix(self) -> str:
+        """Return the fully expanded method string, e.g. 'scrypt:32768:8:1'"""
+        if self._method_prefix is None:
+            # Werkzeug fills in defaults for a bare method name; hash once to see them
+            self._method_prefix = generate_password_hash('', method=self.method, salt_length=1).partition('$')[0]
+        return self._method_prefix
+
+    def stats(self) -> Dict[str, int]:
+        """Return hashing counters for this process"""
+        with self._lock:
+            return {'workers': self.workers, 'completed': self.completed, 'rejected': self.rejected}
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            # Executor threads don't survive a fork; build a fresh pool in each worker
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        if not self._admission.acquire(blocking=False):
+            self._count('rejected')
+            logger.warning("⏳ Password hashing queue is full, rejecting request")
+            raise HashingBusy("Too many password checks in progress")
+        try:
+            future = self._pool().submit(func, *args, **kwargs)
+        except BaseException:
+            self._admission.release()
+            raise
+        future.add_done_callback(lambda _: self._admission.release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._count('rejected')
+            raise HashingBusy("Password check timed out")
+        self._count('completed')
+        return result
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def benchmark(method: str, salt_length: int = 16, seconds: float = 3.0, threads: Optional[int] = None) -> Dict[str, float]:
+    """Hash continuously on `threads` threads and report throughput"""
+    threads = threads or os.cpu_count() or 1
+    deadline = time.perf_counter() + seconds
+    counts = [0] * threads
+
+    def work(i: int) -> None:
+        while time.perf_counter() < deadline:
+            generate_password_hash('benchmark-password', method=method, salt_length=salt_length)
+            counts[i] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(work, range(threads)))
+    elapsed = time.perf_counter() - start
+    total = sum(counts)
+    return {
+        'method': PasswordHasher(method, salt_length).method_prefix(),
+        'threads': threads,
+        'hashes': total,
+        'hashes_per_second': total / elapsed,
+        'hashes_per_second_per_core': total / elapsed / threads,
+        'ms_per_hash': elapsed * threads * 1000 / total if total else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure password hashing throughput')
+    parser.add_argument('--method', default=os.getenv('PASSWORD_HASH_METHOD', 'scrypt'))
+    parser.add_argument('--salt-length', type=int, default=int(os.getenv('PASSWORD_SALT_LENGTH', 16)))
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--threads', type=int, default=None, help='defaults to the number of CPU cores')
+    args = parser.parse_args()
+    result = benchmark(args.method, args.salt_length, args.seconds, args.threads)
+    print(f"{result['method']}: {result['hashes_per_second_per_core']:.1f} hashes/s/core "
+          f"({result['hashes_per_second']:.1f} hashes/s on {result['threads']} threads, "
+          f"{result['ms_per_hash']:.1f} ms/hash)")
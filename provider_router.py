@@ -0,0 +1,397 @@
+"""
+Latency-aware routing of synthesis calls across several backends of a provider.
+
+A backend is one Azure Speech region or one Azure OpenAI deployment. Each keeps
+a rolling window of time-to-first-byte latencies and outcomes. A backend whose
+error rate or run of consecutive failures crosses a threshold is skipped by an
+open circuit breaker until a cool-down has passed, then a single probe is let
+through. Throttled or failed calls move on to the next backend, backing off as
+the provider's Retry-After asks, and short texts are hedged with a second
+request to another backend once the first has taken longer than its p95.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class ProviderError(Exception):
+    """A failed provider call; retryable errors count against the backend's health"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None,
+                 retryable: bool = True):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+
+def is_retryable_status(status_code: int) -> bool:
+    """Throttling, timeouts and server errors are worth another attempt"""
+    return status_code in (408, 429) or status_code >= 500
+
+
+def retry_after_from_headers(headers: Any) -> Optional[float]:
+    """Seconds the provider asked us to wait, from retry-after-ms or Retry-After"""
+    for name, scale in (('retry-after-ms', 1000.0), ('retry-after', 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(0.0, float(value) / scale)
+            except ValueError:
+                continue
+    return None
+
+
+class Backend:
+    """One provider endpoint with rolling statistics and circuit breaker state"""
+
+    def __init__(self, service: str, name: str, config: Optional[Dict[str, Any]] = None):
+        self.service = service
+        self.name = name
+        self.config = config or {}
+        self.consecutive_failures = 0
+        self.opened_until = 0.0
+        self.probing = False
+        self._samples: Deque[Tuple[float, Optional[float], bool]] = deque()
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"Backend({self.service}:{self.name})"
+
+    def _trim(self, now: float, window_seconds: float) -> None:
+        while self._samples and self._samples[0][0] < now - window_seconds:
+            self._samples.popleft()
+
+    def latencies(self, now: float, window_seconds: float) -> List[float]:
+        with self._lock:
+            self._trim(now, window_seconds)
+            return sorted(latency for _, latency, ok in self._samples if ok)
+
+    def error_rate(self, now: float, window_seconds: float) -> Tuple[float, int]:
+        """Return (failure ratio, number of calls) within the window"""
+        with self._lock:
+            self._trim(now, window_seconds)
+            total = len(self._samples)
+            failures = sum(1 for _, _, ok in self._samples if not ok)
+        return (failures / total if total else 0.0), total
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Return the nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class ProviderRouter:
+    """Chooses backends per call, retries with backoff and hedges slow short requests"""
+
+    def __init__(self, backends: Dict[str, List[Backend]], window_seconds: float = 300.0,
+                 failure_rate: float = 0.5, min_calls: int = 10, max_consecutive_failures: int = 5,
+                 open_seconds: float = 30.0, max_attempts: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0, hedge_max_chars: int = 300, hedge_min_samples: int = 20,
+                 hedge_workers: int = 16):
+        self.backends = backends
+        self.window_seconds = window_seconds
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.max_consecutive_failures = max_consecutive_failures
+        self.open_seconds = open_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_max_chars = hedge_max_chars
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_workers = hedge_workers
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    # --- Health ---
+
+    def record_success(self, backend: Backend, latency: float) -> None:
+        now = time.monotonic()
+        with backend._lock:
+            backend._samples.append((now, latency, True))
+            backend.consecutive_failures = 0
+            if backend.opened_until:
+                logger.info(f"✅ Circuit closed for {backend.service} backend {backend.name}")
+            backend.opened_until = 0.0
+            backend.probing = False
+
+    def record_failure(self, backend: Backend) -> None:
+        now = time.monotonic()
+        with backend._lock:
+            backend._samples.append((now, None, False))
+            backend.consecutive_failures += 1
+            half_open = backend.probing
+            backend.probing = False
+        rate, calls = backend.error_rate(now, self.window_seconds)
+        if (half_open or backend.consecutive_failures >= self.max_consecutive_failures
+                or (calls >= self.min_calls and rate >= self.failure_rate)):
+            with backend._lock:
+                backend.opened_until = now + self.open_seconds
+            logger.warning(f"🔌 Circuit opened for {backend.service} backend {backend.name} "
+                           f"({backend.consecutive_failures} consecutive failures, {rate:.0%} errors)")
+
+    def _admit(self, backend: Backend, now: float) -> bool:
+        """True if the breaker lets a call through; a cooled-down open breaker admits one probe"""
+        with backend._lock:
+            if not backend.opened_until:
+                return True
+            if now < backend.opened_until or backend.probing:
+                return False
+            backend.probing = True
+            return True
+
+    def p95(self, backend: Backend) -> Optional[float]:
+        latencies = backend.latencies(time.monotonic(), self.window_seconds)
+        if len(latencies) < self.hedge_min_samples:
+            return None
+        return percentile(latencies, 0.95)
+
+    def _pick(self, service: str, tried: List[Backend]) -> Optional[Backend]:
+        """Return the best admitted backend, preferring ones not yet tried in this call"""
+        now = time.monotonic()
+
+        def score(backend: Backend) -> Tuple[float, float]:
+            rate, _ = backend.error_rate(now, self.window_seconds)
+            # Backends without latency data yet keep their configured order behind measured ones
+            median = percentile(backend.latencies(now, self.window_seconds), 0.5)
+            return round(rate, 1), float('inf') if median is None else median
+
+        pool = sorted(self.backends.get(service, []), key=score)
+        for group in ([b for b in pool if b not in tried], [b for b in pool if b in tried]):
+            for backend in group:
+                if self._admit(backend, now):
+                    return backend
+        return None
+
+    def _hedge_target(self, service: str, backend: Backend, text_length: int,
+                      tried: List[Backend]) -> Optional[Tuple[float, Backend]]:
+        if text_length > self.hedge_max_chars:
+            return None
+        delay = self.p95(backend)
+        if delay is None:
+            return None
+        for other in self.backends.get(service, []):
+            if other is not backend and other not in tried and not other.opened_until:
+                return delay, other
+        return None
+
+    def _backoff(self, attempt: int, error: Optional[ProviderError]) -> float:
+        """Seconds to wait before retrying a backend that already failed in this call"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+        if error is not None and error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+        return delay
+
+    def _unavailable(self, service: str) -> ProviderError:
+        now = time.monotonic()
+        reopen = [b.opened_until - now for b in self.backends.get(service, []) if b.opened_until]
+        return ProviderError(f"No healthy {service} backend is available", 503,
+                             retry_after=max(1.0, min(reopen)) if reopen else None, retryable=False)
+
+    def _plan(self, service: str, attempt: int, tried: List[Backend],
+              last_error: Optional[ProviderError]) -> Tuple[Backend, float]:
+        """Choose the next backend and how long to wait before calling it"""
+        backend = self._pick(service, tried)
+        if backend is None:
+            raise last_error or self._unavailable(service)
+        delay = 0.0
+        if backend in tried:
+            delay = self._backoff(attempt, last_error)
+            if delay > self.backoff_max:
+                # Retry-After is longer than we are willing to hold the request
+                raise last_error
+        if attempt:
+            with self._lock:
+                self.retries += 1
+            logger.info(f"🔁 Retrying {service} on {backend.name} in {delay:.1f}s "
+                        f"(attempt {attempt + 1}/{self.max_attempts})")
+        return backend, delay
+
+    # --- Synchronous calls ---
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.hedge_workers, thread_name_prefix='provider-hedge')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _timed(self, backend: Backend, attempt: Callable[[Backend], T]) -> T:
+        start = time.monotonic()
+        try:
+            result = attempt(backend)
+        except ProviderError as e:
+            if e.retryable:
+                self.record_failure(backend)
+            else:
+                with backend._lock:
+                    backend.probing = False
+            raise
+        self.record_success(backend, time.monotonic() - start)
+        return result
+
+    def call(self, service: str, text_length: int, attempt: Callable[[Backend], T],
+             discard: Callable[[T], Any] = lambda result: None) -> T:
+        """Run attempt(backend) on the best backend, with retries and hedging.
+
+        attempt should return once the provider has started answering (e.g. with
+        the first chunk), so its duration is the time to first byte. discard
+        releases the result of a hedged request that lost the race.
+        """
+        tried: List[Backend] = []
+        last_error: Optional[ProviderError] = None
+        for n in range(self.max_attempts):
+            backend, delay = self._plan(service, n, tried, last_error)
+            if delay:
+                time.sleep(delay)
+            hedge = self._hedge_target(service, backend, text_length, tried)
+            tried.append(backend)
+            try:
+                if hedge is None:
+                    return self._timed(backend, attempt)
+                return self._hedged(backend, hedge, attempt, discard, tried)
+            except ProviderError as e:
+                if not e.retryable:
+                    raise
+                last_error = e
+        raise last_error
+
+    def _hedged(self, backend: Backend, hedge: Tuple[float, Backend], attempt: Callable[[Backend], T],
+                discard: Callable[[T], Any], tried: List[Backend]) -> T:
+        delay, other = hedge
+        pool = self._pool()
+        primary = pool.submit(self._timed, backend, attempt)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        logger.info(f"🏁 Hedging {backend.service} request on {other.name} after {delay:.2f}s")
+        tried.append(other)
+        with self._lock:
+            self.hedges += 1
+        secondary = pool.submit(self._timed, other, attempt)
+        pending = {primary, secondary}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winners = [future for future in (primary, secondary) if future in done and future.exception() is None]
+            if not winners:
+                error = next(iter(done)).exception()
+                continue
+            for loser in winners[1:]:
+                discard(loser.result())
+            for loser in pending:
+                loser.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+            if winners[0] is secondary:
+                with self._lock:
+                    self.hedge_wins += 1
+            return winners[0].result()
+        raise error
+
+    # --- Asynchronous calls ---
+
+    async def acall(self, service: str, text_length: int, attempt: Callable[[Backend], Awaitable[T]],
+                    discard: Callable[[T], Awaitable[Any]]) -> T:
+        """Async counterpart of call(); the losing leg of a hedge is cancelled"""
+        tried: List[Backend] = []
+        last_error: Optional[ProviderError] = None
+        for n in range(self.max_attempts):
+            backend, delay = self._plan(service, n, tried, last_error)
+            if delay:
+                await asyncio.sleep(delay)
+            hedge = self._hedge_target(service, backend, text_length, tried)
+            tried.append(backend)
+            try:
+                if hedge is None:
+                    return await self._atimed(backend, attempt)
+                return await self._ahedged(backend, hedge, attempt, discard, tried)
+            except ProviderError as e:
+                if not e.retryable:
+                    raise
+                last_error = e
+        raise last_error
+
+    async def _atimed(self, backend: Backend, attempt: Callable[[Backend], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        try:
+            result = await attempt(backend)
+        except ProviderError as e:
+            if e.retryable:
+                self.record_failure(backend)
+            else:
+                with backend._lock:
+                    backend.probing = False
+            raise
+        except asyncio.CancelledError:
+            with backend._lock:
+                backend.probing = False
+            raise
+        self.record_success(backend, time.monotonic() - start)
+        return result
+
+    async def _ahedged(self, backend: Backend, hedge: Tuple[float, Backend], attempt: Callable[[Backend], Awaitable[T]],
+                       discard: Callable[[T], Awaitable[Any]], tried: List[Backend]) -> T:
+        delay, other = hedge
+        primary = asyncio.ensure_future(self._atimed(backend, attempt))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        logger.info(f"🏁 Hedging {backend.service} request on {other.name} after {delay:.2f}s")
+        tried.append(other)
+        with self._lock:
+            self.hedges += 1
+        secondary = asyncio.ensure_future(self._atimed(other, attempt))
+        pending = {primary, secondary}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in (primary, secondary) if task in done and task.exception() is None]
+                if not winners:
+                    error = next(iter(done)).exception()
+                    continue
+                for loser in winners[1:]:
+                    await discard(loser.result())
+                if winners[0] is secondary:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return winners[0].result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-backend health and routing counters for this process"""
+        now = time.monotonic()
+        backends = {}
+        for service, pool in self.backends.items():
+            for backend in pool:
+                latencies = backend.latencies(now, self.window_seconds)
+                rate, calls = backend.error_rate(now, self.window_seconds)
+                backends[f"{service}:{backend.name}"] = {
+                    'calls': calls,
+                    'error_rate': round(rate, 3),
+                    'p50_seconds': percentile(latencies, 0.5),
+                    'p95_seconds': percentile(latencies, 0.95),
+                    'circuit': 'open' if backend.opened_until > now else ('half_open' if backend.opened_until else 'closed'),
+                }
+        with self._lock:
+            return {'backends': backends, 'retries': self.retries, 'hedges': self.hedges, 'hedge_wins': self.hedge_wins}
@@ -0,0 +1,120 @@
+"""
+Character-budget token buckets shared by every worker on the host.
+
+Each bucket holds up to `capacity` characters and refills at `refill_per_second`.
+A request is charged its text length against all of its buckets (per user and
+per IP) in one SQLite transaction, so the budget is the same no matter how many
+gunicorn workers serve the traffic.
+"""
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+from typing import List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+Bucket = namedtuple('Bucket', 'key capacity refill_per_second')
+# retry_after is -1 when the cost exceeds a bucket's capacity and can never be paid
+QuotaResult = namedtuple('QuotaResult', 'allowed limit remaining retry_after')
+
+
+class CharacterQuota:
+    """Token buckets measured in characters, persisted in SQLite"""
+
+    def __init__(self, db_file: Path):
+        self.db_file = db_file
+        self.rejections = 0
+        self._local = threading.local()
+        self._guard = threading.Lock()
+        self.init_db()
+
+    def get_db_connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, reopening it after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def init_db(self) -> None:
+        """Initialize the database schema"""
+        self.get_db_connection().execute('''
+            CREATE TABLE IF NOT EXISTS quota_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+
+    def consume(self, buckets: List[Bucket], cost: int, now: Optional[float] = None) -> QuotaResult:
+        """Charge cost to every bucket, or to none of them if any is short"""
+        now = time.time() if now is None else now
+        conn = self.get_db_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            levels = [self._level(conn, bucket, now) for bucket in buckets]
+            allowed = all(tokens >= cost for tokens in levels)
+            if allowed:
+                levels = [tokens - cost for tokens in levels]
+                conn.executemany(
+                    'INSERT INTO quota_buckets (key, tokens, updated_at) VALUES (?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                    [(bucket.key, tokens, now) for bucket, tokens in zip(buckets, levels)]
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        # Report the tightest bucket
+        tightest = min(range(len(buckets)), key=lambda i: levels[i])
+        retry_after = 0
+        if not allowed:
+            with self._guard:
+                self.rejections += 1
+            waits = [self._wait(bucket, tokens, cost) for bucket, tokens in zip(buckets, levels)]
+            retry_after = -1 if -1 in waits else max(waits)
+        return QuotaResult(allowed, int(buckets[tightest].capacity), max(0, int(levels[tightest])), retry_after)
+
+    def refund(self, buckets: List[Bucket], cost: int, now: Optional[float] = None) -> QuotaResult:
+        """Give back characters charged for work that didn't reach the provider; returns the new balance"""
+        now = time.time() if now is None else now
+        conn = self.get_db_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for bucket in buckets:
+                conn.execute('UPDATE quota_buckets SET tokens = MIN(?, tokens + ?) WHERE key = ?',
+                             (bucket.capacity, cost, bucket.key))
+            levels = [self._level(conn, bucket, now) for bucket in buckets]
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        tightest = min(range(len(buckets)), key=lambda i: levels[i])
+        return QuotaResult(True, int(buckets[tightest].capacity), max(0, int(levels[tightest])), 0)
+
+    @staticmethod
+    def _level(conn: sqlite3.Connection, bucket: Bucket, now: float) -> float:
+        row = conn.execute('SELECT tokens, updated_at FROM quota_buckets WHERE key = ?', (bucket.key,)).fetchone()
+        if row is None:
+            return float(bucket.capacity)
+        tokens, updated_at = row
+        return min(float(bucket.capacity), tokens + max(0.0, now - updated_at) * bucket.refill_per_second)
+
+    @staticmethod
+    def _wait(bucket: Bucket, tokens: float, cost: int) -> int:
+        """Seconds until the bucket holds cost characters (-1 if it never can)"""
+        if cost > bucket.capacity or bucket.refill_per_second <= 0:
+            return -1
+        if tokens >= cost:
+            return 0
+        return math.ceil((cost - tokens) / bucket.refill_per_second)
@@ -0,0 +1,137 @@
+"""
+Single-flight coalescing of identical work across threads and worker processes.
+
+The first caller for a key holds the lock while it does the work; concurrent
+callers for the same key block until it is released and then re-check the
+result instead of repeating the work. Cross-process exclusion uses flock() on a
+lock file in a shared directory, so a crashed leader releases its lock
+automatically and the next waiter takes over.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows development hosts: coalesce within the process only
+    fcntl = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when a waiter gives up on the leader for a key"""
+
+
+class SingleFlight:
+    """Per-key mutex shared by threads in this process and by processes sharing lock_dir"""
+
+    def __init__(self, lock_dir: Path, timeout: float = 90.0, poll_interval: float = 0.05):
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.leaders = 0
+        self.waiters = 0
+        self.timeouts = 0
+        self._local: Dict[str, List] = {}
+        self._guard = threading.Lock()
+        try:
+            self.lock_dir.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            logger.warning("Unable to create lock directory %s: %s", self.lock_dir, e)
+
+    @contextmanager
+    def lock(self, key: str, timeout: Optional[float] = None) -> Iterator[bool]:
+        """Hold the lock for key; yields True if another caller held it first"""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        local = self._ref(key)
+        try:
+            waited = not local.acquire(blocking=False)
+            if waited and not local.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                self._timed_out(key)
+            try:
+                fd, file_waited = self._acquire_file(key, deadline)
+                try:
+                    with self._guard:
+                        if waited or file_waited:
+                            self.waiters += 1
+                        else:
+                            self.leaders += 1
+                    yield waited or file_waited
+                finally:
+                    self._release_file(key, fd)
+            finally:
+                local.release()
+        finally:
+            self._unref(key)
+
+    def stats(self) -> Dict[str, int]:
+        """Return coalescing counters for this process"""
+        with self._guard:
+            return {'leaders': self.leaders, 'waiters': self.waiters, 'timeouts': self.timeouts}
+
+    def _ref(self, key: str) -> threading.Lock:
+        with self._guard:
+            entry = self._local.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+            return entry[0]
+
+    def _unref(self, key: str) -> None:
+        with self._guard:
+            entry = self._local[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._local[key]
+
+    def _timed_out(self, key: str) -> None:
+        with self._guard:
+            self.timeouts += 1
+        raise SingleFlightTimeout(f"Timed out waiting for in-flight work on {key}")
+
+    def _acquire_file(self, key: str, deadline: float):
+        if fcntl is None:
+            return None, False
+        path = self.lock_dir / f"{key}.lock"
+        waited = False
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        waited = True
+                        if time.monotonic() >= deadline:
+                            self._timed_out(key)
+                        time.sleep(self.poll_interval)
+                # The previous holder unlinks the file on release; make sure we
+                # locked the file that is still in place and not an orphan.
+                try:
+                    current = os.stat(path)
+                except FileNotFoundError:
+                    os.close(fd)
+                    continue
+                if current.st_ino != os.fstat(fd).st_ino:
+                    os.close(fd)
+                    continue
+                return fd, waited
+            except BaseException:
+                os.close(fd)
+                raise
+
+    def _release_file(self, key: str, fd: Optional[int]) -> None:
+        if fd is None:
+            return
+        try:
+            os.unlink(self.lock_dir / f"{key}.lock")
+        except OSError:
+            pass
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
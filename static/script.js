@@ -2,40 +2,87 @@
     const textInput = document.getElementById('text-input');
     const serviceSelect = document.getElementById('service-select');
     const voiceSelect = document.getElementById('voice-select');
+    const languageSelect = document.getElementById('language-select');
     const speedSlider = document.getElementById('speed-slider');
     const speedValue = document.getElementById('speed-value');
+    const playbackFormat = document.getElementById('playback-format');
     const generateBtn = document.getElementById('generate-btn');
     const loading = document.getElementById('loading');
     const resultSection = document.getElementById('result-section');
     const audioPlayer = document.getElementById('audio-player');
     const downloadBtn = document.getElementById('download-btn');
     const errorMessage = document.getElementById('error-message');
+    const historySection = document.getElementById('history-section');
+    const historyList = document.getElementById('history-list');
+    const historyMore = document.getElementById('history-more');
 
     let currentFilename = null;
+    let historyCursor = null;
+
+    // MP3 is the default because only MP3 starts playing while it streams;
+    // Opus saves bandwidth but waits for the whole file. Drop it where the browser can't play Ogg Opus
+    if (playbackFormat && !audioPlayer.canPlayType('audio/ogg; codecs=opus')) {
+        playbackFormat.querySelector('option[value="opus"]').remove();
+    }
 
     // Speed slider update
     speedSlider.addEventListener('input', function () {
         speedValue.textContent = parseFloat(speedSlider.value).toFixed(1) + 'x';
     });
 
+    // Each service's voice list is fetched once per page; the browser revalidates it with its ETag
+    const voiceCache = {};
+
+    function fetchVoices(service) {
+        if (!voiceCache[service]) {
+            voiceCache[service] = fetch(`/get-voices?service=${service}`)
+                .then(response => response.ok ? response.json() : Promise.reject(new Error(response.statusText)))
+                .catch(error => {
+                    delete voiceCache[service];
+                    throw error;
+                });
+        }
+        return voiceCache[service];
+    }
+
+    function showVoices(voices) {
+        const language = languageSelect.value;
+        voiceSelect.innerHTML = '';
+        voices
+            .filter(voice => !language || voice.language === language)
+            .forEach((voice, index) => {
+                const option = document.createElement('option');
+                option.value = voice.name;
+                option.textContent = voice.displayName;
+                if (index === 0) {
+                    option.selected = true;
+                }
+                voiceSelect.appendChild(option);
+            });
+    }
+
+    function showLanguages(languages) {
+        const previous = languageSelect.value;
+        languageSelect.innerHTML = '';
+        const all = new Option(translations[currentLang]?.allLanguages || 'Alle', '');
+        all.dataset.i18n = 'allLanguages';
+        languageSelect.appendChild(all);
+        (languages || []).forEach(language => languageSelect.appendChild(new Option(language, language)));
+        // Keep the chosen language across services, or default to the page language if offered
+        const preferred = [previous, ...(languages || []).filter(language => language.startsWith(currentLang + '-'))];
+        languageSelect.value = preferred.find(language => language && (languages || []).includes(language)) || '';
+        languageSelect.parentElement.style.display = (languages || []).length > 1 ? '' : 'none';
+    }
+
     // Load voices when service changes
     async function loadVoices(service) {
         try {
-            const response = await fetch(`/get-voices?service=${service}`);
-            const data = await response.json();
-
-            if (response.ok && data.voices) {
-                voiceSelect.innerHTML = '';
-                data.voices.forEach((voice, index) => {
-                    const option = document.createElement('option');
-                    option.value = voice.name;
-                    option.textContent = voice.displayName;
-                    if (index === 0) {
-                        option.selected = true;
-                    }
-                    voiceSelect.appendChild(option);
-                });
+            const data = await fetchVoices(service);
+            if (serviceSelect.value !== service) {
+                return;  // The user switched service while this list was loading
             }
+            showLanguages(data.languages);
+            showVoices(data.voices);
         } catch (error) {
             console.error('Error loading voices:', error);
         }
@@ -46,9 +93,76 @@
         loadVoices(serviceSelect.value);
     });
 
+    languageSelect.addEventListener('change', async function () {
+        const data = await fetchVoices(serviceSelect.value);
+        showVoices(data.voices);
+    });
+
     // Load initial voices based on the selected service on page load
     loadVoices(serviceSelect.value);
 
+    // Earlier syntheses are listed from /history and replayed from their stored audio
+    function historyButton(item) {
+        const button = document.createElement('button');
+        const preview = document.createElement('span');
+        preview.textContent = item.text_preview;
+        const meta = document.createElement('span');
+        meta.className = 'history-meta';
+        const details = [item.voice, item.duration ? item.duration.toFixed(1) + ' s' : null];
+        if (!item.available) {
+            details.push(translations[currentLang]?.historyExpired || 'expired');
+            button.disabled = true;
+        }
+        meta.textContent = details.filter(Boolean).join(' · ');
+        button.append(preview, meta);
+        button.addEventListener('click', () => replayHistory(item));
+        const entry = document.createElement('li');
+        entry.appendChild(button);
+        return entry;
+    }
+
+    async function loadHistory(reset) {
+        const params = new URLSearchParams();
+        if (!reset && historyCursor) {
+            params.set('cursor', historyCursor);
+        }
+        try {
+            const response = await fetch(`/history?${params}`);
+            if (!response.ok) {
+                return;
+            }
+            const data = await response.json();
+            if (reset) {
+                historyList.innerHTML = '';
+            }
+            data.items.forEach(item => historyList.appendChild(historyButton(item)));
+            historyCursor = data.next_cursor;
+            historyMore.style.display = historyCursor ? '' : 'none';
+            historySection.style.display = historyList.children.length ? 'block' : 'none';
+        } catch (error) {
+            console.error('Error loading history:', error);
+        }
+    }
+
+    async function replayHistory(item) {
+        hideError();
+        try {
+            const response = await fetch(`/history/${item.id}/replay`, { method: 'POST' });
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || 'Failed to replay audio');
+            }
+            audioPlayer.src = data.audio_url;
+            currentFilename = data.filename;
+            showResult();
+        } catch (error) {
+            showError(error.message);
+        }
+    }
+
+    historyMore.addEventListener('click', () => loadHistory(false));
+    loadHistory(true);
+
     generateBtn.addEventListener('click', async function () {
         const text = textInput.value.trim();
 
@@ -65,46 +179,113 @@
         loading.style.display = 'block';
         generateBtn.disabled = true;
 
-        try {
-            const response = await fetch('/generate-speech', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    text: text,
-                    voice: voiceSelect.value,
-                    service: serviceSelect.value,
-                    speed: parseFloat(speedSlider.value)
-                })
-            });
-
-            const data = await response.json();
+        const payload = {
+            text: text,
+            voice: voiceSelect.value,
+            service: serviceSelect.value,
+            speed: parseFloat(speedSlider.value),
+            format: playbackFormat ? playbackFormat.value : 'mp3'
+        };
 
-            if (!response.ok) {
-                // Use the actual error message from the server
-                throw new Error(data.error || 'Failed to generate speech');
+        try {
+            // Progressive playback is only available for MP3
+            if (payload.format !== 'mp3' || !(await playStreaming(payload))) {
+                await playGenerated(payload);
             }
-
-            // Set audio source and show player
-            audioPlayer.src = data.audio_url;
-            currentFilename = data.filename;
-
-            // Show results
-            loading.style.display = 'none';
-            resultSection.style.display = 'block';
-
-            // Auto-play the audio
-            audioPlayer.play().catch(e => console.log('Auto-play prevented:', e));
-
         } catch (error) {
             loading.style.display = 'none';
             showError(error.message);
         } finally {
             generateBtn.disabled = false;
+            loadHistory(true);
         }
     });
 
+    function showResult() {
+        loading.style.display = 'none';
+        resultSection.style.display = 'block';
+
+        // Auto-play the audio
+        audioPlayer.play().catch(e => console.log('Auto-play prevented:', e));
+    }
+
+    // Generate the whole file first, then play it from /audio
+    async function playGenerated(payload) {
+        const response = await fetch('/generate-speech', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(payload)
+        });
+
+        const data = await response.json();
+
+        if (!response.ok) {
+            // Use the actual error message from the server
+            throw new Error(data.error || 'Failed to generate speech');
+        }
+
+        // Set audio source and show player
+        audioPlayer.src = data.audio_url;
+        currentFilename = data.filename;
+        showResult();
+    }
+
+    // Start playback on the first chunks from /generate-speech/stream.
+    // Returns false when the browser can't play MP3 through Media Source Extensions.
+    async function playStreaming(payload) {
+        if (!window.MediaSource || !MediaSource.isTypeSupported('audio/mpeg')) {
+            return false;
+        }
+
+        const response = await fetch('/generate-speech/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(payload)
+        });
+
+        if (!response.ok) {
+            const data = await response.json().catch(() => ({}));
+            throw new Error(data.error || 'Failed to generate speech');
+        }
+
+        currentFilename = response.headers.get('X-Audio-Filename');
+
+        const mediaSource = new MediaSource();
+        audioPlayer.src = URL.createObjectURL(mediaSource);
+        await new Promise(resolve => mediaSource.addEventListener('sourceopen', resolve, { once: true }));
+        const sourceBuffer = mediaSource.addSourceBuffer('audio/mpeg');
+        const reader = response.body.getReader();
+        let started = false;
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) {
+                break;
+            }
+            await new Promise((resolve, reject) => {
+                sourceBuffer.addEventListener('updateend', resolve, { once: true });
+                sourceBuffer.addEventListener('error', reject, { once: true });
+                sourceBuffer.appendBuffer(value);
+            });
+            if (!started) {
+                started = true;
+                showResult();
+            }
+        }
+
+        if (mediaSource.readyState === 'open') {
+            mediaSource.endOfStream();
+        }
+        if (!started) {
+            throw new Error('Failed to generate speech');
+        }
+        return true;
+    }
+
     downloadBtn.addEventListener('click', function () {
         if (currentFilename) {
             const formatSelect = document.getElementById('download-format');
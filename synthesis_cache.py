@@ -0,0 +1,84 @@
+"""
+Content-addressed cache of synthesized audio stored in the audio directory.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+from audio_janitor import AudioIndex
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different inputs share a cache entry"""
+    text = unicodedata.normalize('NFC', text)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    lines = [re.sub(r'[ \t\f\v]+', ' ', line).strip() for line in text.split('\n')]
+    return '\n'.join(lines).strip()
+
+
+def synthesis_key(service: str, voice: str, speed: float, model: str, text: str) -> str:
+    """Return the cache key for a synthesis request"""
+    parts = [service, voice, f"{float(speed):.2f}", model, normalize_text(text)]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+class SynthesisCache:
+    """Audio files named <synthesis key>.<extension>; eviction is left to the audio janitor"""
+
+    def __init__(self, directory: Path, index: AudioIndex):
+        self.directory = directory
+        self.index = index
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str, extension: str = 'mp3') -> Path:
+        """Return the final location of a format variant of a key"""
+        return self.directory / f"{key}.{extension}"
+
+    def temp_path(self, key: str) -> Path:
+        """Return a unique scratch location to synthesize into before committing"""
+        return self.directory / f".{key}.{uuid.uuid4().hex}.part"
+
+    def get(self, key: str, extension: str = 'mp3', count_miss: bool = True) -> Optional[Path]:
+        """Return the cached variant for a key, marking it recently used, or None on a miss"""
+        path = self.path_for(key, extension)
+        try:
+            size = path.stat().st_size
+        except OSError:
+            if count_miss:
+                with self._lock:
+                    self.misses += 1
+            return None
+        # Refresh last use so the janitor's age and LRU eviction keep hot entries
+        self.index.record(path.name, size)
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key: str, source: Path, extension: str = 'mp3') -> Path:
+        """Atomically move a finished file into the cache and index it"""
+        path = self.path_for(key, extension)
+        os.replace(source, path)
+        self.index.record(path.name, path.stat().st_size)
+        return path
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters for this process and the size of the audio store"""
+        summary = self.index.summary()
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': summary['files'],
+                'bytes': summary['bytes'],
+            }
@@ -17,3 +17,18 @@ def client():
     with app.test_client() as client:
         with app.app_context():
             yield client
+
+@pytest.fixture(autouse=True)
+def provider_router(monkeypatch):
+    """Give each test fresh backend health so circuit breakers don't carry over between tests"""
+    import app as app_module
+    router = app_module.build_provider_router()
+    router.backoff_base = 0.001
+    monkeypatch.setattr(app_module, 'provider_router', router)
+    return router
+
+@pytest.fixture(autouse=True)
+def no_background_services(monkeypatch):
+    """Keep the first request of a test run from starting real janitor, job and history threads"""
+    import app as app_module
+    monkeypatch.setattr(app_module, '_background_pid', os.getpid())
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import threading
+
+import httpx
+import pytest
+
+import app as app_module
+import asgi
+from app import app
+from audio_janitor import AudioIndex
+from http_client import ProcessLocal
+from quota import CharacterQuota
+from singleflight import SingleFlight
+from synthesis_cache import SynthesisCache
+from tests.test_mp3 import frame, id3
+
+PAYLOAD = {'text': 'Hej med dig', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0}
+
+
+@pytest.fixture
+def provider(mocker, tmp_path):
+    cache = SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db'))
+    mocker.patch.object(app_module, 'synthesis_cache', cache)
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(object))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': False})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    calls = []
+
+    async def fake_provider(service, voice, speed, text, fmt='mp3'):
+        calls.append(text)
+        await asyncio.sleep(0.05)
+        yield b'ID3'
+        yield b'audio'
+
+    mocker.patch.object(asgi, 'astream_provider', fake_provider)
+    return calls
+
+
+def request(*requests):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+            return await asyncio.gather(*(client.request(method, url, **kwargs) for method, url, kwargs in requests))
+    return asyncio.run(run())
+
+
+def test_concurrent_identical_requests_share_one_synthesis(provider, tmp_path):
+    responses = request(*[('POST', '/generate-speech', {'json': PAYLOAD})] * 5)
+
+    assert provider == ['Hej med dig']
+    bodies = [response.json() for response in responses]
+    assert len({body['filename'] for body in bodies}) == 1
+    assert sum(1 for body in bodies if body.get('cached')) == 4
+    assert (tmp_path / bodies[0]['filename']).read_bytes() == b'ID3audio'
+    assert responses[0].headers['X-Content-Type-Options'] == 'nosniff'
+
+
+def test_stream_is_cached_for_the_json_route(provider, tmp_path):
+    streamed, = request(('POST', '/generate-speech/stream', {'json': PAYLOAD}))
+    assert streamed.status_code == 200
+    assert streamed.content == b'ID3audio'
+    assert streamed.headers['content-type'] == 'audio/mpeg'
+
+    data, = request(('POST', '/generate-speech', {'json': PAYLOAD}))
+    assert data.json()['filename'] == streamed.headers['X-Audio-Filename']
+    replay, = request(('POST', '/generate-speech/stream', {'json': PAYLOAD}))
+    assert replay.content == b'ID3audio'
+    assert replay.headers['Accept-Ranges'] == 'bytes'
+    assert 'immutable' in replay.headers['Cache-Control']
+    assert len(provider) == 1
+
+
+def test_validation_and_login_run_through_flask(provider, mocker):
+    invalid, = request(('POST', '/generate-speech', {'json': {**PAYLOAD, 'text': ''}}))
+    assert invalid.status_code == 400
+
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': True})
+    anonymous, = request(('POST', '/generate-speech', {'json': PAYLOAD}))
+    assert anonymous.status_code == 302
+    assert provider == []
+
+
+def test_other_routes_are_served_by_flask(provider):
+    response, = request(('GET', '/cache-stats', {}))
+    assert response.status_code == 200
+    assert 'hits' in response.json()
+
+
+def test_speech_is_awaited_on_the_async_client(mocker):
+    seen = {}
+
+    async def handler(request):
+        seen['body'] = request.content
+        return httpx.Response(200, content=b'ID3' + b'\xff' * 1000)
+
+    mocker.patch.object(asgi.providers, '_http', httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    mocker.patch.object(asgi.providers, '_limits', {})
+    mocker.patch.object(app_module, 'AZURE_SPEECH_KEY', 'key')
+    mocker.patch.object(app_module, 'AZURE_SPEECH_REGION', 'swedencentral')
+
+    async def run():
+        return b''.join([chunk async for chunk in asgi.astream_provider('speech', 'da-DK-JeppeNeural', 1.0, 'Hej')])
+
+    assert asyncio.run(run()) == b'ID3' + b'\xff' * 1000
+    assert b"name='da-DK-JeppeNeural'" in seen['body']
+
+
+def test_pool_timeouts_do_not_count_against_the_backend(mocker, provider_router):
+    attempts = []
+
+    async def handler(request):
+        attempts.append(request)
+        raise httpx.PoolTimeout('No connection available', request=request)
+
+    mocker.patch.object(asgi.providers, '_http', httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    mocker.patch.object(asgi.providers, '_limits', {})
+    mocker.patch.object(app_module, 'AZURE_SPEECH_KEY', 'key')
+    mocker.patch.object(app_module, 'AZURE_SPEECH_REGION', 'swedencentral')
+
+    async def run():
+        return b''.join([chunk async for chunk in asgi.astream_provider('speech', 'da-DK-JeppeNeural', 1.0, 'Hej')])
+
+    with pytest.raises(app_module.SynthesisError) as raised:
+        asyncio.run(run())
+    assert raised.value.status_code == 503
+    assert len(attempts) == 1
+    assert all(backend.consecutive_failures == 0 for backend in provider_router.backends['speech'])
+
+
+def test_incremental_stream_reuses_cached_sentences(provider, mocker):
+    sent = []
+
+    def fake_provider(service, voice, speed, text, fmt='mp3'):
+        sent.append(text)
+        yield text.encode()
+
+    mocker.patch.object(app_module, 'stream_provider', side_effect=fake_provider)
+    payload = {**PAYLOAD, 'text': 'En. To.', 'incremental': True}
+    first, = request(('POST', '/generate-speech', {'json': payload}))
+    assert first.json()['incremental'] == {'sentences': 2, 'reused': 0, 'synthesized': 2}
+
+    streamed, = request(('POST', '/generate-speech/stream', {'json': {**payload, 'text': 'En. Tre.'}}))
+    assert (streamed.headers['X-Sentences-Reused'], streamed.headers['X-Sentences-Synthesized']) == ('1', '1')
+    assert sorted(sent) == ['En.', 'To.', 'Tre.'] and provider == []
+
+
+def test_stream_rejects_formats_other_than_mp3(provider):
+    rejected, = request(('POST', '/generate-speech/stream', {'json': {**PAYLOAD, 'format': 'wav'}}))
+    assert rejected.status_code == 400
+    assert 'only available as MP3' in rejected.json()['error']
+    assert provider == []
+
+
+def test_long_text_is_streamed_as_one_mp3(provider, mocker):
+    mocker.patch.dict(app.config, {'LONG_TEXT_CHUNK_CHARS': 30})
+
+    async def fake_provider(service, voice, speed, text, fmt='mp3'):
+        provider.append(text)
+        yield id3() + frame(int(text.split()[1]))
+
+    mocker.patch.object(asgi, 'astream_provider', fake_provider)
+    text = ' '.join(f'Chunk {i} has some words.' for i in range(4))
+
+    streamed, = request(('POST', '/generate-speech/stream', {'json': {**PAYLOAD, 'text': text}}))
+
+    assert streamed.status_code == 200
+    assert streamed.content == b''.join(frame(i) for i in range(4))
+    assert len(provider) == 4
+
+
+def test_synthesis_waits_for_another_process_holding_the_lock(provider, mocker, tmp_path):
+    mocker.patch.object(app_module, 'single_flight', SingleFlight(tmp_path / 'locks', poll_interval=0.01))
+    with app.test_request_context():
+        params, _ = app_module.validate_speech_request(dict(PAYLOAD))
+    cache_key = app_module.get_cache_key(params)
+    ready, release = threading.Event(), threading.Event()
+
+    def other_worker():
+        # A separate SingleFlight opens its own lock file, like another worker process
+        with SingleFlight(tmp_path / 'locks').lock(f"{cache_key}.mp3"):
+            ready.set()
+            release.wait(5)
+            audio = app_module.synthesis_cache.temp_path(cache_key)
+            audio.write_bytes(b'ID3other')
+            app_module.synthesis_cache.put(cache_key, audio, 'mp3')
+
+    leader = threading.Thread(target=other_worker)
+    leader.start()
+    assert ready.wait(5)
+    threading.Timer(0.1, release.set).start()
+    try:
+        response, streamed = request(('POST', '/generate-speech', {'json': PAYLOAD}),
+                                     ('POST', '/generate-speech/stream', {'json': PAYLOAD}))
+    finally:
+        release.set()
+        leader.join(5)
+
+    assert provider == []
+    assert response.json()['cached'] is True
+    assert streamed.content == b'ID3other'
+
+
+def test_cached_and_aborted_syntheses_are_refunded(provider, mocker, tmp_path):
+    mocker.patch.object(app_module, 'character_quota', CharacterQuota(tmp_path / 'quota.db'))
+    mocker.patch.dict(app.config, {'QUOTA_ENABLED': True, 'IP_QUOTA_CHARACTERS': 25,
+                                   'IP_QUOTA_CHARACTERS_PER_HOUR': 1})
+
+    async def failing_provider(service, voice, speed, text, fmt='mp3'):
+        yield b'ID3'
+        raise app_module.SynthesisError('provider dropped the stream', 502)
+
+    working_provider = asgi.astream_provider
+    mocker.patch.object(asgi, 'astream_provider', failing_provider)
+    scope = {'type': 'http', 'method': 'POST', 'path': '/generate-speech/stream', 'query_string': b'',
+             'http_version': '1.1', 'client': ('127.0.0.1', 50000), 'headers': [(b'content-type', b'application/json')]}
+
+    async def receive():
+        return {'type': 'http.request', 'body': json.dumps(PAYLOAD).encode()}
+
+    # The response is left unfinished, so the server drops the connection; httpx's test transport can't send these
+    for _ in range(3):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+        asyncio.run(asgi.application(scope, receive, send))
+        assert [message.get('body') for message in sent] == [None, b'ID3']
+
+    # Only the first synthesis is charged; the replays are cache hits
+    mocker.patch.object(asgi, 'astream_provider', working_provider)
+    for _ in range(3):
+        synthesized, = request(('POST', '/generate-speech', {'json': PAYLOAD}))
+        streamed, = request(('POST', '/generate-speech/stream', {'json': PAYLOAD}))
+        assert synthesized.status_code == streamed.status_code == 200
+        assert synthesized.headers['X-Quota-Remaining'] == streamed.headers['X-Quota-Remaining'] == '14'
+    assert provider == ['Hej med dig']
+
+
+def test_stream_serves_local_speed_variants(provider, mocker):
+    mocker.patch.dict(app.config, {'SPEED_VARIANT_MODE': 'local'})
+    mocker.patch.object(app_module.transcoder, 'filter_pcm',
+                        side_effect=lambda source, target, fmt, apply: target.write_bytes(b'stretched'))
+
+    original, = request(('POST', '/generate-speech/stream', {'json': PAYLOAD}))
+    variant, = request(('POST', '/generate-speech/stream', {'json': {**PAYLOAD, 'speed': 1.25}}))
+
+    assert variant.status_code == 200
+    assert variant.content == b'stretched'
+    assert variant.headers['X-Audio-Filename'] == original.headers['X-Audio-Filename'].replace('.mp3', '-125.mp3')
+    assert provider == ['Hej med dig']
@@ -0,0 +1,38 @@
+import app as app_module
+from app import app
+
+
+def _setup(mocker, tmp_path):
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False})
+    (tmp_path / 'abc.mp3').write_bytes(bytes(range(100)))
+
+
+def test_range_and_conditional_requests(client, mocker, tmp_path):
+    _setup(mocker, tmp_path)
+
+    full = client.get('/audio/abc.mp3')
+    assert full.status_code == 200
+    assert full.headers['Accept-Ranges'] == 'bytes'
+    assert 'immutable' in full.headers['Cache-Control']
+    assert 'max-age=31536000' in full.headers['Cache-Control']
+
+    partial = client.get('/audio/abc.mp3', headers={'Range': 'bytes=10-19'})
+    assert partial.status_code == 206
+    assert partial.data == bytes(range(10, 20))
+    assert partial.headers['Content-Range'] == 'bytes 10-19/100'
+
+    revalidated = client.get('/audio/abc.mp3', headers={'If-None-Match': full.headers['ETag']})
+    assert revalidated.status_code == 304
+
+
+def test_accel_redirect_hands_file_to_nginx(client, mocker, tmp_path):
+    _setup(mocker, tmp_path)
+    mocker.patch.dict(app.config, {'AUDIO_ACCEL_REDIRECT_ENABLED': True})
+
+    response = client.get('/download/abc.mp3')
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers['X-Accel-Redirect'] == '/_protected_audio/abc.mp3'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="abc.mp3"'
+    assert response.mimetype == 'audio/mpeg'
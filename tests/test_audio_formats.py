@@ -0,0 +1,86 @@
+from unittest.mock import MagicMock
+
+import app as app_module
+from app import app
+from audio_formats import ffmpeg_command, format_for_extension, provider_format
+from audio_janitor import AudioIndex
+from http_client import ProcessLocal
+from synthesis_cache import SynthesisCache
+
+
+def test_provider_formats():
+    assert provider_format('openai', 'opus') == 'opus'
+    assert provider_format('speech', 'opus') == 'ogg-24khz-16bit-mono-opus'
+    assert provider_format('speech', 'flac') is None
+    assert format_for_extension('.ogg').name == 'opus'
+    assert ffmpeg_command('in.mp3', 'pipe:1', 'opus')[-3:] == ['-f', 'ogg', 'pipe:1']
+
+
+def _setup(mocker, tmp_path):
+    cache = SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db'))
+    mocker.patch.object(app_module, 'synthesis_cache', cache)
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    fake_client = MagicMock()
+    create = fake_client.audio.speech.with_streaming_response.create
+    create.return_value.__enter__.return_value.iter_bytes.return_value = [b'OggS', b'audio']
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(lambda: fake_client))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    return create
+
+
+PAYLOAD = {'text': 'Hej med dig', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0}
+
+
+def test_opus_is_requested_natively(client, mocker, tmp_path):
+    create = _setup(mocker, tmp_path)
+    transcode = mocker.patch.object(app_module, 'transcode_file')
+
+    data = client.post('/generate-speech', json={**PAYLOAD, 'format': 'opus'}).get_json()
+
+    assert data['filename'].endswith('.ogg')
+    assert create.call_args.kwargs['response_format'] == 'opus'
+    transcode.assert_not_called()
+
+    response = client.get(f"/audio/{data['filename']}")
+    assert response.mimetype == 'audio/ogg'
+    assert response.data == b'OggSaudio'
+
+
+def test_unsupported_format_is_rejected(client, mocker, tmp_path):
+    _setup(mocker, tmp_path)
+    response = client.post('/generate-speech', json={**PAYLOAD, 'format': 'aiff'})
+    assert response.status_code == 400
+
+
+def test_speech_flac_is_transcoded_from_cached_wav(client, mocker, tmp_path):
+    _setup(mocker, tmp_path)
+    mocker.patch.object(app_module, 'AZURE_SPEECH_KEY', 'key')
+    mocker.patch.object(app_module, 'AZURE_SPEECH_REGION', 'swedencentral')
+    synthesize = mocker.patch.object(app_module, 'synthesize_to_file',
+                                     side_effect=lambda *args: args[4].write_bytes(b'RIFF'))
+    transcode = mocker.patch.object(app_module, 'transcode_file',
+                                    side_effect=lambda source, target, fmt: target.write_bytes(b'fLaC'))
+
+    payload = {'text': 'Hej', 'voice': 'da-DK-JeppeNeural', 'service': 'speech', 'speed': 1.0, 'format': 'flac'}
+    data = client.post('/generate-speech', json=payload).get_json()
+
+    assert synthesize.call_args.args[5] == 'wav'
+    source, target, fmt = transcode.call_args.args
+    assert source.suffix == '.wav' and fmt == 'flac'
+    assert (tmp_path / data['filename']).read_bytes() == b'fLaC'
+    # Both variants share the synthesis ID
+    assert source.stem == (tmp_path / data['filename']).stem
+
+
+def test_download_reuses_existing_variant(client, mocker, tmp_path):
+    _setup(mocker, tmp_path)
+    (tmp_path / 'abc.mp3').write_bytes(b'ID3')
+    (tmp_path / 'abc.wav').write_bytes(b'RIFF')
+    transcode = mocker.patch.object(app_module, 'transcode_file')
+
+    response = client.get('/download/abc.mp3?format=wav')
+
+    assert response.status_code == 200
+    assert response.data == b'RIFF'
+    transcode.assert_not_called()
@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import sqlite3
+import time
+
+from audio_janitor import AudioIndex, AudioJanitor
+
+
+def _janitor(tmp_path, **kwargs):
+    audio_dir = tmp_path / 'audio'
+    audio_dir.mkdir(exist_ok=True)
+    index = AudioIndex(tmp_path / 'index.db')
+    options = {'max_age_seconds': 3600, 'max_bytes': 10 ** 6, 'batch_size': 2}
+    options.update(kwargs)
+    return AudioJanitor(audio_dir, index, tmp_path / 'janitor.lock', **options)
+
+
+def _add(janitor, name, size, last_used):
+    (janitor.audio_dir / name).write_bytes(b'\0' * size)
+    janitor.index.record(name, size, now=last_used)
+
+
+def test_expired_files_are_deleted_in_batches(tmp_path):
+    janitor = _janitor(tmp_path)
+    now = time.time()
+    for i in range(5):
+        _add(janitor, f'old{i}.mp3', 1, now - 7200)
+    _add(janitor, 'fresh.mp3', 1, now)
+
+    assert janitor.run_once() == 5
+    assert os.listdir(janitor.audio_dir) == ['fresh.mp3']
+    assert janitor.index.summary() == {'files': 1, 'bytes': 1}
+
+
+def test_disk_budget_evicts_least_recently_used(tmp_path):
+    janitor = _janitor(tmp_path, max_bytes=25)
+    now = time.time()
+    _add(janitor, 'a.mp3', 10, now - 30)
+    _add(janitor, 'b.mp3', 10, now - 20)
+    _add(janitor, 'c.mp3', 10, now - 10)
+    janitor.index.record('a.mp3', 10, now=now)  # a cache hit makes 'a' the most recent
+
+    assert janitor.run_once() == 1
+    assert sorted(os.listdir(janitor.audio_dir)) == ['a.mp3', 'c.mp3']
+
+
+def test_reconcile_indexes_strays_and_drops_stale_parts(tmp_path):
+    janitor = _janitor(tmp_path)
+    (janitor.audio_dir / 'legacy.wav').write_bytes(b'RIFF')
+    stale = janitor.audio_dir / '.abc.part'
+    stale.write_bytes(b'x')
+    os.utime(stale, (time.time() - 7200, time.time() - 7200))
+
+    assert janitor.reconcile() == 1
+    assert janitor.index.known(['legacy.wav']) == {'legacy.wav'}
+    assert not stale.exists()
+
+
+def _try_lead(tmp_path, result):
+    result.value = int(_janitor(tmp_path)._is_leader())
+
+
+def test_only_one_process_is_elected(tmp_path):
+    janitor = _janitor(tmp_path)
+    assert janitor._is_leader()
+    ctx = multiprocessing.get_context('fork')
+    result = ctx.Value('i', -1)
+    proc = ctx.Process(target=_try_lead, args=(tmp_path, result))
+    proc.start()
+    proc.join(5)
+    assert result.value == 0
+
+
+def test_pinned_files_are_never_evicted(tmp_path):
+    janitor = _janitor(tmp_path, max_bytes=10)
+    now = time.time()
+    _add(janitor, 'greeting.mp3', 10, now - 7200)
+    _add(janitor, 'menu.mp3', 10, now - 60)
+    _add(janitor, 'other.mp3', 10, now - 30)
+    janitor.index.pin(['greeting.mp3', 'menu.mp3'])
+    janitor.index.record('menu.mp3', 10, now=now)  # a cache hit keeps the pin
+
+    assert janitor.run_once() == 1
+    assert sorted(os.listdir(janitor.audio_dir)) == ['greeting.mp3', 'menu.mp3']
+
+
+def test_index_created_before_pinning_is_migrated(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'index.db')
+    conn.execute('CREATE TABLE audio_files (filename TEXT PRIMARY KEY, created_at REAL NOT NULL, '
+                 'last_used REAL NOT NULL, size INTEGER NOT NULL)')
+    conn.execute("INSERT INTO audio_files VALUES ('old.mp3', 1, 1, 5)")
+    conn.commit()
+    conn.close()
+
+    index = AudioIndex(tmp_path / 'index.db')
+    assert index.expired(time.time(), 10) == ['old.mp3']
+    index.pin(['old.mp3'])
+    assert index.expired(time.time(), 10) == []
+    assert AudioIndex(tmp_path / 'index.db').get_db_connection().execute('PRAGMA user_version').fetchone()[0] == 1
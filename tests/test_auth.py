@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+import auth
+import ttl_cache
+from ttl_cache import TTLCache
+
+
+@pytest.fixture
+def user_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(auth, 'DB_FILE', tmp_path / 'users.db')
+    monkeypatch.setattr(auth, 'user_cache', auth.TTLCache(ttl_seconds=60, max_entries=2))
+    auth.init_db()
+    return tmp_path / 'users.db'
+
+
+def test_connection_is_reused_per_thread_in_wal_mode(user_db):
+    conn = auth.get_db_connection()
+    assert auth.get_db_connection() is conn
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_get_user_is_cached_by_id(user_db, mocker):
+    user, error = auth.create_user('alice', 'secret-password')
+    assert error is None
+
+    first = auth.get_user(user.id)
+    connect = mocker.patch.object(auth, 'get_db_connection', side_effect=AssertionError)
+    assert auth.get_user(user.id) is first
+    connect.assert_not_called()
+
+
+def test_user_cache_is_bounded_and_expires(monkeypatch):
+    cache = TTLCache(ttl_seconds=60, max_entries=2)
+    for i in range(3):
+        cache.put(str(i), auth.User(str(i), f'user{i}'))
+    assert cache.get('0') is None
+    assert cache.get('2').username == 'user2'
+
+    now = ttl_cache.time.monotonic()
+    monkeypatch.setattr(ttl_cache.time, 'monotonic', lambda: now + 61)
+    assert cache.get('2') is None
+
+
+def test_existing_database_gains_email_index(monkeypatch, tmp_path):
+    db_file = tmp_path / 'users.db'
+    legacy = sqlite3.connect(db_file)
+    legacy.execute('CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, '
+                   'password_hash TEXT, email TEXT, is_azure_ad BOOLEAN DEFAULT 0)')
+    legacy.execute("INSERT INTO users (username, email, is_azure_ad) VALUES ('bob', 'bob@example.com', 1)")
+    legacy.commit()
+    legacy.close()
+
+    monkeypatch.setattr(auth, 'DB_FILE', db_file)
+    auth.init_db()
+
+    conn = auth.get_db_connection()
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == len(auth.MIGRATIONS)
+    plan = ' '.join(row[3] for row in conn.execute(
+        'EXPLAIN QUERY PLAN SELECT * FROM users WHERE email = ?', ('bob@example.com',)))
+    assert 'idx_users_email' in plan
+
+    user, error = auth.create_azure_ad_user('bob@example.com', 'bob')
+    assert error is None and user.id == '1'
+
+
+def test_login_rehashes_outdated_password(user_db, monkeypatch):
+    old = auth.PasswordHasher(method='pbkdf2:sha256:1000', salt_length=8)
+    monkeypatch.setattr(auth, 'password_hasher', old)
+    user, _ = auth.create_user('carol', 'secret-password')
+
+    monkeypatch.setattr(auth, 'password_hasher', auth.PasswordHasher(method='pbkdf2:sha256:2000', salt_length=16))
+    assert auth.get_user_by_username('carol').check_password('secret-password')
+
+    stored = auth.get_user(user.id).password_hash
+    assert stored.startswith('pbkdf2:sha256:2000$')
+    assert not auth.password_hasher.needs_rehash(stored)
+    assert auth.get_user_by_username('carol').check_password('secret-password')
+    assert not auth.get_user_by_username('carol').check_password('wrong')
+
+
+def test_hashing_queue_rejects_when_full():
+    hasher = auth.PasswordHasher(method='pbkdf2:sha256:1000', workers=1, max_pending=0)
+    hasher._admission.acquire()
+    with pytest.raises(auth.HashingBusy):
+        hasher.hash('secret')
+    hasher._admission.release()
+    assert hasher.verify(hasher.hash('secret'), 'secret')
+    assert hasher.stats()['rejected'] == 1
@@ -0,0 +1,53 @@
+import httpx
+import pytest
+
+import app as app_module
+import auth
+from app import app
+from ttl_cache import TTLCache
+
+
+@pytest.fixture
+def azure_ad(mocker, monkeypatch, tmp_path):
+    monkeypatch.setattr(auth, 'DB_FILE', tmp_path / 'users.db')
+    auth.init_db()
+    mocker.patch.dict(app.config, {'AZURE_AD_CLIENT_ID': 'client', 'AZURE_AD_TENANT_ID': 'tenant'})
+    mocker.patch.object(app_module, '_msal_client', None)
+    mocker.patch.object(app_module, 'graph_profile_cache', TTLCache(300, 16))
+    msal_cls = mocker.patch('msal.ConfidentialClientApplication')
+    msal_cls.return_value.acquire_token_by_authorization_code.return_value = {
+        'access_token': 'token', 'id_token_claims': {'oid': 'object-1'},
+    }
+    graph_calls = []
+
+    def handler(request):
+        graph_calls.append(request)
+        return httpx.Response(200, json={'mail': 'dana@example.com', 'displayName': 'Dana'})
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    mocker.patch.object(app_module.http_pool, 'get', return_value=client)
+    return msal_cls, graph_calls
+
+
+def test_msal_client_is_built_once_per_worker(azure_ad, mocker):
+    msal_cls, _ = azure_ad
+    assert app_module.get_msal_app() is app_module.get_msal_app()
+    msal_cls.assert_called_once()
+    assert msal_cls.call_args.kwargs['http_cache'] is app_module.msal_http_cache
+
+    mocker.patch('os.getpid', return_value=-1)
+    app_module.get_msal_app()
+    assert msal_cls.call_count == 2
+
+
+def test_graph_profile_is_cached_by_object_id(client, azure_ad):
+    msal_cls, graph_calls = azure_ad
+    for _ in range(2):
+        response = client.get('/login/azure/callback?code=abc')
+        assert response.status_code == 302
+        assert response.location.endswith('/')
+        client.get('/logout')
+
+    assert len(graph_calls) == 1
+    assert graph_calls[0].extensions['timeout']['read'] == app.config['AZURE_AD_TIMEOUT_SECONDS']
+    msal_cls.assert_called_once()
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+import load_driver
+from mp3 import parse_frame_header
+from stub_providers import MP3_FRAME_SIZE, StubConfig, silent_mp3, start_stub_server
+
+
+def test_stub_mp3_is_made_of_valid_frames():
+    audio = silent_mp3(1.0)
+    header = parse_frame_header(audio)
+    assert (header.sample_rate, header.bitrate, header.channels) == (24000, 96000, 1)
+    assert header.length == MP3_FRAME_SIZE
+    assert len(audio) % MP3_FRAME_SIZE == 0
+    assert all(parse_frame_header(audio, offset) for offset in range(0, len(audio), MP3_FRAME_SIZE))
+
+
+def test_stub_serves_both_provider_apis_and_injects_throttling():
+    server = start_stub_server(StubConfig(latency_ms=0, jitter_ms=0, ms_per_char=0))
+    try:
+        with httpx.Client(base_url=server.url) as client:
+            speech = client.post('/cognitiveservices/v1', content=b"<speak><voice>Hej</voice></speak>",
+                                 headers={'X-Microsoft-OutputFormat': 'audio-24khz-96kbitrate-mono-mp3'})
+            assert speech.status_code == 200 and parse_frame_header(speech.content)
+            openai = client.post('/openai/deployments/tts-hd/audio/speech', params={'api-version': '2025-03-01'},
+                                 json={'input': 'Hej', 'voice': 'alloy', 'response_format': 'wav'})
+            assert openai.content[:4] == b'RIFF'
+
+            server.config.throttle_rate = 1.0
+            throttled = client.post('/openai/deployments/tts-hd/audio/speech', json={'input': 'Hej'})
+            assert throttled.status_code == 429 and throttled.headers['Retry-After'] == '1'
+        assert server.counts == {'requests': 3, 'errors': 0, 'throttled': 1}
+    finally:
+        server.shutdown()
+
+
+def test_summary_reports_percentiles_and_errors():
+    result = load_driver.summarize([i / 1000 for i in range(1, 101)], errors=5, elapsed=2.0,
+                                   received=100, statuses={200: 100, 503: 5})
+    assert (result['p50_ms'], result['p95_ms'], result['p99_ms']) == (51.0, 96.0, 100.0)
+    assert result['requests'] == 105 and result['requests_per_second'] == 52.5
+    assert result['status_codes'] == {'200': 100, '503': 5}
+
+
+def test_compare_flags_regressions():
+    baseline = {'results': {'audio': {'p95_ms': 10.0, 'requests_per_second': 100.0}}}
+    slower = {'results': {'audio': {'p95_ms': 15.0, 'requests_per_second': 95.0}}}
+    same = {'results': {'audio': {'p95_ms': 11.0, 'requests_per_second': 98.0}}}
+    assert [regressed for _, _, regressed in load_driver.compare(slower, baseline, 0.2)] == [True]
+    assert [regressed for _, _, regressed in load_driver.compare(same, baseline, 0.2)] == [False]
@@ -0,0 +1,81 @@
+import app as app_module
+from app import app
+from audio_janitor import AudioIndex
+from dialogue import Line, plan_calls
+from http_client import ProcessLocal
+from synthesis_cache import SynthesisCache
+from tests.test_mp3 import frame
+
+SCRIPT = [
+    {'text': 'Hej, hvordan går det?', 'voice': 'da-DK-ChristelNeural', 'service': 'speech', 'pause': 0.5},
+    {'text': 'Godt, tak.', 'voice': 'da-DK-JeppeNeural', 'service': 'speech', 'speed': 1.2},
+    {'text': 'Fine, thanks.', 'voice': 'alloy', 'service': 'openai', 'pause': 1.0},
+    {'text': 'Farvel.', 'voice': 'da-DK-ChristelNeural', 'service': 'speech'},
+]
+
+
+def segment(text, voice='da-DK-JeppeNeural', service='speech', pause=0.0):
+    return {'text': text, 'voice': voice, 'service': service, 'speed': 1.0, 'pause': pause}
+
+
+def test_adjacent_speech_lines_share_a_call():
+    calls = plan_calls([segment('One.'), segment('Two.', pause=6.0), segment('Three.'),
+                        segment('Four.', 'alloy', 'openai'), segment('Five.')], lambda service: 1000)
+    assert [(call.service, [line.text for line in call.lines]) for call in calls] == [
+        ('speech', ['One.', 'Two.']),  # a 6 s pause is longer than an SSML break
+        ('speech', ['Three.']),
+        ('openai', ['Four.']),
+        ('speech', ['Five.']),
+    ]
+    assert len(plan_calls([segment('A sentence here.')] * 4, lambda service: 40)) == 2
+
+
+def test_multi_voice_ssml():
+    ssml = app_module.speech_ssml([Line('da-DK-ChristelNeural', 1.0, 'Hej & velkommen', 0.5),
+                                   Line('da-DK-JeppeNeural', 1.5, 'Tak', 2.0)])
+    assert ssml.count('<voice') == 2
+    assert "<prosody rate='0%'>Hej &amp; velkommen</prosody><break time='500ms'/></voice>" in ssml
+    assert "<prosody rate='+50%'>Tak</prosody></voice>" in ssml  # the final pause is generated silence
+
+
+def test_dialogue_is_stitched_in_order(client, mocker, tmp_path):
+    mocker.patch.object(app_module, 'synthesis_cache', SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db')))
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(object))
+    mocker.patch.multiple(app_module, AZURE_SPEECH_KEY='key', AZURE_SPEECH_REGION='region')
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': False})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    calls = []
+
+    def fake_provider(service, voice, speed, text, fmt, lines):
+        calls.append((service, [line.voice for line in lines] if lines else voice))
+        yield frame(len(calls))
+
+    mocker.patch.object(app_module, 'stream_provider', side_effect=fake_provider)
+
+    response = client.post('/generate-speech', json={'segments': SCRIPT})
+    assert response.status_code == 200
+    assert sorted(calls, key=str) == sorted([
+        ('speech', ['da-DK-ChristelNeural', 'da-DK-JeppeNeural']),
+        ('openai', 'alloy'),
+        ('speech', ['da-DK-ChristelNeural']),
+    ], key=str)
+    audio = (tmp_path / response.get_json()['filename']).read_bytes()
+    frames = [audio[i:i + 96] for i in range(0, len(audio), 96)]
+    # speech call, openai call, 1 s of silence (42 frames), speech call
+    assert len(frames) == 45 and frames[2:44] == [frame()] * 42
+
+    assert client.post('/generate-speech', json={'segments': SCRIPT}).get_json()['cached'] is True
+    assert len(calls) == 3
+
+
+def test_dialogue_validation(client, mocker):
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(object))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': False})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    script = [{'text': 'Hej', 'voice': 'alloy', 'service': 'openai'},
+              {'text': 'Hej', 'voice': 'alloy', 'service': 'openai', 'pause': 60}]
+    response = client.post('/generate-speech', json={'segments': script})
+    assert response.status_code == 400 and response.get_json()['error'].startswith('Segment 2: Invalid pause')
+    assert client.post('/generate-speech', json={'segments': []}).status_code == 400
+    assert client.post('/generate-speech/stream', json={'segments': script[:1]}).status_code == 400
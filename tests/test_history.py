@@ -0,0 +1,56 @@
+import app as app_module
+from app import app
+from audio_janitor import AudioIndex
+from history import HistoryStore, decode_cursor
+from http_client import ProcessLocal
+from mp3 import silence
+from synthesis_cache import SynthesisCache
+
+PARAMS = {'text': 'Tryk 1 for salg', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0, 'format': 'mp3'}
+
+
+def test_entries_are_batched_and_paged_by_keyset(tmp_path):
+    store = HistoryStore(tmp_path / 'history.db')
+    audio = tmp_path / 'a.mp3'
+    audio.write_bytes(silence(2.0))
+    ids = [store.record('7', {**PARAMS, 'text': f'Linje {i}'}, audio) for i in range(5)]
+    store.record('8', PARAMS, audio)
+    assert store.get_db_connection().execute('SELECT COUNT(*) FROM history').fetchone()[0] == 0
+
+    pages, cursor = [], None
+    while True:
+        entries, cursor = store.list('7', 2, decode_cursor(cursor) if cursor else None)
+        pages.append([entry['id'] for entry in entries])
+        if not cursor:
+            break
+    assert pages == [ids[:-3:-1], ids[2:0:-1], ids[:1]]
+    entry = store.get('7', ids[0])
+    assert (entry['text_preview'], entry['size'], round(entry['duration'])) == ('Linje 0', audio.stat().st_size, 2)
+    assert store.get('8', ids[0]) is None
+    assert decode_cursor('1; DROP TABLE history') is None
+
+
+def test_history_lists_and_replays_without_the_provider(client, mocker, tmp_path):
+    mocker.patch.object(app_module, 'synthesis_cache', SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db')))
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.object(app_module, 'history', HistoryStore(tmp_path / 'history.db'))
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(object))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': False})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    provider = mocker.patch.object(app_module, 'stream_provider', return_value=iter([silence(1.0)]))
+
+    filename = client.post('/generate-speech', json=PARAMS).get_json()['filename']
+    page = client.get('/history').get_json()
+    assert page['next_cursor'] is None
+    item = page['items'][0]
+    assert (item['text_preview'], item['voice'], item['available'], item['audio_url']) == \
+        ('Tryk 1 for salg', 'alloy', True, f'/audio/{filename}')
+
+    replay = client.post(f"/history/{item['id']}/replay")
+    assert replay.status_code == 200 and replay.get_json()['audio_url'] == f'/audio/{filename}'
+    assert provider.call_count == 1
+
+    (tmp_path / filename).unlink()
+    assert client.post(f"/history/{item['id']}/replay").status_code == 410
+    assert client.get('/history').get_json()['items'][0]['available'] is False
+    assert client.get('/history?cursor=bogus').status_code == 400
@@ -0,0 +1,61 @@
+import httpx
+import pytest
+
+import app as app_module
+from http_client import PooledHttpClient
+
+
+def test_client_is_reused_within_a_process():
+    pool = PooledHttpClient(max_connections=3, max_keepalive=2)
+    assert pool.get() is pool.get()
+    pool.close()
+
+
+def test_client_is_rebuilt_after_fork(monkeypatch):
+    pool = PooledHttpClient()
+    parent = pool.get()
+    monkeypatch.setattr('os.getpid', lambda: -1)
+    assert pool.get() is not parent
+
+
+def test_async_clients_can_be_sized_for_their_event_loop(mocker):
+    async_client = mocker.patch('http_client.httpx.AsyncClient')
+    pool = PooledHttpClient(max_connections=20, max_keepalive=10)
+
+    pool.new_async_client()
+    pool.new_async_client(100)
+
+    assert [call.kwargs['limits'].max_connections for call in async_client.call_args_list] == [20, 100]
+    assert async_client.call_args.kwargs['limits'].max_keepalive_connections == 10
+
+
+def _speech_pool(mocker, handler):
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    mocker.patch.object(app_module.http_pool, 'get', return_value=client)
+    mocker.patch.object(app_module, 'AZURE_SPEECH_KEY', 'key')
+    mocker.patch.object(app_module, 'AZURE_SPEECH_REGION', 'swedencentral')
+
+
+def test_speech_audio_is_streamed_to_disk(mocker, tmp_path):
+    seen = {}
+
+    def handler(request):
+        seen['url'] = str(request.url)
+        seen['body'] = request.content
+        return httpx.Response(200, content=b'ID3' + b'\xff' * 40000)
+
+    _speech_pool(mocker, handler)
+    target = tmp_path / 'out.mp3'
+    app_module.synthesize_to_file('speech', 'da-DK-JeppeNeural', 1.0, 'Hej & farvel', target)
+
+    assert seen['url'] == 'https://swedencentral.tts.speech.microsoft.com/cognitiveservices/v1'
+    assert b'Hej &amp; farvel' in seen['body']
+    assert target.stat().st_size == 40003
+
+
+def test_speech_error_raises_synthesis_error(mocker, tmp_path):
+    _speech_pool(mocker, lambda request: httpx.Response(429, text='Too many requests'))
+    target = tmp_path / 'out.mp3'
+    with pytest.raises(app_module.SynthesisError, match='429 - Too many requests'):
+        app_module.synthesize_to_file('speech', 'da-DK-JeppeNeural', 1.0, 'Hej', target)
+    assert not target.exists()
@@ -0,0 +1,201 @@
+import time
+import zipfile
+
+import app as app_module
+import jobs as jobs_module
+from app import app
+from audio_janitor import AudioIndex
+from http_client import ProcessLocal
+from jobs import JobRunner, JobStore
+from quota import Bucket, CharacterQuota
+from synthesis_cache import SynthesisCache
+
+ITEMS = [
+    {'text': 'Tryk 1 for salg', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0},
+    {'text': 'Tryk 2 for support', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0},
+]
+
+
+def _runner(tmp_path, synthesize, **kwargs):
+    store = JobStore(tmp_path / 'jobs.db', **kwargs)
+    return store, JobRunner(store, tmp_path / 'jobs', synthesize)
+
+
+def _fake_synthesize(tmp_path):
+    def synthesize(params):
+        path = tmp_path / f"{abs(hash(params['text']))}.mp3"
+        path.write_bytes(params['text'].encode())
+        return path
+    return synthesize
+
+
+def test_job_runs_to_completion_and_archives(tmp_path):
+    store, runner = _runner(tmp_path, _fake_synthesize(tmp_path))
+    job_id = store.create_job('7', ITEMS)
+    while runner.run_once():
+        pass
+
+    job = store.get_job(job_id)
+    assert job['status'] == 'completed'
+    assert (job['completed'], job['failed'], job['pending']) == (2, 0, 0)
+    with zipfile.ZipFile(runner.archive_path(job_id)) as zf:
+        names = zf.namelist()
+        assert names == ['0001-tryk-1-for-salg.mp3', '0002-tryk-2-for-support.mp3']
+        assert zf.read(names[1]) == b'Tryk 2 for support'
+
+
+def test_failed_items_are_retried_then_reported(tmp_path):
+    def synthesize(params):
+        raise RuntimeError('provider down')
+
+    store, runner = _runner(tmp_path, synthesize, max_attempts=2)
+    job_id = store.create_job(None, ITEMS[:1])
+    while runner.run_once():
+        pass
+
+    job = store.get_job(job_id)
+    assert job['status'] == 'completed_with_errors'
+    assert job['errors'] == [{'position': 0, 'error': 'provider down'}]
+
+
+def test_abandoned_item_is_reclaimed_after_lease(tmp_path):
+    store, runner = _runner(tmp_path, _fake_synthesize(tmp_path), lease_seconds=0)
+    job_id = store.create_job(None, ITEMS[:1])
+    assert store.claim_item() is not None  # a worker claims it and dies
+
+    # A restarted worker picks the item up again once the lease has expired
+    assert runner.run_once() is True
+    assert store.get_job(job_id)['status'] == 'completed'
+
+
+def test_job_left_archiving_is_taken_over_after_lease(tmp_path, mocker):
+    store, runner = _runner(tmp_path, _fake_synthesize(tmp_path))
+    job_id = store.create_job(None, ITEMS)
+    # The worker that finished the last item dies before the archive is built
+    mocker.patch.object(runner, '_archive')
+    while runner.run_once():
+        pass
+    assert store.get_job(job_id)['status'] == 'archiving'
+    assert store.claim_archive() is None  # still leased
+    store.get_db_connection().execute('UPDATE jobs SET lease_until = 0 WHERE id = ?', (job_id,))
+
+    restarted = JobRunner(store, tmp_path / 'jobs', _fake_synthesize(tmp_path))
+    assert restarted.run_once() is True
+    assert store.get_job(job_id)['status'] == 'completed'
+    with zipfile.ZipFile(restarted.archive_path(job_id)) as zf:
+        assert len(zf.namelist()) == 2
+    assert restarted.run_once() is False
+
+
+def test_job_fails_when_archive_cannot_be_built(tmp_path, mocker):
+    store, runner = _runner(tmp_path, _fake_synthesize(tmp_path))
+    job_id = store.create_job(None, ITEMS)
+    mocker.patch.object(jobs_module.zipfile, 'ZipFile', side_effect=OSError('No space left on device'))
+    while runner.run_once():
+        pass
+
+    job = store.get_job(job_id)
+    assert job['status'] == 'failed' and job['finished_at'] is not None
+    assert not (tmp_path / 'jobs' / job_id).exists()
+    assert store.purge_finished(time.time() + 1) == [job_id]
+
+
+def test_job_api(client, mocker, tmp_path):
+    store, runner = _runner(tmp_path, _fake_synthesize(tmp_path))
+    mocker.patch.object(app_module, 'job_store', store)
+    mocker.patch.object(app_module, 'job_runner', runner)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(object))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+
+    assert client.post('/jobs', json={'items': []}).status_code == 400
+    script = {'segments': [{'text': 'Hej', 'voice': 'alloy', 'service': 'openai'}]}
+    rejected = client.post('/jobs', json={'items': [script]})
+    assert rejected.status_code == 400 and 'Dialogue scripts' in rejected.get_json()['error']
+    response = client.post('/jobs', json={'items': ITEMS})
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    assert client.get(f'/jobs/{job_id}').get_json()['pending'] == 2
+    assert client.get(f'/jobs/{job_id}/download').status_code == 409
+
+    while runner.run_once():
+        pass
+    status = client.get(f'/jobs/{job_id}').get_json()
+    assert status['status'] == 'completed' and status['download_url'] == f'/jobs/{job_id}/download'
+    download = client.get(status['download_url'])
+    assert download.status_code == 200 and download.mimetype == 'application/zip'
+
+
+def test_items_are_replayed_with_their_validated_params(tmp_path):
+    seen = []
+
+    def synthesize(params):
+        seen.append(params)
+        return _fake_synthesize(tmp_path)(params)
+
+    store, runner = _runner(tmp_path, synthesize)
+    item = {**ITEMS[0], 'format': 'wav', 'speed_mode': 'provider', 'incremental': True}
+    store.create_job(None, [item])
+    while runner.run_once():
+        pass
+    assert seen == [item]
+
+
+def test_jobs_run_through_the_synthesis_pipeline(client, mocker, tmp_path):
+    mocker.patch.object(app_module, 'synthesis_cache', SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db')))
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(object))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': False})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    mocker.patch.object(app_module, 'stream_provider', side_effect=lambda service, voice, speed, text, fmt='mp3': iter([text.encode()]))
+    store, runner = _runner(tmp_path, lambda params: app_module.synthesize_cached(params)[0])
+    mocker.patch.object(app_module, 'job_store', store)
+    mocker.patch.object(app_module, 'job_runner', runner)
+
+    job_id = client.post('/jobs', json={'items': ITEMS}).get_json()['job_id']
+    # Rows queued before params were stored still synthesize, as MP3
+    legacy_id = store.create_job(None, ITEMS[:1])
+    store.get_db_connection().execute('UPDATE job_items SET params = NULL WHERE job_id = ?', (legacy_id,))
+    while runner.run_once():
+        pass
+
+    assert store.get_job(job_id)['status'] == 'completed'
+    assert store.get_job(legacy_id)['status'] == 'completed'
+    with zipfile.ZipFile(runner.archive_path(job_id)) as zf:
+        assert zf.read('0002-tryk-2-for-support.mp3') == b'Tryk 2 for support'
+
+
+def test_jobs_refund_cached_and_failed_items(client, mocker, tmp_path):
+    quota = CharacterQuota(tmp_path / 'quota.db')
+    mocker.patch.object(app_module, 'character_quota', quota)
+    mocker.patch.object(app_module, 'synthesis_cache', SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db')))
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(object))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': True,
+                                   'IP_QUOTA_CHARACTERS': 100, 'IP_QUOTA_CHARACTERS_PER_HOUR': 1})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+
+    def stream_provider(service, voice, speed, text, fmt='mp3'):
+        if text == 'Fejl':
+            raise RuntimeError('provider down')
+        return iter([text.encode()])
+
+    mocker.patch.object(app_module, 'stream_provider', side_effect=stream_provider)
+    store = JobStore(tmp_path / 'jobs.db', max_attempts=1)
+    runner = JobRunner(store, tmp_path / 'jobs', lambda params: app_module.synthesize_cached(params)[0],
+                       meter=app_module.meter_provider_characters, refund=app_module.refund_job_item)
+    mocker.patch.object(app_module, 'job_store', store)
+    mocker.patch.object(app_module, 'job_runner', runner)
+
+    # The repeated item is a cache hit and the last one fails
+    failing = {**ITEMS[0], 'text': 'Fejl'}
+    response = client.post('/jobs', json={'items': [ITEMS[0], ITEMS[0], failing]})
+    assert response.headers['X-Quota-Remaining'] == str(100 - 2 * len(ITEMS[0]['text']) - len('Fejl'))
+    job_id = response.get_json()['job_id']
+    while runner.run_once():
+        pass
+
+    assert store.get_job(job_id)['status'] == 'completed_with_errors'
+    balance = quota.refund([Bucket('ip:127.0.0.1', 100, 1 / 3600)], 0)
+    assert balance.remaining == 100 - len(ITEMS[0]['text'])
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import app as app_module
+from app import app
+from audio_janitor import AudioIndex
+from http_client import ProcessLocal
+from synthesis_cache import SynthesisCache
+from tests.test_mp3 import frame, id3
+
+
+def test_long_text_is_synthesized_in_parallel_chunks(mocker):
+    mocker.patch.dict(app.config, {'LONG_TEXT_CHUNK_CHARS': 30})
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def fake_provider(service, voice, speed, text):
+        with lock:
+            active.append(text)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(text)
+        index = int(text.split()[1])
+        yield id3() + frame(index)
+
+    mocker.patch.object(app_module, 'stream_provider', side_effect=fake_provider)
+    text = ' '.join(f'Chunk {i} has some words.' for i in range(6))
+
+    audio = b''.join(app_module.stream_synthesis('openai', 'alloy', 1.0, text))
+
+    assert audio == b''.join(frame(i) for i in range(6))
+    assert max(peak) > 1
+
+
+def test_short_text_is_a_single_provider_call(mocker):
+    provider = mocker.patch.object(app_module, 'stream_provider', return_value=iter([b'abc']))
+    assert b''.join(app_module.stream_synthesis('openai', 'alloy', 1.0, 'Hej')) == b'abc'
+    provider.assert_called_once_with('openai', 'alloy', 1.0, 'Hej', 'mp3')
+
+
+def test_incremental_regeneration_only_synthesizes_changed_sentences(client, mocker, tmp_path):
+    mocker.patch.object(app_module, 'synthesis_cache', SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db')))
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(object))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': False})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    sent = []
+
+    def fake_provider(service, voice, speed, text, fmt='mp3'):
+        sent.append(text)
+        yield id3() + frame(len(text))
+
+    mocker.patch.object(app_module, 'stream_provider', side_effect=fake_provider)
+    sentences = ['Velkommen til.', 'Tryk 1 for salg.', 'Tryk 2 for suport.', 'Tak for nu.']
+    payload = {'text': ' '.join(sentences), 'voice': 'alloy', 'service': 'openai', 'speed': 1.0, 'incremental': True}
+
+    first = client.post('/generate-speech', json=payload).get_json()
+    assert first['incremental'] == {'sentences': 4, 'reused': 0, 'synthesized': 4}
+    assert sorted(sent) == sorted(sentences)
+
+    sent.clear()
+    sentences[2] = 'Tryk 2 for support.'
+    edited = client.post('/generate-speech', json={**payload, 'text': ' '.join(sentences)}).get_json()
+    assert edited['incremental'] == {'sentences': 4, 'reused': 3, 'synthesized': 1}
+    assert sent == ['Tryk 2 for support.']
+    assert (tmp_path / edited['filename']).read_bytes() == b''.join(frame(len(text)) for text in sentences)
+
+    streamed = client.post('/generate-speech/stream', json={**payload, 'text': ' '.join(sentences[:2])})
+    assert streamed.headers['X-Sentences-Reused'] == '2' and streamed.headers['X-Sentences-Synthesized'] == '0'
+    assert streamed.get_data() == frame(len(sentences[0])) + frame(len(sentences[1]))
+    assert sent == ['Tryk 2 for support.']
+    assert client.post('/generate-speech', json={**payload, 'incremental': 'yes'}).status_code == 400
@@ -0,0 +1,58 @@
+import httpx
+from prometheus_client import REGISTRY
+
+import app as app_module
+from app import app
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_provider_calls_are_measured(client, mocker, tmp_path):
+    http = httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=b'ID3' + b'\xff' * 99)))
+    mocker.patch.object(app_module.http_pool, 'get', return_value=http)
+    mocker.patch.object(app_module, 'AZURE_SPEECH_KEY', 'key')
+    mocker.patch.object(app_module, 'AZURE_SPEECH_REGION', 'swedencentral')
+    labels = {'service': 'speech', 'voice': 'da-DK-JeppeNeural'}
+    calls = sample('tts_provider_request_seconds_count', **labels)
+    characters = sample('tts_characters_synthesized_total', service='speech')
+    received = sample('tts_audio_bytes_synthesized_total', service='speech')
+
+    app_module.synthesize_to_file('speech', 'da-DK-JeppeNeural', 1.0, 'Hej', tmp_path / 'out.mp3')
+
+    assert sample('tts_provider_request_seconds_count', **labels) == calls + 1
+    assert sample('tts_provider_first_byte_seconds_count', **labels) >= 1
+    assert sample('tts_characters_synthesized_total', service='speech') == characters + 3
+    assert sample('tts_audio_bytes_synthesized_total', service='speech') == received + 102
+
+
+def test_failed_provider_calls_are_counted(mocker, tmp_path):
+    http = httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(400, text='bad voice')))
+    mocker.patch.object(app_module.http_pool, 'get', return_value=http)
+    mocker.patch.object(app_module, 'AZURE_SPEECH_KEY', 'key')
+    mocker.patch.object(app_module, 'AZURE_SPEECH_REGION', 'swedencentral')
+    failures = sample('tts_provider_failures_total', service='speech')
+
+    try:
+        app_module.synthesize_to_file('speech', 'da-DK-JeppeNeural', 1.0, 'Hej', tmp_path / 'out.mp3')
+    except app_module.SynthesisError:
+        pass
+
+    assert sample('tts_provider_failures_total', service='speech') == failures + 1
+
+
+def test_metrics_endpoint_exposes_audio_dir_size(client, mocker):
+    mocker.patch.dict(app.config, {'METRICS_TOKEN': None})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert 'tts_audio_dir_bytes' in body
+    assert 'tts_auth_db_query_seconds' in body
+
+
+def test_metrics_token_is_required_when_set(client, mocker):
+    mocker.patch.dict(app.config, {'METRICS_TOKEN': 's3cret'})
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
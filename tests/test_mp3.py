@@ -0,0 +1,43 @@
+from mp3 import audio_frames, join_segments, parse_frame_header, silence
+
+# MPEG-2 Layer III, 32 kbit/s, 24 kHz, mono: 96-byte frames of 576 samples
+HEADER = bytes([0xFF, 0xF3, 0x44, 0xC0])
+
+
+def frame(fill=0):
+    return HEADER + bytes([fill]) * 92
+
+
+def xing_frame():
+    body = bytearray(92)
+    body[9:13] = b'Xing'  # after 9 bytes of MPEG-2 mono side info
+    return HEADER + bytes(body)
+
+
+def id3(payload=b'tagdata'):
+    size = len(payload)
+    return b'ID3\x04\x00\x00' + bytes([0, 0, (size >> 7) & 0x7F, size & 0x7F]) + payload
+
+
+def test_parse_frame_header():
+    header = parse_frame_header(frame())
+    assert header.sample_rate == 24000 and header.bitrate == 32000
+    assert header.channels == 1 and header.length == 96 and header.samples == 576
+    assert parse_frame_header(b'ID3\x04') is None
+
+
+def test_audio_frames_strips_tags_and_info_frame():
+    data = id3() + xing_frame() + frame(1) + frame(2) + b'TAG' + bytes(125)
+    assert audio_frames(data) == frame(1) + frame(2)
+
+
+def test_join_segments_concatenates_frames_in_order():
+    segments = [id3() + frame(1), id3() + xing_frame() + frame(2), frame(3)]
+    assert b''.join(join_segments(segments)) == frame(1) + frame(2) + frame(3)
+
+
+def test_silence_matches_the_neighbouring_format():
+    assert silence(1.0) == frame() * 42  # 42 frames of 24 ms
+    mpeg1_stereo = parse_frame_header(bytes([0xFF, 0xFB, 0x90, 0x00]))
+    header = parse_frame_header(silence(0.5, mpeg1_stereo))
+    assert (header.version, header.sample_rate, header.channels) == (3, 44100, 2)
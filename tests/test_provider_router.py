@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+import app as app_module
+from provider_router import Backend, ProviderError, ProviderRouter, retry_after_from_headers
+
+
+def router_for(*names, **kwargs):
+    kwargs.setdefault('backoff_base', 0.001)
+    return ProviderRouter({'speech': [Backend('speech', name) for name in names]}, **kwargs)
+
+
+def test_circuit_opens_after_consecutive_failures_and_probes_once():
+    router = router_for('a', max_consecutive_failures=2, open_seconds=0.05, max_attempts=1)
+    calls = []
+
+    def failing(backend):
+        calls.append(backend.name)
+        raise ProviderError('boom', 500)
+
+    for _ in range(2):
+        with pytest.raises(ProviderError):
+            router.call('speech', 10, failing)
+    with pytest.raises(ProviderError) as excinfo:
+        router.call('speech', 10, failing)
+    assert excinfo.value.status_code == 503
+    assert calls == ['a', 'a']
+
+    time.sleep(0.06)
+    assert router.call('speech', 10, lambda backend: 'ok') == 'ok'
+    assert router.stats()['backends']['speech:a']['circuit'] == 'closed'
+
+
+def test_throttled_call_moves_to_another_backend():
+    router = router_for('a', 'b')
+
+    def attempt(backend):
+        if backend.name == 'a':
+            raise ProviderError('throttled', 429, retry_after=30)
+        return backend.name
+
+    assert router.call('speech', 10, attempt) == 'b'
+    assert router.retries == 1
+
+
+def test_retry_on_same_backend_honors_retry_after(mocker):
+    sleep = mocker.patch('provider_router.time.sleep')
+    router = router_for('a')
+    outcomes = [ProviderError('throttled', 429, retry_after=2), 'ok']
+
+    def attempt(backend):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert router.call('speech', 10, attempt) == 'ok'
+    assert sleep.call_args[0][0] >= 2
+
+
+def test_retry_after_beyond_backoff_limit_is_not_waited_for(mocker):
+    sleep = mocker.patch('provider_router.time.sleep')
+    router = router_for('a', backoff_max=1)
+
+    def attempt(backend):
+        raise ProviderError('throttled', 429, retry_after=60)
+
+    with pytest.raises(ProviderError, match='throttled'):
+        router.call('speech', 10, attempt)
+    sleep.assert_not_called()
+
+
+def test_client_errors_are_not_retried_or_counted():
+    router = router_for('a', 'b')
+    calls = []
+
+    def attempt(backend):
+        calls.append(backend.name)
+        raise ProviderError('bad voice', 400, retryable=False)
+
+    with pytest.raises(ProviderError):
+        router.call('speech', 10, attempt)
+    assert calls == ['a']
+    assert router.stats()['backends']['speech:a']['error_rate'] == 0
+
+
+def _warm(router, backend, latency, samples=20):
+    for _ in range(samples):
+        router.record_success(backend, latency)
+
+
+def test_slow_short_request_is_hedged_and_loser_discarded():
+    router = router_for('a', 'b', hedge_min_samples=5)
+    slow, fast = router.backends['speech']
+    _warm(router, slow, 0.01)
+    _warm(router, fast, 0.02)
+    discarded = []
+    done = threading.Event()
+
+    def attempt(backend):
+        if backend is slow:
+            time.sleep(0.3)
+        return backend.name
+
+    def discard(result):
+        discarded.append(result)
+        done.set()
+
+    assert router.call('speech', 20, attempt, discard) == 'b'
+    assert done.wait(1)
+    assert discarded == ['a']
+    assert router.hedges == 1 and router.hedge_wins == 1
+
+
+def test_long_texts_are_not_hedged():
+    router = router_for('a', 'b', hedge_min_samples=5, hedge_max_chars=100)
+    _warm(router, router.backends['speech'][0], 0.001)
+
+    def attempt(backend):
+        time.sleep(0.05)
+        return backend.name
+
+    assert router.call('speech', 500, attempt) == 'a'
+    assert router.hedges == 0
+
+
+def test_async_hedge_cancels_the_slow_leg():
+    router = router_for('a', 'b', hedge_min_samples=5)
+    slow, fast = router.backends['speech']
+    _warm(router, slow, 0.01)
+    cancelled = []
+
+    async def attempt(backend):
+        if backend is slow:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(backend.name)
+                raise
+        return backend.name
+
+    async def discard(result):
+        pass
+
+    assert asyncio.run(router.acall('speech', 20, attempt, discard)) == 'b'
+    assert cancelled == ['a']
+
+
+def test_retry_after_headers():
+    assert retry_after_from_headers({'retry-after-ms': '1500'}) == 1.5
+    assert retry_after_from_headers({'retry-after': '3'}) == 3
+    assert retry_after_from_headers({'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'}) is None
+
+
+def test_speech_fails_over_to_another_region(mocker, provider_router, tmp_path):
+    hosts = []
+
+    def handler(request):
+        hosts.append(request.url.host)
+        if request.url.host.startswith('swedencentral'):
+            return httpx.Response(503, text='unavailable')
+        assert request.headers['Ocp-Apim-Subscription-Key'] == 'north-key'
+        return httpx.Response(200, content=b'ID3audio')
+
+    mocker.patch.object(app_module.http_pool, 'get', return_value=httpx.Client(transport=httpx.MockTransport(handler)))
+    mocker.patch.object(app_module, 'AZURE_SPEECH_KEY', 'key')
+    mocker.patch.object(app_module, 'AZURE_SPEECH_REGION', 'swedencentral')
+    provider_router.backends['speech'] = [
+        Backend('speech', 'swedencentral'),
+        Backend('speech', 'northeurope', {'region': 'northeurope', 'key': 'north-key'}),
+    ]
+
+    target = tmp_path / 'out.mp3'
+    app_module.synthesize_to_file('speech', 'da-DK-JeppeNeural', 1.0, 'Hej', target)
+    assert target.read_bytes() == b'ID3audio'
+    assert hosts == ['swedencentral.tts.speech.microsoft.com', 'northeurope.tts.speech.microsoft.com']
+
+
+def test_extra_deployments_must_run_the_cached_model(monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'AZURE_OPENAI_MODEL', 'tts-hd')
+    monkeypatch.setenv('AZURE_OPENAI_EXTRA_DEPLOYMENTS',
+                       'https://north.openai.azure.com,key,tts-hd;https://west.openai.azure.com,key,west-tts,tts-hd')
+    assert [backend.name for backend in app_module.build_provider_backends()['openai']] == [
+        'primary', 'north.openai.azure.com/tts-hd', 'west.openai.azure.com/west-tts']
+
+    monkeypatch.setenv('AZURE_OPENAI_EXTRA_DEPLOYMENTS', 'https://north.openai.azure.com,key,tts')
+    with pytest.raises(ValueError, match='runs tts, but'):
+        app_module.build_provider_backends()
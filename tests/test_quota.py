@@ -0,0 +1,147 @@
+from unittest.mock import MagicMock
+
+import app as app_module
+from app import app
+from audio_janitor import AudioIndex
+from http_client import ProcessLocal
+from quota import Bucket, CharacterQuota
+from synthesis_cache import SynthesisCache
+
+
+def test_bucket_refills_over_time(tmp_path):
+    quota = CharacterQuota(tmp_path / 'quota.db')
+    bucket = Bucket('user:1', 100, 10)
+
+    assert quota.consume([bucket], 80, now=0).remaining == 20
+    denied = quota.consume([bucket], 50, now=1)
+    assert not denied.allowed
+    assert denied.remaining == 30
+    assert denied.retry_after == 2
+    assert quota.consume([bucket], 50, now=3).allowed
+
+
+def test_all_buckets_are_charged_or_none(tmp_path):
+    quota = CharacterQuota(tmp_path / 'quota.db')
+    user, ip = Bucket('user:1', 100, 1), Bucket('ip:10.0.0.1', 30, 1)
+
+    assert not quota.consume([user, ip], 50, now=0).allowed
+    result = quota.consume([user, ip], 20, now=0)
+    assert result.allowed and result.limit == 30 and result.remaining == 10
+    assert quota.consume([user], 80, now=0).allowed
+    assert quota.consume([user, ip], 200, now=0).retry_after == -1
+
+
+def test_quota_is_shared_between_connections(tmp_path):
+    first = CharacterQuota(tmp_path / 'quota.db')
+    second = CharacterQuota(tmp_path / 'quota.db')
+    bucket = Bucket('ip:10.0.0.1', 100, 0.001)
+
+    first.consume([bucket], 60, now=0)
+    assert not second.consume([bucket], 60, now=0).allowed
+
+
+def test_generate_speech_reports_and_enforces_budget(client, mocker, tmp_path):
+    mocker.patch.object(app_module, 'character_quota', CharacterQuota(tmp_path / 'quota.db'))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': True,
+                                   'IP_QUOTA_CHARACTERS': 15, 'IP_QUOTA_CHARACTERS_PER_HOUR': 3600})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(MagicMock))
+
+    def fake_synthesize(params):
+        app_module.count_provider_characters(len(params['text']))
+        return tmp_path / 'abc.mp3', False
+
+    mocker.patch.object(app_module, 'synthesize_cached', side_effect=fake_synthesize)
+    payload = {'text': 'Hej med dig', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0}
+
+    ok = client.post('/generate-speech', json=payload)
+    assert ok.status_code == 200
+    assert ok.headers['X-Quota-Limit'] == '15'
+    assert ok.headers['X-Quota-Remaining'] == '4'
+
+    denied = client.post('/generate-speech', json=payload)
+    assert denied.status_code == 429
+    assert int(denied.headers['Retry-After']) in (7, 8)
+
+
+def test_failed_synthesis_is_refunded(client, mocker, tmp_path):
+    mocker.patch.object(app_module, 'character_quota', CharacterQuota(tmp_path / 'quota.db'))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': True,
+                                   'IP_QUOTA_CHARACTERS': 15, 'IP_QUOTA_CHARACTERS_PER_HOUR': 1})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(MagicMock))
+    mocker.patch.object(app_module, 'synthesize_cached',
+                        MagicMock(side_effect=app_module.SynthesisError('provider down', 502)))
+    payload = {'text': 'Hej med dig', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0}
+
+    for _ in range(3):
+        assert client.post('/generate-speech', json=payload).status_code == 502
+
+
+def test_cached_and_aborted_syntheses_are_refunded(client, mocker, tmp_path):
+    mocker.patch.object(app_module, 'character_quota', CharacterQuota(tmp_path / 'quota.db'))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': True,
+                                   'IP_QUOTA_CHARACTERS': 25, 'IP_QUOTA_CHARACTERS_PER_HOUR': 1})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(MagicMock))
+    mocker.patch.object(app_module, 'synthesis_cache', SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db')))
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+
+    def failing_provider(service, voice, speed, text, fmt='mp3'):
+        yield b'ID3'
+        raise app_module.SynthesisError('provider dropped the stream', 502)
+
+    mocker.patch.object(app_module, 'stream_provider', side_effect=failing_provider)
+    payload = {'text': 'Hej med dig', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0}
+    for _ in range(3):
+        assert client.post('/generate-speech/stream', json=payload).data == b'ID3'
+
+    # Only the first synthesis is charged; the replays are cache hits
+    mocker.patch.object(app_module, 'stream_provider', side_effect=lambda *args: iter([b'ID3audio']))
+    assert client.post('/generate-speech', json=payload).headers['X-Quota-Remaining'] == '14'
+    for _ in range(3):
+        synthesized = client.post('/generate-speech', json=payload)
+        streamed = client.post('/generate-speech/stream', json=payload)
+        assert synthesized.status_code == streamed.status_code == 200
+        assert synthesized.headers['X-Quota-Remaining'] == streamed.headers['X-Quota-Remaining'] == '14'
+
+
+def test_local_speed_variants_are_not_charged(client, mocker, tmp_path):
+    mocker.patch.object(app_module, 'character_quota', CharacterQuota(tmp_path / 'quota.db'))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': True, 'SPEED_VARIANT_MODE': 'local',
+                                   'IP_QUOTA_CHARACTERS': 25, 'IP_QUOTA_CHARACTERS_PER_HOUR': 1})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(MagicMock))
+    mocker.patch.object(app_module, 'synthesis_cache', SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db')))
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.object(app_module, 'stream_provider', side_effect=lambda *args: iter([b'ID3audio']))
+    mocker.patch.object(app_module.transcoder, 'filter_pcm',
+                        side_effect=lambda source, target, fmt, apply: target.write_bytes(b'stretched'))
+    payload = {'text': 'Hej med dig', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0}
+
+    assert client.post('/generate-speech', json=payload).headers['X-Quota-Remaining'] == '14'
+    for speed in (1.25, 1.5):
+        variant = client.post('/generate-speech', json={**payload, 'speed': speed})
+        assert variant.status_code == 200
+        assert variant.headers['X-Quota-Remaining'] == '14'
+
+
+def test_incremental_edits_are_charged_for_changed_sentences(client, mocker, tmp_path):
+    mocker.patch.object(app_module, 'character_quota', CharacterQuota(tmp_path / 'quota.db'))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': True,
+                                   'IP_QUOTA_CHARACTERS': 200, 'IP_QUOTA_CHARACTERS_PER_HOUR': 1})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(MagicMock))
+    mocker.patch.object(app_module, 'synthesis_cache', SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db')))
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.object(app_module, 'stream_provider', side_effect=lambda *args: iter([b'ID3audio']))
+    sentences = ['Velkommen til.', 'Tryk 1 for salg.', 'Tryk 2 for suport.', 'Tak for nu.']
+    payload = {'text': ' '.join(sentences), 'voice': 'alloy', 'service': 'openai', 'speed': 1.0, 'incremental': True}
+
+    assert client.post('/generate-speech', json=payload).headers['X-Quota-Remaining'] == str(200 - 62)
+
+    # Only the corrected sentence and the spaces between sentences are charged
+    sentences[2] = 'Tryk 2 for support.'
+    edited = client.post('/generate-speech', json={**payload, 'text': ' '.join(sentences)})
+    assert edited.get_json()['incremental']['reused'] == 3
+    assert edited.headers['X-Quota-Remaining'] == str(200 - 62 - 22)
@@ -0,0 +1,85 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, SingleFlightTimeout
+
+
+def test_concurrent_duplicates_wait_for_leader(tmp_path):
+    flight = SingleFlight(tmp_path, timeout=5)
+    results = {}
+    calls = []
+
+    def worker(i):
+        with flight.lock('k') as waited:
+            if 'value' not in results:
+                calls.append(i)
+                time.sleep(0.05)
+                results['value'] = i
+            results[i] = waited
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert sum(results[i] for i in range(5)) == 4
+    assert flight.stats() == {'leaders': 1, 'waiters': 4, 'timeouts': 0}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_waiter_takes_over_when_leader_fails(tmp_path):
+    flight = SingleFlight(tmp_path, timeout=5)
+    with pytest.raises(RuntimeError):
+        with flight.lock('k'):
+            raise RuntimeError('provider down')
+    with flight.lock('k') as waited:
+        assert waited is False
+
+
+def test_waiter_times_out(tmp_path):
+    flight = SingleFlight(tmp_path, timeout=5, poll_interval=0.01)
+    held = threading.Event()
+    release = threading.Event()
+
+    def leader():
+        with flight.lock('k'):
+            held.set()
+            release.wait(2)
+
+    t = threading.Thread(target=leader)
+    t.start()
+    held.wait(2)
+    with pytest.raises(SingleFlightTimeout):
+        with flight.lock('k', timeout=0.05):
+            pass
+    release.set()
+    t.join()
+    assert flight.stats()['timeouts'] == 1
+
+
+def _hold_lock(lock_dir, ready, release):
+    with SingleFlight(lock_dir).lock('k'):
+        ready.set()
+        release.wait(5)
+
+
+def test_lock_is_shared_across_processes(tmp_path):
+    ctx = multiprocessing.get_context('fork')
+    ready, release = ctx.Event(), ctx.Event()
+    proc = ctx.Process(target=_hold_lock, args=(tmp_path, ready, release))
+    proc.start()
+    try:
+        assert ready.wait(5)
+        with pytest.raises(SingleFlightTimeout):
+            with SingleFlight(tmp_path, poll_interval=0.01).lock('k', timeout=0.05):
+                pass
+    finally:
+        release.set()
+        proc.join(5)
+    with SingleFlight(tmp_path).lock('k', timeout=1) as waited:
+        assert waited is False
@@ -0,0 +1,69 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+import app as app_module
+from http_client import ProcessLocal
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def test_import_loads_no_provider_sdk_and_starts_no_threads(tmp_path):
+    probe = ("import sys, threading, app; "
+             "print(sorted(m for m in ('openai', 'msal') if m in sys.modules), "
+             "sorted(t.name for t in threading.enumerate() if t.name != 'MainThread'))")
+    result = subprocess.run([sys.executable, '-c', probe], cwd=tmp_path, capture_output=True, text=True, check=True,
+                            env={**os.environ, 'PYTHONPATH': REPO_DIR, 'AZURE_OPENAI_API_KEY': 'key',
+                                 'AZURE_OPENAI_ENDPOINT': 'https://example.openai.azure.com'})
+    assert result.stdout.strip() == '[] []'
+
+
+def test_process_local_is_rebuilt_after_fork(mocker):
+    value = ProcessLocal(object)
+    assert value.get() is value.get()
+    first = value.get()
+    mocker.patch('os.getpid', return_value=os.getpid() + 1)
+    assert value.get() is not first
+
+
+def test_background_services_start_once_per_process(mocker):
+    services = [mocker.patch.object(app_module, name) for name in ('audio_janitor', 'job_runner', 'voice_catalog')]
+    mocker.patch.object(app_module, 'openai_client', None)
+    mocker.patch.object(app_module, '_background_pid', None)
+    app_module.start_background_services()
+    app_module.start_background_services()
+    assert all(service.start.call_count == 1 for service in services)
+
+    mocker.patch('os.getpid', return_value=os.getpid() + 1)
+    app_module.start_background_services()
+    assert all(service.start.call_count == 2 for service in services)
+
+
+def test_gunicorn_preload_boots_on_an_empty_data_dir(tmp_path):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    env = {key: value for key, value in os.environ.items() if key != 'PROMETHEUS_MULTIPROC_DIR'}
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_DIR, 'gunicorn.conf.py'), '--pythonpath', REPO_DIR,
+         '--bind', f'127.0.0.1:{port}', '--workers', '1', '--preload', 'wsgi:app'],
+        cwd=tmp_path, env={**env, 'FLASK_ENV': 'production'}, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            assert server.poll() is None, server.stdout.read().decode(errors='replace')
+            assert time.monotonic() < deadline, 'gunicorn did not answer within 30s'
+            try:
+                response = httpx.get(f'http://127.0.0.1:{port}/metrics', timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        assert response.status_code == 200
+        assert (tmp_path / 'data' / 'metrics').is_dir()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
@@ -0,0 +1,62 @@
+from unittest.mock import MagicMock
+
+import app as app_module
+from app import app
+from audio_janitor import AudioIndex
+from http_client import ProcessLocal
+from synthesis_cache import SynthesisCache
+
+
+def _setup(mocker, tmp_path, chunks):
+    cache = SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db'))
+    mocker.patch.object(app_module, 'synthesis_cache', cache)
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    fake_client = MagicMock()
+    create = fake_client.audio.speech.with_streaming_response.create
+    create.return_value.__enter__.return_value.iter_bytes.return_value = chunks
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(lambda: fake_client))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    return cache, create
+
+
+PAYLOAD = {'text': 'Hej med dig', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0}
+
+
+def test_stream_pipes_audio_and_stores_file(client, mocker, tmp_path):
+    cache, create = _setup(mocker, tmp_path, [b'ID3', b'frame1', b'frame2'])
+
+    response = client.post('/generate-speech/stream', json=PAYLOAD)
+    assert response.status_code == 200
+    assert response.mimetype == 'audio/mpeg'
+    assert response.data == b'ID3frame1frame2'
+
+    filename = response.headers['X-Audio-Filename']
+    assert (tmp_path / filename).read_bytes() == b'ID3frame1frame2'
+
+    # The streamed file is now a cache entry for the JSON endpoint as well
+    data = client.post('/generate-speech', json=PAYLOAD).get_json()
+    assert data['filename'] == filename and data['cached'] is True
+    assert create.call_count == 1
+
+    # Replays are delivered like /audio files
+    replay = client.post('/generate-speech/stream', json=PAYLOAD)
+    assert replay.data == b'ID3frame1frame2'
+    assert replay.headers['Accept-Ranges'] == 'bytes'
+    assert 'immutable' in replay.headers['Cache-Control']
+    assert create.call_count == 1
+
+
+def test_stream_validation_error_is_json(client, mocker, tmp_path):
+    _setup(mocker, tmp_path, [])
+    response = client.post('/generate-speech/stream', json={**PAYLOAD, 'text': ''})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'No text provided'
+
+
+def test_stream_rejects_formats_other_than_mp3(client, mocker, tmp_path):
+    _, create = _setup(mocker, tmp_path, [b'ID3'])
+    response = client.post('/generate-speech/stream', json={**PAYLOAD, 'format': 'opus'})
+    assert response.status_code == 400
+    assert 'only available as MP3' in response.get_json()['error']
+    assert create.call_count == 0
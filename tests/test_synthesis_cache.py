@@ -0,0 +1,54 @@
+import os
+from unittest.mock import MagicMock
+
+import app as app_module
+from app import app
+from audio_janitor import AudioIndex
+from http_client import ProcessLocal
+from synthesis_cache import SynthesisCache, normalize_text, synthesis_key
+
+
+def _write(path, size):
+    path.write_bytes(b'\0' * size)
+    return path
+
+
+def test_key_ignores_whitespace_noise():
+    a = synthesis_key('openai', 'alloy', 1.0, 'tts-hd', 'Hello   world\r\n')
+    b = synthesis_key('openai', 'alloy', 1, 'tts-hd', ' Hello world')
+    assert a == b
+    assert a != synthesis_key('openai', 'alloy', 1.25, 'tts-hd', 'Hello world')
+    assert normalize_text('a\t b\r\nc ') == 'a b\nc'
+
+
+def test_hit_miss_counters(tmp_path):
+    cache = SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db'))
+    key = 'a' * 64
+    assert cache.get(key) is None
+    cache.put(key, _write(cache.temp_path(key), 10))
+    assert cache.get(key) == tmp_path / f'{key}.mp3'
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1 and stats['bytes'] == 10
+
+
+def test_generate_speech_serves_repeat_from_cache(client, mocker, tmp_path):
+    audio_dir = tmp_path / 'audio'
+    audio_dir.mkdir()
+    cache = SynthesisCache(audio_dir, AudioIndex(tmp_path / 'index.db'))
+    mocker.patch.object(app_module, 'synthesis_cache', cache)
+    mocker.patch.object(app_module, 'AUDIO_DIR', audio_dir)
+    fake_client = MagicMock()
+    create = fake_client.audio.speech.with_streaming_response.create
+    create.return_value.__enter__.return_value.iter_bytes.return_value = [b'ID3', b'audio']
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(lambda: fake_client))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+
+    payload = {'text': 'Velkommen', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0}
+    first = client.post('/generate-speech', json=payload).get_json()
+    second = client.post('/generate-speech', json=payload).get_json()
+
+    assert first['filename'] == second['filename']
+    assert second['cached'] is True
+    assert create.call_count == 1
+    assert os.listdir(audio_dir) == [first['filename']]
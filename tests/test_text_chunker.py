@@ -0,0 +1,31 @@
+from text_chunker import sentence_segments, split_sentences, split_text
+
+
+def test_split_sentences_keeps_punctuation():
+    text = 'Hej. Hvordan går det? Godt!\n\nNyt afsnit: her.'
+    assert split_sentences(text) == ['Hej.', 'Hvordan går det?', 'Godt!', 'Nyt afsnit:', 'her.']
+
+
+def test_chunks_respect_limit_and_sentence_boundaries():
+    sentences = [f'Sentence number {i} is here.' for i in range(40)]
+    text = ' '.join(sentences)
+    chunks = split_text(text, 120)
+    assert all(len(c) <= 120 for c in chunks)
+    assert ' '.join(chunks) == text
+    assert all(c.endswith('.') for c in chunks)
+
+
+def test_oversized_sentence_is_split_at_clauses_then_words():
+    text = 'alpha beta, ' * 30 + 'x' * 50
+    chunks = split_text(text, 40)
+    assert all(len(c) <= 40 for c in chunks)
+    assert ''.join(chunks).replace(' ', '') == text.replace(' ', '')
+
+
+def test_short_paragraphs_share_a_chunk():
+    assert split_text('One.\n\nTwo.', 100) == ['One.\n\nTwo.']
+
+
+def test_sentence_segments_are_never_packed_together():
+    assert sentence_segments('Hej. Hvordan går det?\n\nGodt!', 100) == ['Hej.', 'Hvordan går det?', 'Godt!']
+    assert all(len(segment) <= 20 for segment in sentence_segments('alpha beta, ' * 10, 20))
@@ -0,0 +1,90 @@
+import numpy as np
+
+import app as app_module
+from app import app
+from audio_janitor import AudioIndex
+from http_client import ProcessLocal
+from synthesis_cache import SynthesisCache
+from time_stretch import stretch_pcm, wsola
+
+SAMPLE_RATE = 24000
+
+
+def dominant_frequency(samples):
+    spectrum = np.abs(np.fft.rfft(samples))
+    return np.fft.rfftfreq(len(samples), 1 / SAMPLE_RATE)[np.argmax(spectrum)]
+
+
+def test_wsola_changes_duration_but_not_pitch():
+    t = np.arange(2 * SAMPLE_RATE) / SAMPLE_RATE
+    tone = 0.5 * np.sin(2 * np.pi * 220 * t)
+    for speed in (0.75, 1.25, 1.5):
+        stretched = wsola(tone, speed)
+        assert len(stretched) == int(len(tone) / speed)
+        assert abs(dominant_frequency(stretched) - 220) < 2
+        # No gaps or doubled amplitude where frames overlap
+        middle = stretched[SAMPLE_RATE // 10:-SAMPLE_RATE // 10]
+        assert abs(np.sqrt(np.mean(middle ** 2)) - np.sqrt(np.mean(tone ** 2))) < 0.02
+
+
+def test_stretch_pcm_round_trips_16_bit_samples():
+    pcm = (np.sin(np.arange(4800) / 10) * 20000).astype('<i2').tobytes()
+    assert stretch_pcm(pcm, 1.0) == pcm
+    assert len(stretch_pcm(pcm, 2.0)) == 2400 * 2
+
+
+def test_speed_variants_are_derived_from_the_cached_rendering(client, mocker, tmp_path):
+    mocker.patch.object(app_module, 'synthesis_cache', SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db')))
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(object))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': False,
+                                   'SPEED_VARIANT_MODE': 'local'})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    speeds = []
+
+    def fake_provider(service, voice, speed, text, fmt='mp3'):
+        speeds.append(speed)
+        yield b'audio'
+
+    mocker.patch.object(app_module, 'stream_provider', side_effect=fake_provider)
+    stretched = []
+
+    def fake_filter(source, target, fmt, apply):
+        stretched.append(source.name)
+        target.write_bytes(b'stretched')
+
+    mocker.patch.object(app_module.transcoder, 'filter_pcm', side_effect=fake_filter)
+    payload = {'text': 'Hej med dig', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0}
+
+    original = client.post('/generate-speech', json=payload).get_json()['filename']
+    variant = client.post('/generate-speech', json={**payload, 'speed': 1.25}).get_json()
+    assert variant['filename'] == original.replace('.mp3', '-125.mp3')
+    assert stretched == [original]
+    assert speeds == [1.0]
+    assert client.post('/generate-speech', json={**payload, 'speed': 1.25}).get_json()['cached'] is True
+
+    provider = client.post('/generate-speech', json={**payload, 'speed': 1.25, 'speed_mode': 'provider'}).get_json()
+    assert provider['filename'] != variant['filename'] and speeds == [1.0, 1.25]
+    assert client.post('/generate-speech', json={**payload, 'speed_mode': 'fast'}).status_code == 400
+
+
+def test_stream_route_serves_local_speed_variants(client, mocker, tmp_path):
+    mocker.patch.object(app_module, 'synthesis_cache', SynthesisCache(tmp_path, AudioIndex(tmp_path / 'index.db')))
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(object))
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'QUOTA_ENABLED': False,
+                                   'SPEED_VARIANT_MODE': 'local'})
+    mocker.patch.object(app_module.limiter, 'enabled', False)
+    provider = mocker.patch.object(app_module, 'stream_provider', side_effect=lambda *args: iter([b'ID3audio']))
+    mocker.patch.object(app_module.transcoder, 'filter_pcm',
+                        side_effect=lambda source, target, fmt, apply: target.write_bytes(b'stretched'))
+    payload = {'text': 'Hej med dig', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0}
+
+    original = client.post('/generate-speech/stream', json=payload)
+    assert original.data == b'ID3audio'
+    for speed in (1.25, 1.5):
+        variant = client.post('/generate-speech/stream', json={**payload, 'speed': speed})
+        assert variant.data == b'stretched'
+        assert variant.headers['X-Audio-Filename'] == original.headers['X-Audio-Filename'].replace(
+            '.mp3', f'-{round(speed * 100)}.mp3')
+    assert provider.call_count == 1
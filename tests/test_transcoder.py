@@ -0,0 +1,112 @@
+import sys
+
+import pytest
+
+import app as app_module
+import transcoder as transcoder_module
+from transcoder import Transcoder, TranscodeError, TranscoderBusy
+
+
+def _fake_ffmpeg(mocker, script):
+    mocker.patch.object(transcoder_module, 'ffmpeg_command',
+                        lambda source, target, fmt: [sys.executable, '-c', script, str(source), target])
+
+
+COPY = ("import sys; out = sys.stdout.buffer if sys.argv[2] == 'pipe:1' else open(sys.argv[2], 'wb'); "
+        "out.write(b'OUT:' + open(sys.argv[1], 'rb').read())")
+
+
+def test_stream_writes_target_atomically(mocker, tmp_path):
+    _fake_ffmpeg(mocker, COPY)
+    source = tmp_path / 'a.mp3'
+    source.write_bytes(b'x' * 200000)
+    target = tmp_path / 'a.ogg'
+    pool = Transcoder(tmp_path / 'locks', chunk_size=4096)
+
+    chunks = pool.stream(source, target, 'opus')
+    first = next(chunks)
+    assert not target.exists()
+    data = first + b''.join(chunks)
+
+    assert data == b'OUT:' + b'x' * 200000
+    assert target.read_bytes() == data
+    assert pool.stats()['completed'] == 1
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == '.part'] == []
+
+
+def test_formats_with_rewritten_headers_are_converted_to_a_file(mocker, tmp_path):
+    _fake_ffmpeg(mocker, COPY)
+    command = transcoder_module.ffmpeg_command
+    targets = []
+    mocker.patch.object(transcoder_module, 'ffmpeg_command',
+                        lambda source, target, fmt: targets.append(target) or command(source, target, fmt))
+    source = tmp_path / 'a.mp3'
+    source.write_bytes(b'x' * 200000)
+    pool = Transcoder(tmp_path / 'locks', chunk_size=4096)
+
+    for fmt, target in (('wav', tmp_path / 'a.wav'), ('flac', tmp_path / 'a.flac'), ('webm', tmp_path / 'a.webm')):
+        assert b''.join(pool.stream(source, target, fmt)) == b'OUT:' + b'x' * 200000
+        assert target.read_bytes() == b'OUT:' + b'x' * 200000
+
+    assert 'pipe:1' not in targets
+    assert pool.stats()['completed'] == 3
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == '.part'] == []
+
+
+def test_failed_conversion_leaves_no_file(mocker, tmp_path):
+    _fake_ffmpeg(mocker, "import sys; sys.stdout.write('partial'); sys.exit(1)")
+    source = tmp_path / 'a.mp3'
+    source.write_bytes(b'x')
+    pool = Transcoder(tmp_path / 'locks')
+
+    with pytest.raises(TranscodeError):
+        pool.transcode(source, tmp_path / 'a.flac', 'flac')
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['a.mp3', 'locks']
+    assert pool.stats()['failed'] == 1
+
+
+def test_slots_are_capped(tmp_path):
+    pool = Transcoder(tmp_path / 'locks', max_concurrent=1, queue_timeout=0.1)
+    with pool.slot():
+        with pytest.raises(TranscoderBusy):
+            with pool.slot():
+                pass
+    assert pool.stats()['rejected'] == 1
+    with pool.slot():
+        pass
+
+
+def test_download_streams_and_caches_variant(client, mocker, tmp_path):
+    _fake_ffmpeg(mocker, COPY)
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.object(app_module, 'transcoder', Transcoder(tmp_path / 'locks'))
+    mocker.patch.dict(app_module.app.config, {'REQUIRE_AUTHENTICATION': False})
+    register = mocker.patch.object(app_module, 'register_audio_file')
+    (tmp_path / 'abc.mp3').write_bytes(b'ID3')
+
+    response = client.get('/download/abc.mp3?format=flac')
+    assert response.status_code == 200
+    assert response.mimetype == 'audio/flac'
+    assert response.data == b'OUT:ID3'
+    assert (tmp_path / 'abc.flac').read_bytes() == b'OUT:ID3'
+    register.assert_called_once_with(tmp_path / 'abc.flac')
+
+    # The second download is served from disk without converting again
+    mocker.patch.object(app_module.transcoder, 'stream', side_effect=AssertionError)
+    assert client.get('/download/abc.mp3?format=flac').data == b'OUT:ID3'
+
+
+def test_filter_pcm_decodes_filters_and_encodes(mocker, tmp_path):
+    mocker.patch.object(transcoder_module, 'ffmpeg_decode_command',
+                        lambda source: [sys.executable, '-c', COPY, str(source), 'pipe:1'])
+    mocker.patch.object(transcoder_module, 'ffmpeg_encode_command', lambda target, fmt: [
+        sys.executable, '-c', "import sys; open(sys.argv[1], 'wb').write(sys.stdin.buffer.read())", target])
+    source = tmp_path / 'a.mp3'
+    source.write_bytes(b'pcm')
+    target = tmp_path / 'a-150.mp3'
+    pool = Transcoder(tmp_path / 'locks')
+
+    pool.filter_pcm(source, target, 'mp3', lambda pcm: pcm.upper())
+
+    assert target.read_bytes() == b'OUT:PCM'
+    assert pool.stats()['completed'] == 1
@@ -0,0 +1,58 @@
+import json
+
+import httpx
+
+import app as app_module
+from app import app
+from voice_catalog import VoiceCatalog, azure_voices
+
+AZURE_VOICES = [
+    {'ShortName': 'en-GB-SoniaNeural', 'DisplayName': 'Sonia', 'Gender': 'Female', 'Locale': 'en-GB'},
+    {'ShortName': 'da-DK-JeppeNeural', 'DisplayName': 'Jeppe', 'Gender': 'Male', 'Locale': 'da-DK'},
+    {'ShortName': 'da-DK-ChristelNeural', 'DisplayName': 'Christel', 'Gender': 'Female', 'Locale': 'da-DK'},
+    {'ShortName': 'de-DE-KatjaNeural', 'DisplayName': 'Katja', 'Gender': 'Female', 'Locale': 'de-DE'},
+]
+FALLBACK = {'speech': [{'name': 'da-DK-JeppeNeural', 'displayName': 'Jeppe', 'language': 'da-DK'}],
+            'openai': [{'name': 'alloy', 'displayName': 'Alloy', 'language': 'en-US'}]}
+
+
+def test_azure_voices_are_sorted_and_limited_to_locales():
+    voices = azure_voices(AZURE_VOICES, ['da', 'en-GB'])
+    assert [voice['name'] for voice in voices] == ['da-DK-ChristelNeural', 'da-DK-JeppeNeural', 'en-GB-SoniaNeural']
+    assert voices[0] == {'name': 'da-DK-ChristelNeural', 'displayName': 'Christel (da-DK Female)', 'language': 'da-DK'}
+
+
+def test_language_index_and_fallback():
+    def unreachable():
+        raise httpx.ConnectError('down')
+
+    catalog = VoiceCatalog(FALLBACK, {'speech': unreachable})
+    assert not catalog.refresh()
+    assert catalog.stats()['speech']['source'] == 'config'
+    assert json.loads(catalog.get('speech').body)['voices'] == FALLBACK['speech']
+
+    catalog.fetchers['speech'] = lambda: azure_voices(AZURE_VOICES)
+    assert catalog.refresh()
+    full = json.loads(catalog.get('speech').body)
+    assert full['languages'] == ['da-DK', 'de-DE', 'en-GB']
+    assert catalog.get('speech', 'da').body == catalog.get('speech', 'DA-dk').body
+    assert len(json.loads(catalog.get('speech', 'da').body)['voices']) == 2
+    assert json.loads(catalog.get('speech', 'fr').body) == {'voices': []}
+
+
+def test_get_voices_is_cacheable(client, mocker):
+    catalog = VoiceCatalog(FALLBACK, {'speech': lambda: azure_voices(AZURE_VOICES)})
+    catalog.refresh()
+    mocker.patch.object(app_module, 'voice_catalog', catalog)
+    mocker.patch.dict(app.config, {'REQUIRE_AUTHENTICATION': False, 'VOICE_CATALOG_CACHE_SECONDS': 600})
+
+    response = client.get('/get-voices?service=speech&language=da')
+    assert [voice['name'] for voice in response.get_json()['voices']] == ['da-DK-ChristelNeural', 'da-DK-JeppeNeural']
+    assert response.headers['Cache-Control'] == 'private, max-age=600'
+    etag = response.headers['ETag']
+    assert not etag.startswith('W/')
+
+    revalidated = client.get('/get-voices?service=speech&language=da', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert client.get('/get-voices?service=speech', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get('/get-voices').get_json()['voices'] == FALLBACK['openai']
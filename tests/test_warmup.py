@@ -0,0 +1,49 @@
+import time
+
+import app as app_module
+from app import app
+from audio_janitor import AudioIndex, AudioJanitor
+from http_client import ProcessLocal
+from synthesis_cache import SynthesisCache
+from warmup import read_catalog, warm
+
+
+def test_catalog_is_read_from_csv_and_jsonl(tmp_path):
+    csv_file = tmp_path / 'phrases.csv'
+    csv_file.write_text('text,voice,service,speed,startup\n'
+                        'Velkommen,da-DK-ChristelNeural,speech,1.0,true\n'
+                        '"Tryk 1, for salg",alloy,openai,1.25,\n', encoding='utf-8')
+    jsonl_file = tmp_path / 'phrases.jsonl'
+    jsonl_file.write_text('{"text": "Velkommen", "voice": "alloy", "service": "openai", "startup": true}\n\n'
+                          '{"text": "Farvel", "voice": "alloy", "service": "openai", "speed": 0.9}\n',
+                          encoding='utf-8')
+
+    rows = read_catalog(csv_file)
+    assert [(row['text'], row['speed'], row['startup'], row['line']) for row in rows] == \
+        [('Velkommen', 1.0, True, 2), ('Tryk 1, for salg', 1.25, False, 3)]
+    rows = read_catalog(jsonl_file)
+    assert [(row['text'], row['speed'], row['startup'], row['line']) for row in rows] == \
+        [('Velkommen', 1.0, True, 1), ('Farvel', 0.9, False, 3)]
+
+
+def test_warm_up_renders_pins_and_resumes(mocker, tmp_path):
+    index = AudioIndex(tmp_path / 'index.db')
+    mocker.patch.object(app_module, 'synthesis_cache', SynthesisCache(tmp_path, index))
+    mocker.patch.object(app_module, 'audio_index', index)
+    mocker.patch.object(app_module, 'AUDIO_DIR', tmp_path)
+    mocker.patch.object(app_module, 'openai_client', ProcessLocal(object))
+    mocker.patch.dict(app.config, {'SYNTHESIS_CACHE_ENABLED': True})
+    provider = mocker.patch.object(app_module, 'stream_provider', side_effect=lambda *args, **kwargs: iter([b'ID3']))
+    entries = [{'text': f'Tryk {i}', 'voice': 'alloy', 'service': 'openai', 'speed': 1.0, 'line': i}
+               for i in range(1, 6)]
+    entries.append({'text': 'Ugyldig', 'voice': 'alloy', 'service': 'fax', 'speed': 1.0, 'line': 6})
+
+    assert warm(entries[:2], app_module.warm_phrase, concurrency=2) == {'synthesized': 2, 'skipped': 0, 'failed': 0}
+    # An interrupted run picks up where it stopped
+    assert warm(entries, app_module.warm_phrase, concurrency=3) == {'synthesized': 3, 'skipped': 2, 'failed': 1}
+    assert provider.call_count == 5
+
+    janitor = AudioJanitor(tmp_path, index, tmp_path / 'janitor.lock', max_age_seconds=0, max_bytes=0)
+    time.sleep(0.01)
+    assert janitor.run_once() == 0
+    assert index.summary()['files'] == 5
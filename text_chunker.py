@@ -0,0 +1,90 @@
+"""
+Split long texts into provider-sized chunks at paragraph and sentence boundaries.
+"""
+import re
+from typing import List
+
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_END = re.compile(r'(?<=[.!?…:;])["\'”’)\]]*\s+')
+CLAUSE_END = re.compile(r'(?<=[,–—])\s+')
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into paragraphs and then sentences, dropping empty pieces"""
+    sentences = []
+    for paragraph in PARAGRAPH_BREAK.split(text.strip()):
+        for sentence in SENTENCE_END.split(paragraph.strip()):
+            sentence = sentence.strip()
+            if sentence:
+                sentences.append(sentence)
+    return sentences
+
+
+def _split_oversized(sentence: str, max_chars: int) -> List[str]:
+    """Break a single sentence that exceeds max_chars at clauses, then words"""
+    pieces: List[str] = []
+    for part in CLAUSE_END.split(sentence):
+        if len(part) <= max_chars:
+            pieces.append(part)
+            continue
+        words = part.split()
+        current = ''
+        for word in words:
+            while len(word) > max_chars:
+                if current:
+                    pieces.append(current)
+                    current = ''
+                pieces.append(word[:max_chars])
+                word = word[max_chars:]
+            candidate = f"{current} {word}" if current else word
+            if len(candidate) > max_chars:
+                pieces.append(current)
+                current = word
+            else:
+                current = candidate
+        if current:
+            pieces.append(current)
+    return _pack(pieces, max_chars, ' ')
+
+
+def _pack(pieces: List[str], max_chars: int, separator: str) -> List[str]:
+    """Greedily join consecutive pieces while they fit in max_chars"""
+    chunks: List[str] = []
+    current = ''
+    for piece in pieces:
+        candidate = f"{current}{separator}{piece}" if current else piece
+        if current and len(candidate) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """Split text into chunks of at most max_chars, preferring paragraph and sentence boundaries"""
+    chunks: List[str] = []
+    for paragraph in PARAGRAPH_BREAK.split(text.strip()):
+        pieces: List[str] = []
+        for sentence in split_sentences(paragraph):
+            if len(sentence) > max_chars:
+                pieces.extend(_split_oversized(sentence, max_chars))
+            else:
+                pieces.append(sentence)
+        chunks.extend(_pack(pieces, max_chars, ' '))
+    # Let short neighbouring paragraphs share a chunk, keeping the paragraph break
+    return _pack(chunks, max_chars, '\n\n')
+
+
+def sentence_segments(text: str, max_chars: int) -> List[str]:
+    """Split text into sentences, breaking only those longer than max_chars.
+
+    Unlike split_text, sentences are never packed together, so editing one
+    sentence leaves every other segment, and its cached audio, unchanged.
+    """
+    segments: List[str] = []
+    for sentence in split_sentences(text):
+        segments.extend(_split_oversized(sentence, max_chars) if len(sentence) > max_chars else [sentence])
+    return segments
@@ -0,0 +1,202 @@
+"""
+Bounded ffmpeg transcoding shared by all gunicorn workers.
+
+For MP3 and Ogg Opus, ffmpeg writes the target format to stdout, and the output
+is streamed to the caller and written to a scratch file at the same time. The
+other formats need ffmpeg to seek back and fill in their headers, so it writes
+the scratch file itself and the finished file is streamed afterwards. Either
+way the scratch file is renamed into place only once ffmpeg has exited cleanly. The number of concurrent ffmpeg processes is capped across
+workers with a fixed set of flock()ed slot files.
+"""
+import logging
+import os
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import metrics
+from audio_formats import PIPE_FORMATS, ffmpeg_command, ffmpeg_decode_command, ffmpeg_encode_command
+
+try:
+    import fcntl
+except ImportError:  # Windows development hosts: cap conversions within the process only
+    fcntl = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class TranscodeError(Exception):
+    """Raised when ffmpeg is missing or fails to convert a file"""
+
+
+class TranscoderBusy(Exception):
+    """Raised when no transcoding slot frees up within the queue timeout"""
+
+
+class Transcoder:
+    """Runs at most max_concurrent ffmpeg processes across processes sharing slot_dir"""
+
+    def __init__(self, slot_dir: Path, max_concurrent: int = 2, queue_timeout: float = 30.0,
+                 chunk_size: int = 64 * 1024, poll_interval: float = 0.05):
+        self.slot_dir = slot_dir
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._local = threading.BoundedSemaphore(max_concurrent)
+        self._guard = threading.Lock()
+        try:
+            self.slot_dir.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            logger.warning("Unable to create lock directory %s: %s", self.slot_dir, e)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one of the shared transcoding slots"""
+        deadline = time.monotonic() + self.queue_timeout
+        if not self._local.acquire(timeout=self.queue_timeout):
+            self._reject()
+        try:
+            fd = self._acquire_file(deadline)
+            try:
+                with self._guard:
+                    self.running += 1
+                try:
+                    yield
+                finally:
+                    with self._guard:
+                        self.running -= 1
+            finally:
+                if fd is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    os.close(fd)
+        finally:
+            self._local.release()
+
+    def stream(self, source: Path, target: Path, fmt: str) -> Iterator[bytes]:
+        """Yield source converted to fmt while writing it atomically to target"""
+        if fmt not in PIPE_FORMATS:
+            self._convert(source, target, fmt)
+            with open(target, 'rb') as audio_file:
+                yield from iter(lambda: audio_file.read(self.chunk_size), b'')
+            return
+        with self.slot():
+            tmp_path = target.parent / f".{target.name}.{uuid.uuid4().hex}.part"
+            start = time.perf_counter()
+            try:
+                process = subprocess.Popen(ffmpeg_command(source, 'pipe:1', fmt),
+                                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            except FileNotFoundError:
+                self._count('failed')
+                raise TranscodeError(f"Failed to convert to {fmt.upper()}")
+            completed = False
+            try:
+                with open(tmp_path, 'wb') as out:
+                    for chunk in iter(lambda: process.stdout.read(self.chunk_size), b''):
+                        out.write(chunk)
+                        yield chunk
+                if process.wait() != 0:
+                    raise TranscodeError(f"Failed to convert to {fmt.upper()}")
+                os.replace(tmp_path, target)
+                completed = True
+                metrics.TRANSCODE_SECONDS.labels(fmt).observe(time.perf_counter() - start)
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
+                if tmp_path.exists():
+                    tmp_path.unlink()
+                self._count('completed' if completed else 'failed')
+
+    def transcode(self, source: Path, target: Path, fmt: str) -> None:
+        """Convert source to fmt at target, blocking until it is in place"""
+        if fmt not in PIPE_FORMATS:
+            self._convert(source, target, fmt)
+            return
+        for _ in self.stream(source, target, fmt):
+            pass
+
+    def _convert(self, source: Path, target: Path, fmt: str) -> None:
+        """Have ffmpeg write source as fmt to a scratch file, which is renamed to target once complete"""
+        with self.slot():
+            tmp_path = target.parent / f".{target.name}.{uuid.uuid4().hex}.part"
+            start = time.perf_counter()
+            completed = False
+            try:
+                self._run(ffmpeg_command(source, str(tmp_path), fmt), fmt)
+                os.replace(tmp_path, target)
+                completed = True
+                metrics.TRANSCODE_SECONDS.labels(fmt).observe(time.perf_counter() - start)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+                self._count('completed' if completed else 'failed')
+
+    def filter_pcm(self, source: Path, target: Path, fmt: str, apply: Callable[[bytes], bytes]) -> None:
+        """Decode source to 16-bit mono PCM, pass it through apply and encode the result to fmt at target.
+
+        The slot is held throughout, so CPU-heavy filters are capped like conversions.
+        """
+        with self.slot():
+            tmp_path = target.parent / f".{target.name}.{uuid.uuid4().hex}.part"
+            start = time.perf_counter()
+            completed = False
+            try:
+                pcm = self._run(ffmpeg_decode_command(source), fmt)
+                self._run(ffmpeg_encode_command(str(tmp_path), fmt), fmt, apply(pcm))
+                os.replace(tmp_path, target)
+                completed = True
+                metrics.TRANSCODE_SECONDS.labels(fmt).observe(time.perf_counter() - start)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+                self._count('completed' if completed else 'failed')
+
+    @staticmethod
+    def _run(command: List[str], fmt: str, stdin: Optional[bytes] = None) -> bytes:
+        try:
+            result = subprocess.run(command, input=stdin, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            raise TranscodeError(f"Failed to convert to {fmt.upper()}")
+        if result.returncode != 0:
+            raise TranscodeError(f"Failed to convert to {fmt.upper()}")
+        return result.stdout
+
+    def stats(self) -> Dict[str, int]:
+        """Return conversion counters for this process"""
+        with self._guard:
+            return {'running': self.running, 'completed': self.completed, 'failed': self.failed,
+                    'rejected': self.rejected, 'max_concurrent': self.max_concurrent}
+
+    def _count(self, counter: str) -> None:
+        with self._guard:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _reject(self) -> None:
+        self._count('rejected')
+        raise TranscoderBusy("All transcoding slots are busy")
+
+    def _acquire_file(self, deadline: float) -> Optional[int]:
+        if fcntl is None:
+            return None
+        while True:
+            for i in range(self.max_concurrent):
+                fd = os.open(self.slot_dir / f"transcode-{i}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    os.close(fd)
+            if time.monotonic() >= deadline:
+                self._reject()
+            time.sleep(self.poll_interval)
@@ -0,0 +1,124 @@
+"""
+Voice catalog served by /get-voices.
+
+Voices are fetched from the provider (Azure Speech's voices/list) by a background
+thread and kept in memory as ready-to-send JSON bodies with strong ETags: one for
+the whole list and one per language, so a ?language= lookup is a dict access.
+Until the first fetch succeeds, and whenever the provider can't be reached, the
+lists configured in SPEECH_SERVICE_VOICES / OPENAI_VOICES are served instead.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CatalogEntry = namedtuple('CatalogEntry', 'body etag')
+
+Voice = Dict[str, str]
+
+
+def serialize(payload: Dict[str, Any]) -> CatalogEntry:
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return CatalogEntry(body, hashlib.sha256(body).hexdigest()[:32])
+
+
+def azure_voices(items: Iterable[Dict[str, Any]], locales: Optional[Iterable[str]] = None) -> List[Voice]:
+    """Convert an Azure Speech voices/list response to catalog voices, optionally limited to locales"""
+    wanted = {locale.lower() for locale in locales} if locales else None
+    voices = []
+    for item in items:
+        locale = item.get('Locale', '')
+        if wanted and locale.lower() not in wanted and locale.split('-')[0].lower() not in wanted:
+            continue
+        details = ' '.join(filter(None, [locale, item.get('Gender')]))
+        voices.append({
+            'name': item['ShortName'],
+            'displayName': f"{item.get('DisplayName', item['ShortName'])} ({details})",
+            'language': locale,
+        })
+    # Sorted so every worker serializes the same body and computes the same ETag
+    return sorted(voices, key=lambda voice: (voice['language'], voice['name']))
+
+
+class VoiceSnapshot:
+    """One service's voices, pre-serialized for the full list and for each language"""
+
+    EMPTY = serialize({'voices': []})
+
+    def __init__(self, voices: List[Voice], source: str):
+        self.source = source
+        self.count = len(voices)
+        self.fetched_at = time.time()
+        by_language: Dict[str, List[Voice]] = {}
+        for voice in voices:
+            locale = voice.get('language', '')
+            # Both 'da-DK' and 'da' find Danish voices
+            keys = {locale.lower(), locale.split('-')[0].lower()}
+            for key in keys - {''}:
+                by_language.setdefault(key, []).append(voice)
+        languages = sorted({voice.get('language', '') for voice in voices} - {''})
+        self.entries: Dict[Optional[str], CatalogEntry] = {None: serialize({'voices': voices, 'languages': languages})}
+        for key, matches in by_language.items():
+            self.entries[key] = serialize({'voices': matches})
+
+    def get(self, language: Optional[str] = None) -> CatalogEntry:
+        return self.entries.get(language.lower() if language else None, self.EMPTY)
+
+
+class VoiceCatalog:
+    """Voices per service, refreshed from the providers on a background thread"""
+
+    def __init__(self, fallback: Dict[str, List[Voice]], fetchers: Dict[str, Callable[[], Optional[List[Voice]]]],
+                 refresh_interval: float = 21600.0, retry_interval: float = 300.0):
+        self.fetchers = fetchers
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        # Replaced wholesale, so readers never see a half-built snapshot
+        self._snapshots = {service: VoiceSnapshot(voices, 'config') for service, voices in fallback.items()}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def get(self, service: str, language: Optional[str] = None) -> CatalogEntry:
+        """Return the serialized voices of a service, optionally for one language"""
+        return self._snapshots[service].get(language)
+
+    def refresh(self) -> bool:
+        """Fetch every provider's voices; returns False if any fetch failed"""
+        ok = True
+        for service, fetch in self.fetchers.items():
+            try:
+                voices = fetch()
+            except Exception as e:
+                logger.warning(f"⚠️  Could not refresh {service} voices, keeping {self._snapshots[service].source} list: {e}")
+                ok = False
+                continue
+            if voices:
+                self._snapshots[service] = VoiceSnapshot(voices, 'provider')
+                logger.info(f"🗣️  Loaded {len(voices)} {service} voices from the provider")
+        return ok
+
+    def start(self) -> None:
+        """Start the refresh thread for this process"""
+        if not self.fetchers or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='voice-catalog', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            ok = self.refresh()
+            self._stop.wait(self.refresh_interval if ok else self.retry_interval)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {service: {'source': snapshot.source, 'voices': snapshot.count, 'fetched_at': snapshot.fetched_at}
+                for service, snapshot in self._snapshots.items()}
@@ -0,0 +1,142 @@
+"""
+Pre-render a phrase catalog into the audio store so first requests hit the cache.
+
+    python warmup.py phrases.csv --concurrency 4
+    python warmup.py phrases.jsonl --startup-only
+
+The catalog is a CSV file with a header row, or JSON Lines, with the fields
+text, voice, service and speed, plus optional format and startup. Phrases are
+rendered through the synthesis cache with at most --concurrency in flight, and
+every rendered file is pinned, so the audio janitor never evicts it. Phrases
+already in the cache are only pinned. An interrupted run therefore resumes
+where it stopped when started again.
+
+With WARMUP_CATALOG set, each deployment also warms the phrases marked
+startup=true in a background thread of one worker after startup.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows development hosts: every process warms its own startup phrases
+    fcntl = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def _entry(fields: Dict[str, Any], line: int) -> Dict[str, Any]:
+    """Normalize one catalog row; 'line' is kept for error messages"""
+    entry = {key: value for key, value in fields.items() if value not in (None, '')}
+    try:
+        entry['speed'] = float(entry.get('speed', 1.0))
+    except (TypeError, ValueError):
+        raise ValueError(f"line {line}: invalid speed {entry['speed']!r}")
+    startup = entry.get('startup', False)
+    entry['startup'] = startup if isinstance(startup, bool) else str(startup).strip().lower() in TRUE_VALUES
+    entry['line'] = line
+    return entry
+
+
+def read_catalog(path: Path) -> List[Dict[str, Any]]:
+    """Read a CSV (with a header row) or JSON Lines phrase catalog"""
+    with open(path, encoding='utf-8-sig', newline='') as catalog:
+        if path.suffix.lower() in ('.jsonl', '.ndjson'):
+            entries = []
+            for line, raw in enumerate(catalog, start=1):
+                if raw.strip():
+                    try:
+                        fields = json.loads(raw)
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"line {line}: {e}")
+                    if not isinstance(fields, dict):
+                        raise ValueError(f"line {line}: expected a JSON object")
+                    entries.append(_entry(fields, line))
+            return entries
+        # Line 1 is the header
+        return [_entry(row, line) for line, row in enumerate(csv.DictReader(catalog), start=2)]
+
+
+def warm(entries: List[Dict[str, Any]], render: Callable[[Dict[str, Any]], str], concurrency: int = 4,
+         progress: Optional[Callable[[int, int, Dict[str, int]], None]] = None) -> Dict[str, int]:
+    """Render entries with at most concurrency in flight; render returns 'synthesized' or 'skipped'"""
+    counts = {'synthesized': 0, 'skipped': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='warmup') as pool:
+        futures = {pool.submit(render, entry): entry for entry in entries}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                counts[future.result()] += 1
+            except Exception as e:
+                counts['failed'] += 1
+                logger.warning(f"⚠️  Could not warm line {futures[future].get('line')}: {e}")
+            if progress:
+                progress(done, len(entries), counts)
+    return counts
+
+
+@contextmanager
+def elected(lock_file: Path) -> Iterator[bool]:
+    """Yield True in the one process that holds lock_file, False in the others"""
+    if fcntl is None:
+        yield True
+        return
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Pre-render a phrase catalog into the TTS audio store')
+    parser.add_argument('catalog', type=Path, help='CSV or JSON Lines file of text, voice, service, speed')
+    parser.add_argument('--concurrency', type=int, default=4, help='phrases rendered at once')
+    parser.add_argument('--startup-only', action='store_true', help='only the phrases marked startup=true')
+    parser.add_argument('--no-pin', action='store_true', help='leave rendered files evictable by the janitor')
+    args = parser.parse_args()
+    try:
+        entries = read_catalog(args.catalog)
+    except (OSError, ValueError) as e:
+        parser.error(f"{args.catalog}: {e}")
+    if args.startup_only:
+        entries = [entry for entry in entries if entry['startup']]
+
+    # Imported after parsing so --help works without the app's configuration
+    import app as tts
+    if not tts.app.config['SYNTHESIS_CACHE_ENABLED']:
+        print("❌ SYNTHESIS_CACHE_ENABLED is off, so warmed audio would never be served", file=sys.stderr)
+        return 2
+
+    def report(done: int, total: int, counts: Dict[str, int]) -> None:
+        if done % 100 == 0 or done == total:
+            print(f"  {done}/{total}: {counts['synthesized']} synthesized, {counts['skipped']} already cached, "
+                  f"{counts['failed']} failed", flush=True)
+
+    print(f"▶ Warming {len(entries)} phrases from {args.catalog}, {args.concurrency} at a time", flush=True)
+    counts = warm(entries, partial(tts.warm_phrase, pin=not args.no_pin), args.concurrency, report)
+    print(f"{'❌' if counts['failed'] else '✅'} Done: {counts['synthesized']} synthesized, "
+          f"{counts['skipped']} already cached, {counts['failed']} failed")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())